@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Author, Book, Favorite
+from .models import Author, Book, Favorite, ImportJob
 
 
 # Register your models here.
@@ -12,6 +12,9 @@ class AuthorAdmin(admin.ModelAdmin):
 class BookAdmin(admin.ModelAdmin):
     list_display = ["title", "get_authors" ]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("authors")
+
     def get_authors(self, obj):
         authors_string = ""
         for author in obj.authors.all():
@@ -23,3 +26,9 @@ class BookAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ["user__username", "book__title"]
+    list_select_related = ["user", "book"]
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ["file_name", "status", "rows", "errors", "rows_per_second", "queued_at", "finished_at"]
+    list_filter = ["status"]
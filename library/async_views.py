@@ -0,0 +1,220 @@
+"""
+Native async (ASGI) implementations of the read endpoints.
+
+GET /books, /books/:id, /authors, /authors/:id and /favorites are served by
+coroutines using Django's async ORM; every other method (and the few GET
+variants listed in 'must_delegate') is handed to the regular DRF view, so
+the API behaves the same under WSGI and ASGI. The DRF viewsets are still
+used to build querysets and serializers, only the I/O is done here.
+
+Enabled with ASYNC_READ_VIEWS (set by project/asgi.py), see project/urls_async.py.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .cache import (CACHED_HEADERS, HITS_KEY, MISSES_KEY, aget_catalog_version, aincrement_stat,
+                    get_catalog_cache, response_cache_key)
+from .conditional import compute_etag, not_modified_response, set_validators
+from .executors import arecommend_books
+from .models import Favorite
+from .serializers import BookSerializer
+
+renderer = JSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code, content_type="application/json")
+
+
+def wrap_request(request):
+    """
+    DRF Request around the Django request, for query_params and for the
+    serializers/filters that expect one. Always rendered as JSON.
+    """
+    drf_request = Request(request, parsers=[], authenticators=[])
+    drf_request.accepted_renderer = renderer
+    drf_request.accepted_media_type = renderer.media_type
+    return drf_request
+
+
+def must_delegate(request):
+    """
+    Requests the async views don't implement: writes, the browsable API /
+    explicit formats and the batch '?ids=' variant of the book list.
+    """
+    return (
+        request.method != "GET"
+        or "format" in request.GET
+        or "ids" in request.GET
+        or "text/html" in request.headers.get("Accept", "")
+    )
+
+
+def build_view(viewset_class, drf_request, action, **kwargs):
+    """
+    Instantiate a DRF viewset outside of its dispatch() to reuse its queryset,
+    filter, serializer and pagination configuration.
+    """
+    view = viewset_class()
+    view.action_map = {"get": action}
+    view.action = action
+    view.request = drf_request
+    view.args = ()
+    view.kwargs = kwargs
+    view.format_kwarg = None
+    view.headers = {}
+    return view
+
+
+async def cached_response(request, drf_request, handler):
+    """
+    Async counterpart of CachedResponseMixin; shares its cache entries.
+    """
+    cache = get_catalog_cache()
+    key = response_cache_key(drf_request, await aget_catalog_version(cache))
+    entry = await cache.aget(key)
+
+    if entry is not None:
+        await aincrement_stat(cache, HITS_KEY)
+        headers = entry["headers"]
+        response = get_conditional_response(
+            request,
+            etag=headers.get("ETag"),
+            last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+        )
+        if response is None:
+            response = json_response(entry["data"], entry["status"])
+        for name, value in headers.items():
+            response[name] = value
+        response["X-Cache"] = "HIT"
+        return response
+
+    await aincrement_stat(cache, MISSES_KEY)
+    response, data = await handler()
+    if response.status_code == status.HTTP_200_OK:
+        await cache.aset(key, {
+            "data": data,
+            "status": response.status_code,
+            "headers": {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+        }, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    response["X-Cache"] = "MISS"
+    return response
+
+
+async def list_view(request, viewset_class):
+    drf_request = wrap_request(request)
+    view = build_view(viewset_class, drf_request, "list")
+    queryset = view.filter_queryset(view.get_queryset())
+
+    async def handler():
+        stats = await queryset.order_by().aaggregate(count=Count("pk"), last_modified=Max("updated_at"))
+        etag = compute_etag(drf_request, stats["count"], stats["last_modified"])
+        # ETag only, see ConditionalGetMixin
+        not_modified = not_modified_response(request, etag, None)
+        if not_modified is not None:
+            return not_modified, None
+
+        paginator = view.paginator
+        paginator.request = drf_request
+        paginator.limit = paginator.get_limit(drf_request)
+        paginator.offset = paginator.get_offset(drf_request)
+        paginator.count = await queryset.acount()
+        page = [obj async for obj in queryset[paginator.offset:paginator.offset + paginator.limit]]
+
+        data = paginator.get_paginated_response(view.get_serializer(page, many=True).data).data
+        return set_validators(json_response(data), etag, None), data
+
+    return await cached_response(request, drf_request, handler)
+
+
+async def detail_view(request, viewset_class, pk):
+    drf_request = wrap_request(request)
+    view = build_view(viewset_class, drf_request, "retrieve", pk=pk)
+    queryset = view.filter_queryset(view.get_queryset()).filter(pk=pk)
+
+    async def handler():
+        last_modified = await queryset.order_by().values_list("updated_at", flat=True).afirst()
+        if last_modified is None:
+            model_name = queryset.model._meta.object_name
+            return json_response({"detail": f"No {model_name} matches the given query."},
+                                 status.HTTP_404_NOT_FOUND), None
+
+        etag = compute_etag(drf_request, pk, last_modified)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified, None
+
+        instance = await queryset.afirst()
+        data = view.get_serializer(instance).data
+        return set_validators(json_response(data), etag, last_modified), data
+
+    return await cached_response(request, drf_request, handler)
+
+
+async def authenticate(request):
+    """
+    JWT authentication with an async (cached) user lookup.
+    Returns (user, None) or (None, error response).
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None, json_response({"detail": "Authentication credentials were not provided."},
+                                   status.HTTP_401_UNAUTHORIZED)
+    try:
+        token = authentication.get_validated_token(raw_token)
+        return await authentication.aget_user(token), None
+    except AuthenticationFailed as e:
+        # InvalidToken included; same body as the DRF views
+        return None, json_response(e.detail, status.HTTP_401_UNAUTHORIZED)
+
+
+async def favorite_list(request):
+    user, error = await authenticate(request)
+    if error is not None:
+        return error
+
+    favorites = (
+        Favorite.objects.filter(user=user)
+        .select_related("book")
+        .prefetch_related("book__authors")
+    )
+    books = [favorite.book async for favorite in favorites]
+    return json_response(BookSerializer(books, many=True).data)
+
+
+async def favorite_recommendations(request):
+    user, error = await authenticate(request)
+    if error is not None:
+        return error
+
+    try:
+        top_n = int(request.GET.get("top_n", 5))
+    except ValueError:
+        return json_response({"error": "top_n must be an integer"}, status.HTTP_400_BAD_REQUEST)
+    return json_response({"recommendations": await arecommend_books(user, top_n=top_n)})
+
+
+def read_view(async_handler, sync_view):
+    """
+    Async view serving GETs with 'async_handler' and delegating everything
+    else to the DRF 'sync_view'.
+    """
+    async def view(request, *args, **kwargs):
+        if must_delegate(request):
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return await async_handler(request, *args, **kwargs)
+
+    # like DRF views: token authenticated API, no CSRF
+    view.csrf_exempt = True
+    return view
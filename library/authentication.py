@@ -1,6 +1,136 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Small in-process TTL cache of user id -> user row values.
+
+    Only the fields in settings.JWT_USER_CACHE_FIELDS are loaded (the rest
+    are deferred) and a fresh User instance is built for every hit, so
+    per-request state such as the permission cache is never shared between
+    requests. Entries are dropped on User save/delete (see signals); other
+    processes see the change at the latest after JWT_USER_CACHE_TIMEOUT
+    seconds, keep it short or set it to 0 to disable the cache.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return getattr(settings, "JWT_USER_CACHE_TIMEOUT", 0)
+
+    @property
+    def field_names(self):
+        fields = list(getattr(settings, "JWT_USER_CACHE_FIELDS", ()))
+        for required in (get_user_model()._meta.pk.attname, api_settings.USER_ID_FIELD, "is_active"):
+            if required not in fields:
+                fields.append(required)
+        if api_settings.CHECK_REVOKE_TOKEN and "password" not in fields:
+            fields.append("password")
+        # in model field order, as Model.from_db() expects the values
+        return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname in fields]
+
+    def get(self, user_id):
+        if not self.timeout:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires, db, field_names, values = entry
+        if expires < time.monotonic():
+            self.delete(user_id)
+            return None
+        return get_user_model().from_db(db, field_names, values)
+
+    def set(self, user_id, user):
+        if not self.timeout:
+            return
+        field_names = self.field_names
+        values = [getattr(user, name) for name in field_names]
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.timeout, user._state.db, field_names, values)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def queryset(self):
+        return get_user_model().objects.only(*self.field_names)
+
+
+user_cache = UserCache()
+
+
+def check_user(user, validated_token):
+    """
+    The checks JWTAuthentication.get_user() runs on the loaded user.
+    """
+    if not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+    return user
+
+
+def get_token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_("Token contained no recognizable user identification"))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through 'user_cache',
+    saving the user query on repeated requests from the same user.
+    """
+    def get_user(self, validated_token):
+        user_id = get_token_user_id(validated_token)
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = user_cache.queryset().get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        return check_user(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        """
+        Async version of get_user() for the async views.
+        """
+        user_id = get_token_user_id(validated_token)
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await user_cache.queryset().filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+            if user is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        return check_user(user, validated_token)
+
 
-class JWTAuthenticationForWriteActions(JWTAuthentication):
+class JWTAuthenticationForWriteActions(CachedJWTAuthentication):
     """
     Custom JWT authentication that only enforces authentication for
     write actions (POST, PUT, PATCH, DELETE), while allowing GET requests
@@ -12,4 +142,4 @@ class JWTAuthenticationForWriteActions(JWTAuthentication):
             return None  # Allow unauthenticated access for GET requests
 
         # For non-safe methods, use the default JWT authentication
-        return super().authenticate(request)
\ No newline at end of file
+        return super().authenticate(request)
@@ -0,0 +1,276 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .cache import bump_catalog_version
+from .changes import record_changes
+from .models import Author, Book, CatalogChange
+from .parsing import NATURAL_KEY_FIELDS, author_name_key, book_natural_key
+from .signals import touch_author_books, touch_books
+
+BookAuthor = Book.authors.through
+
+
+def resolve_author_ids(names):
+    """
+    Map author names to ids with one query on the unique Author.name_key,
+    bulk creating the missing ones; names differing only in case or
+    spacing map to the same author.
+    """
+    keys = {name: author_name_key(name) for name in dict.fromkeys(names)}
+    key_ids = dict(Author.objects.filter(name_key__in=set(keys.values())).values_list('name_key', 'id'))
+
+    # one new author per key, named as first seen
+    missing = {}
+    for name, key in keys.items():
+        if key not in key_ids:
+            missing.setdefault(key, name)
+    if missing:
+        # a concurrent import may have created some of them: skip those, then read the ids
+        Author.objects.bulk_create([Author(name=name) for name in missing.values()], ignore_conflicts=True)
+        created = dict(Author.objects.filter(name_key__in=missing).values_list('name_key', 'id'))
+        key_ids.update(created)
+        record_changes(Author, created.values(), CatalogChange.CREATE)
+    return {name: key_ids[key] for name, key in keys.items()}
+
+
+def unique_key_errors(model, field, keys, owners, message):
+    """
+    Bulk endpoint errors for items whose unique 'field' value is taken by
+    another object or an earlier item of the batch.
+
+    @Param keys: dict of item index -> value of 'field'
+    @Param owners: dict of item index -> id of the object the item updates
+    """
+    taken = dict(model.objects.filter(**{f'{field}__in': set(keys.values())}).values_list(field, 'id'))
+    errors = []
+    for index, key in keys.items():
+        # an updated object may keep its own key
+        owner = owners.get(index)
+        if key in taken and (owner is None or taken[key] != owner):
+            errors.append({'index': index, 'errors': {'non_field_errors': [message]}})
+        taken[key] = owner
+    return errors
+
+
+def check_author_names(items, existing=None):
+    """
+    Errors for items whose name is, once normalized (Author.name_key),
+    taken by another author or an earlier item.
+    """
+    keys = {index: author_name_key(item['name']) for index, item in enumerate(items) if 'name' in item}
+    owners = {index: item['id'] for index, item in enumerate(items)} if existing is not None else {}
+    errors = unique_key_errors(Author, 'name_key', keys, owners, 'An author with this name already exists.')
+    # the name is the field at fault
+    return [{'index': error['index'], 'errors': {'name': error['errors']['non_field_errors']}} for error in errors]
+
+
+def check_book_keys(items, existing=None):
+    """
+    Errors for items that would get the natural key (Book.natural_key) of
+    another book or an earlier item; updates keep the fields they omit.
+    """
+    keys = {}
+    for index, item in enumerate(items):
+        book = existing[item['id']] if existing is not None else None
+        keys[index] = book_natural_key({field: item[field] if field in item else getattr(book, field, '')
+                                        for field in NATURAL_KEY_FIELDS}, getattr(book, 'natural_key', None))
+    owners = {index: item['id'] for index, item in enumerate(items)} if existing is not None else {}
+    return unique_key_errors(Book, 'natural_key', keys, owners,
+                             'A book with this title, or this work and edition, already exists.')
+
+
+def merge_authors(duplicates):
+    """
+    Merge authors into others: the book links of each duplicate are
+    moved to its target with bulk queries, then the duplicates are deleted.
+
+    @Param duplicates: dict of duplicate author id -> id of the author to keep
+    @Return ids of the books whose authors changed
+    """
+    if not duplicates:
+        return set()
+    rows = list(BookAuthor.objects.filter(author_id__in=list(duplicates)).values_list('book_id', 'author_id'))
+    # books already linked to the target keep a single row
+    BookAuthor.objects.bulk_create([
+        BookAuthor(book_id=book_id, author_id=duplicates[author_id]) for book_id, author_id in rows
+    ], ignore_conflicts=True)
+    BookAuthor.objects.filter(author_id__in=list(duplicates)).delete()
+    book_ids = {book_id for book_id, _ in rows}
+    touch_books(pk__in=book_ids)
+    record_changes(Book, book_ids, CatalogChange.UPDATE)
+    # the post_delete signals log the deletes
+    Author.objects.filter(id__in=list(duplicates)).delete()
+    return book_ids
+
+
+def set_book_authors(book_authors):
+    """
+    Replace the authors of several books at once.
+
+    @Param book_authors: dict of book id -> list of author names
+    """
+    if not book_authors:
+        return
+    author_ids = resolve_author_ids(name for names in book_authors.values() for name in names)
+    BookAuthor.objects.filter(book_id__in=book_authors.keys()).delete()
+    BookAuthor.objects.bulk_create([
+        BookAuthor(book_id=book_id, author_id=author_id)
+        for book_id, names in book_authors.items()
+        # de-duplicate (names differing only in case are the same author), keep order
+        for author_id in dict.fromkeys(author_ids[name] for name in names)
+    ])
+
+
+def bulk_create_books(items):
+    books = Book.objects.bulk_create([
+        Book(**{field: value for field, value in item.items() if field != 'authors'})
+        for item in items
+    ])
+    set_book_authors({
+        book.id: item['authors'] for book, item in zip(books, items) if 'authors' in item
+    })
+    ids = [book.id for book in books]
+    record_changes(Book, ids, CatalogChange.CREATE)
+    return ids
+
+
+def bulk_update_books(items, existing):
+    now = timezone.now()
+    fields = {'updated_at', 'content_hash'}
+    book_authors = {}
+    for item in items:
+        book = existing[item['id']]
+        for field, value in item.items():
+            if field == 'authors':
+                book_authors[book.id] = value
+            elif field != 'id':
+                setattr(book, field, value)
+                fields.add(field)
+        book.updated_at = now
+        book.content_hash = ''
+
+    Book.objects.bulk_update(existing.values(), sorted(fields))
+    set_book_authors(book_authors)
+    record_changes(Book, existing, CatalogChange.UPDATE)
+    return list(existing)
+
+
+def bulk_create_authors(items):
+    ids = [author.id for author in Author.objects.bulk_create([Author(name=item['name']) for item in items])]
+    record_changes(Author, ids, CatalogChange.CREATE)
+    return ids
+
+
+def bulk_update_authors(items, existing):
+    now = timezone.now()
+    for item in items:
+        author = existing[item['id']]
+        if 'name' in item:
+            author.name = item['name']
+        author.updated_at = now
+
+    Author.objects.bulk_update(existing.values(), ['name', 'updated_at'])
+    # books nest their authors' names
+    touch_author_books(list(existing))
+    record_changes(Author, existing, CatalogChange.UPDATE)
+    return list(existing)
+
+
+class BulkWriteMixin:
+    """
+    ViewSet mixin adding bulk create/update/delete on '<prefix>/bulk':
+
+    * POST   [{...}, ...]             - create items
+    * PUT    [{"id": 1, ...}, ...]    - update items (all fields)
+    * PATCH  [{"id": 1, ...}, ...]    - update items (given fields only)
+    * DELETE {"ids": [1, 2, ...]}     - delete items
+
+    The whole batch is validated first and written in one transaction; if
+    any item is invalid nothing is written and the errors are reported per
+    item index.
+    """
+    bulk_item_serializer_class = None
+    bulk_max_items = 1000
+
+    def perform_bulk_create(self, items):
+        """
+        Write the validated 'items'; returns the ids of the created objects.
+        """
+        raise NotImplementedError(f"{type(self).__name__} must implement perform_bulk_create()")
+
+    def perform_bulk_update(self, items, existing):
+        """
+        Apply the validated 'items' to 'existing' (objects by id); returns
+        the ids of the updated objects.
+        """
+        raise NotImplementedError(f"{type(self).__name__} must implement perform_bulk_update()")
+
+    def validate_bulk_items(self, items, existing=None):
+        """
+        Checks needing the database (e.g. uniqueness), run in the write
+        transaction; 'existing' are the updated objects by id (None when
+        creating). Returns a list of {'index': .., 'errors': ..}.
+        """
+        return []
+
+    @action(detail=False, methods=["post", "put", "patch", "delete"], url_path="bulk")
+    def bulk(self, request):
+        if request.method == "DELETE":
+            return self.bulk_delete(request)
+
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of items'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.bulk_max_items:
+            return Response({'error': f'Cannot process more than {self.bulk_max_items} items at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        updating = request.method in ("PUT", "PATCH")
+        serializer = self.bulk_item_serializer_class(
+            data=items, many=True, partial=request.method == "PATCH",
+            context={**self.get_serializer_context(), 'updating': updating},
+        )
+        serializer.is_valid()
+        errors = [{'index': index, 'errors': item_errors}
+                  for index, item_errors in enumerate(serializer.errors) if item_errors]
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        items = serializer.validated_data
+        model = self.get_queryset().model
+        with transaction.atomic():
+            existing = None
+            if updating:
+                existing = model.objects.in_bulk([item['id'] for item in items])
+                errors = [{'index': index, 'errors': {'id': ['Not found.']}}
+                          for index, item in enumerate(items) if item['id'] not in existing]
+                if errors:
+                    return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+            errors = self.validate_bulk_items(items, existing)
+            if errors:
+                return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+            if updating:
+                ids = self.perform_bulk_update(items, existing)
+            else:
+                ids = self.perform_bulk_create(items)
+            bump_catalog_version()
+
+        if updating:
+            return Response({'updated': len(ids), 'ids': ids}, status=status.HTTP_200_OK)
+        return Response({'created': len(ids), 'ids': ids}, status=status.HTTP_201_CREATED)
+
+    def bulk_delete(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({'error': "Expected 'ids': a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.bulk_max_items:
+            return Response({'error': f'Cannot process more than {self.bulk_max_items} items at once'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.get_queryset().model
+        with transaction.atomic():
+            deleted = model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
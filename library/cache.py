@@ -0,0 +1,174 @@
+import hashlib
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "catalog:version"
+LAST_WRITE_KEY = "catalog:last_write"
+HITS_KEY = "catalog:stats:hits"
+MISSES_KEY = "catalog:stats:misses"
+
+# response headers stored with the cached data and replayed on hits
+CACHED_HEADERS = ("ETag", "Last-Modified")
+
+# set by catalog writes; ReplicaRoutingMiddleware resets it for each request
+# and only pins the clients whose request wrote to the catalog
+catalog_written = ContextVar("catalog_written", default=False)
+
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version(cache=None):
+    """
+    Current catalog version; part of every response cache key.
+
+    If the key is missing (first use, eviction, restart of a local cache) a
+    new time based version is used, so entries cached under an older
+    version can never be served again.
+    """
+    cache = cache or get_catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version(cache=None):
+    """
+    Async version of get_catalog_version().
+    """
+    cache = cache or get_catalog_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def _bump():
+    cache = get_catalog_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # key missing: starting a new version is enough to invalidate
+        get_catalog_version(cache)
+    cache.set(LAST_WRITE_KEY, time.time(), timeout=None)
+
+
+def catalog_written_since(seconds):
+    """
+    True if the catalog was written in the last 'seconds' (by any client).
+    """
+    return time.time() - get_catalog_cache().get(LAST_WRITE_KEY, 0) < seconds
+
+
+def bump_catalog_version():
+    """
+    Invalidate all cached catalog responses.
+
+    Bumped right away and again when the transaction commits, so a reader
+    racing with the write cannot cache pre-commit data under the new version.
+    """
+    catalog_written.set(True)
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def increment_stat(cache, key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+async def aincrement_stat(cache, key):
+    if not await cache.aadd(key, 1, timeout=None):
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    cache = get_catalog_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "backend": settings.CACHES[settings.CATALOG_CACHE_ALIAS]["BACKEND"],
+        "version": get_catalog_version(cache),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+def response_cache_key(request, version):
+    """
+    Key on catalog version, path, normalized (sorted) query string and the
+    negotiated renderer format.
+    """
+    query = sorted(request.query_params.lists())
+    renderer = getattr(request, "accepted_renderer", None)
+    raw = f"{request.path}|{query}|{getattr(renderer, 'format', '')}"
+    return f"catalog:response:{version}:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin caching anonymous list/retrieve responses in the catalog
+    cache. Writes to Book/Author bump the catalog version (see signals),
+    which invalidates every cached entry at once.
+
+    Cache hits replay the stored ETag/Last-Modified headers, so conditional
+    requests can be answered with a 304 without touching the database.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user and request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        cache = get_catalog_cache()
+        key = response_cache_key(request, get_catalog_version(cache))
+        entry = cache.get(key)
+
+        if entry is not None:
+            increment_stat(cache, HITS_KEY)
+            headers = entry["headers"]
+            response = get_conditional_response(
+                request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+            )
+            if response is None:
+                response = Response(entry["data"], status=entry["status"])
+            for name, value in headers.items():
+                response[name] = value
+            response["X-Cache"] = "HIT"
+            return response
+
+        increment_stat(cache, MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and isinstance(response, Response):
+            cache.set(key, {
+                "data": response.data,
+                "status": response.status_code,
+                "headers": {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+            }, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Author, Book, CatalogChange
+from .serializers import AuthorSerializer, BookSerializer
+
+CHANGE_MODEL_NAMES = {
+    Book: CatalogChange.BOOK,
+    Author: CatalogChange.AUTHOR,
+}
+
+# default / max number of change rows read per GET /books/changes request
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 5000
+
+
+def record_changes(model, object_ids, action):
+    """
+    Append change log rows for several objects with one insert.
+    Must be called inside the transaction that performs the change.
+    """
+    CatalogChange.objects.bulk_create([
+        CatalogChange(model=CHANGE_MODEL_NAMES[model], object_id=object_id, action=action)
+        for object_id in object_ids
+    ])
+
+
+def record_change(model, object_id, action):
+    record_changes(model, [object_id], action)
+
+
+def latest_change_token():
+    """
+    Token of the newest change; clients that bootstrap from a full export
+    continue syncing from here.
+    """
+    last_id = CatalogChange.objects.order_by('-id').values_list('id', flat=True).first()
+    return str(last_id or 0)
+
+
+def parse_change_token(token):
+    """
+    Tokens are the (stringified) id of the last change the client has seen.
+    Raises ValueError for malformed tokens.
+    """
+    value = int(token)
+    if value < 0:
+        raise ValueError(token)
+    return value
+
+
+def get_changes(since, limit=CHANGES_PAGE_SIZE, context=None):
+    """
+    Changes recorded after the 'since' token, collapsed to the latest action
+    per object. Objects that still exist are returned as 'upsert' with their
+    current representation, the others as 'delete'.
+
+    Paging by id assumes the ids become visible in order. SQLite has one
+    writer at a time, so they do; where concurrent transactions can commit
+    a lower id after a higher one (e.g. Postgres), set
+    CHANGES_SAFETY_LAG_SECONDS longer than the catalog write transactions:
+    changes younger than that are held back until they can't be overtaken.
+
+    @Return dict with 'changes', 'next_token' and 'has_more'
+    """
+    changes = CatalogChange.objects.filter(id__gt=since)
+    if settings.CHANGES_SAFETY_LAG_SECONDS:
+        changes = changes.filter(
+            created_at__lte=timezone.now() - timedelta(seconds=settings.CHANGES_SAFETY_LAG_SECONDS))
+    rows = list(
+        changes
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'action')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # last change per object wins; dict keeps the order of first appearance
+    latest = {}
+    for change_id, model, object_id, action in rows:
+        latest.pop((model, object_id), None)
+        latest[(model, object_id)] = action
+
+    ids = {CatalogChange.BOOK: set(), CatalogChange.AUTHOR: set()}
+    for (model, object_id), action in latest.items():
+        if action != CatalogChange.DELETE:
+            ids[model].add(object_id)
+
+    books = Book.objects.prefetch_related('authors').in_bulk(ids[CatalogChange.BOOK]) if ids[CatalogChange.BOOK] else {}
+    authors = Author.objects.in_bulk(ids[CatalogChange.AUTHOR]) if ids[CatalogChange.AUTHOR] else {}
+    objects = {CatalogChange.BOOK: (books, BookSerializer), CatalogChange.AUTHOR: (authors, AuthorSerializer)}
+
+    changes = []
+    for (model, object_id), action in latest.items():
+        instances, serializer_class = objects[model]
+        instance = instances.get(object_id)
+        if instance is None:
+            changes.append({'model': model, 'id': object_id, 'action': CatalogChange.DELETE})
+        else:
+            data = serializer_class(instance, context=context or {}).data
+            changes.append({'model': model, 'id': object_id, 'action': 'upsert', 'data': data})
+
+    return {
+        'changes': changes,
+        'next_token': str(rows[-1][0]) if rows else str(since),
+        'has_more': has_more,
+    }
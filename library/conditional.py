@@ -0,0 +1,92 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def compute_etag(request, *parts):
+    """
+    Build an ETag from the request path, the (sorted) query string, the
+    negotiated renderer and the given validator parts.
+    """
+    query = sorted(request.query_params.lists())
+    renderer = getattr(request, "accepted_renderer", None)
+    key = "|".join(str(part) for part in (
+        request.path, query, getattr(renderer, "format", ""), *parts
+    ))
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = quote_etag(etag)
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Return a 304 response if the request's If-None-Match / If-Modified-Since
+    headers match the validators, otherwise None.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin adding an ETag to list and retrieve, and Last-Modified
+    to retrieve.
+
+    Validators are computed with one aggregate query (row count and max
+    'updated_at' of the filtered queryset) or, for detail views, the
+    object's 'updated_at' - without serializing anything. Matching
+    If-None-Match / If-Modified-Since requests get a 304 straight away.
+
+    Lists have no Last-Modified: deleting a row doesn't move the max
+    'updated_at' back, only the count in the ETag sees it.
+    """
+    last_modified_field = "updated_at"
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stats = queryset.order_by().aggregate(count=Count("pk"), last_modified=Max(self.last_modified_field))
+
+        etag = compute_etag(request, stats["count"], stats["last_modified"])
+        not_modified = not_modified_response(request, etag, None)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, None)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: kwargs[lookup_url_kwarg]}
+        try:
+            last_modified = (
+                self.filter_queryset(self.get_queryset())
+                .filter(**lookup)
+                .order_by()
+                .values_list(self.last_modified_field, flat=True)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            # malformed lookup value, e.g. '/books/abc'
+            last_modified = None
+        if last_modified is None:
+            # missing object: let the regular path produce the 404
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = compute_etag(request, kwargs[lookup_url_kwarg], last_modified)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .recommendations import recommend_books
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_recommendation_executor():
+    """
+    Dedicated, bounded pool for recommendation work.
+
+    Under ASGI, sync code called through sync_to_async shares one thread by
+    default; running the CPU heavy recommender there would block every other
+    request's ORM calls. At most RECOMMENDATION_WORKERS recommendations run
+    at the same time, extra ones wait in the pool's queue without holding a
+    thread.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.RECOMMENDATION_WORKERS,
+                                           thread_name_prefix="recommendations")
+        return _executor
+
+
+def _recommend_in_worker(user, top_n):
+    # pool threads are long lived: drop stale/broken DB connections like a request would
+    close_old_connections()
+    try:
+        return recommend_books(user, top_n=top_n)
+    finally:
+        close_old_connections()
+
+
+async def arecommend_books(user, top_n=5):
+    """
+    Async wrapper running recommend_books() on the recommendation pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_recommendation_executor(), partial(_recommend_in_worker, user, top_n))
@@ -0,0 +1,107 @@
+import csv
+import json
+
+from .models import Book
+
+EXPORT_FIELDS = [
+    'id', 'title', 'authors', 'language', 'work_id', 'edition_information', 'publisher',
+    'num_pages', 'series_id', 'series_name', 'series_position', 'description', 'updated_at',
+]
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# rows fetched (and authors prefetched) per database round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# approximate size of each chunk written to the response
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def export_queryset(min_id=None, max_id=None):
+    """
+    Books ordered by id, optionally limited to an inclusive id range, so
+    consumers can split the catalog into slices and resume from the last id.
+    """
+    queryset = Book.objects.order_by('id').prefetch_related('authors')
+    if min_id is not None:
+        queryset = queryset.filter(id__gte=min_id)
+    if max_id is not None:
+        queryset = queryset.filter(id__lte=max_id)
+    return queryset
+
+
+def book_record(book):
+    return {
+        'id': book.id,
+        'title': book.title,
+        'authors': [author.name for author in book.authors.all()],
+        'language': book.language,
+        'work_id': book.work_id,
+        'edition_information': book.edition_information,
+        'publisher': book.publisher,
+        'num_pages': book.num_pages,
+        'series_id': book.series_id,
+        'series_name': book.series_name,
+        'series_position': book.series_position,
+        'description': book.description,
+        'updated_at': book.updated_at.isoformat(),
+    }
+
+
+def iter_records(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    # iterator() streams rows from the cursor and prefetches authors per chunk
+    for book in queryset.iterator(chunk_size=chunk_size):
+        yield book_record(book)
+
+
+class Echo:
+    """
+    File-like object whose write() just returns the value, so csv.writer
+    can be used to format rows for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def iter_csv(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for record in records:
+        record['authors'] = json.dumps(record['authors'], ensure_ascii=False)
+        yield writer.writerow([record[field] for field in EXPORT_FIELDS])
+
+
+def buffered(lines, size=EXPORT_BUFFER_SIZE):
+    """
+    Join small lines into ~'size' character chunks to avoid one write per row.
+    """
+    buffer = []
+    buffered_size = 0
+    for line in lines:
+        buffer.append(line)
+        buffered_size += len(line)
+        if buffered_size >= size:
+            yield "".join(buffer)
+            buffer = []
+            buffered_size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_export(output, min_id=None, max_id=None):
+    """
+    Generator with the encoded export of the selected books.
+    Memory use is bounded by the chunk size, not by the catalog size.
+    """
+    formatter = iter_csv if output == 'csv' else iter_ndjson
+    records = iter_records(export_queryset(min_id, max_id))
+    for chunk in buffered(formatter(records)):
+        yield chunk.encode('utf-8')
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .models import Favorite
+from .sharding import favorite_shard_for
+
+MAX_FAVORITES = 20
+
+
+class FavoriteLimitExceeded(Exception):
+    """
+    Raised (rolling back the change) when a user would end up with more than
+    MAX_FAVORITES favorites.
+    """
+
+
+def update_favorites(user, add=(), remove=()):
+    """
+    Add and remove several favorites of a user in one transaction.
+
+    The limit is checked after the insert, while holding the user's row lock
+    (SQLite locks the whole database for the write instead), so concurrent
+    requests cannot push the user past MAX_FAVORITES.
+
+    @Param add: ids of existing books to add; ids already in favorites are skipped
+    @Param remove: ids of books to remove
+    @Return (added, removed): lists of book ids actually added / removed
+    """
+    # the favorites may be in a shard, not in 'default'
+    with transaction.atomic(), transaction.atomic(using=favorite_shard_for(user.pk)):
+        # serialize favorite writes of this user
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+        removed = []
+        if remove:
+            favorites = Favorite.objects.filter(user=user, book_id__in=remove)
+            removed = list(favorites.values_list('book_id', flat=True))
+            favorites.delete()
+
+        existing = set(Favorite.objects.filter(user=user).values_list('book_id', flat=True))
+        added = [book_id for book_id in dict.fromkeys(add) if book_id not in existing]
+        if added:
+            # ignore_conflicts: a concurrent request may have added the same book
+            Favorite.objects.bulk_create([Favorite(user=user, book_id=book_id) for book_id in added],
+                                         ignore_conflicts=True)
+            if Favorite.objects.filter(user=user).count() > MAX_FAVORITES:
+                raise FavoriteLimitExceeded(f'Cannot add more than {MAX_FAVORITES} favorites')
+
+    return added, removed
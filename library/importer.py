@@ -0,0 +1,627 @@
+"""
+Bulk import of books (load_books --bulk) from CSV or JSON Lines files,
+optionally gzip/bzip2 compressed, or from stdin.
+
+Rows are parsed into book fields + author names and written in batches:
+authors are resolved through an in-memory name -> id map (missing names
+are bulk created), books are upserted on their natural key (work and
+edition, or title; see library.parsing.book_natural_key) like the row by
+row loader, and the book/author links are rewritten with one bulk insert
+per batch.
+A batch costs a handful of queries instead of 5-10 per row.
+
+Every book remembers the content hash of the row it was imported from;
+rows whose hash didn't change since the last import are skipped without
+any write, so re-importing a mostly unchanged file only writes the
+changed books.
+
+The file is streamed and decompressed on the fly (memory use doesn't
+depend on its size, apart from a set of natural keys, see
+superseded_rows()) and can be committed in chunks with a checkpoint to
+resume from after a failure.
+
+Every load is instrumented (LoadStats): wall time per stage, SQL queries
+and peak RSS, reported with load_books --progress-every / --report-json.
+"""
+import bz2
+import csv
+import gzip
+import hashlib
+import sys
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from itertools import islice
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .bulk import BookAuthor, resolve_author_ids
+from .cache import bump_catalog_version
+from .changes import record_changes
+from .models import Book, CatalogChange, ImportCheckpoint
+from .parsing import (BOOK_FIELDS, DUPLICATE_KEY_MARK, PARSE_STAGES, RowError, decode_json_row, parse_rows,
+                      parse_rows_timed, row_natural_key)
+
+# rows per chunk sent to a parser process
+PARSE_CHUNK_SIZE = 500
+
+# author name -> id entries kept between batches (least recently used are dropped)
+AUTHOR_CACHE_SIZE = 100_000
+
+
+STDIN = '-'
+
+COMPRESSED_OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+}
+
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+
+INPUT_FORMATS = ('csv', 'jsonl')
+
+# wall time of a load, see LoadStats
+STAGES = ('read', 'parse', 'write', 'authors', 'commit', 'delete')
+
+
+def guess_format(path):
+    """
+    'csv' or 'jsonl' from the file name, ignoring a compression suffix.
+    """
+    name = str(path).lower()
+    for suffix in COMPRESSED_OPENERS:
+        name = name.removesuffix(suffix)
+    return 'jsonl' if name.endswith(JSONL_SUFFIXES) else 'csv'
+
+
+def is_plain_csv(path):
+    return path != STDIN and guess_format(path) == 'csv' and not str(path).lower().endswith(tuple(COMPRESSED_OPENERS))
+
+
+def open_input(path):
+    """
+    Binary stream of the (decompressed) input; '-' is stdin, left open on close.
+    """
+    if path == STDIN:
+        return nullcontext(sys.stdin.buffer)
+    for suffix, opener in COMPRESSED_OPENERS.items():
+        if str(path).lower().endswith(suffix):
+            return opener(path, 'rb')
+    return open(path, 'rb')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_csv(file, offset=0):
+    """
+    Yield (byte offset after the row, row dict) from a CSV file opened in
+    binary mode, starting at 'offset' (0: the first row after the header).
+    The offset of a row is where reading resumes after it; for compressed
+    files it's an offset in the decompressed data.
+    """
+    header = file.readline()
+    fieldnames = next(csv.reader([header.decode('utf-8')]))
+    position = len(header)
+    if offset:
+        # decompressing streams seek by reading forward
+        file.seek(offset)
+        position = offset
+
+    def lines():
+        nonlocal position
+        for line in file:
+            position += len(line)
+            yield line.decode('utf-8')
+
+    # the reader pulls exactly the lines of one row (quoted values can span lines)
+    for row in csv.DictReader(lines(), fieldnames=fieldnames):
+        yield position, row
+
+
+def read_jsonl(file, offset=0):
+    """
+    Yield (byte offset after the line, line) from a JSON Lines file opened
+    in binary mode, see read_csv(); the lines are decoded by the parser
+    (library.parsing.decode_json_row), in the worker processes with --workers.
+    """
+    position = 0
+    if offset:
+        file.seek(offset)
+        position = offset
+    for line in file:
+        position += len(line)
+        if line.strip():
+            yield position, line.decode('utf-8')
+
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+
+def superseded_rows(path, read):
+    """
+    Numbers (from 1, in file order) of the rows a row further down the file
+    has the natural key of. The loader skips them: the last row of a book
+    wins across batches like within one, so a book repeated in the file is
+    written once and an unchanged file leaves it unchanged.
+
+    One pass over the file that only reads the key columns of each row.
+    """
+    last_rows = {}
+    superseded = set()
+    with open_input(path) as file:
+        for number, (_, row) in enumerate(read(file), start=1):
+            if isinstance(row, str):
+                try:
+                    row = decode_json_row(row)
+                except RowError:
+                    continue
+            key = row_natural_key(row)
+            if key is None:
+                continue
+            if key in last_rows:
+                superseded.add(last_rows[key])
+            last_rows[key] = number
+    return superseded
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def parse_in_pool(items, workers, stats, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    Parse (offset, row) items in 'workers' processes, yielding
+    (offset, result) in file order.
+
+    At most two chunks per worker are in flight: reading the file waits
+    for the oldest chunk, so memory stays bounded when the writer is
+    slower than the parsers. The 'parse' stage is the time spent waiting
+    for them.
+    """
+    def collect(offsets, future):
+        with stats.stage('parse'):
+            results, timings = future.result()
+        stats.add_parse_timings(timings)
+        return zip(offsets, results)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunked(items, chunk_size):
+            offsets, rows = zip(*chunk)
+            pending.append((offsets, pool.submit(parse_rows_timed, rows)))
+            if len(pending) >= workers * 2:
+                yield from collect(*pending.popleft())
+        while pending:
+            yield from collect(*pending.popleft())
+
+
+def parse_inline(items, stats, chunk_size=PARSE_CHUNK_SIZE):
+    for chunk in chunked(items, chunk_size):
+        offsets, rows = zip(*chunk)
+        with stats.stage('parse'):
+            results = parse_rows(rows, stats.parse_stages)
+        yield from zip(offsets, results)
+
+
+def peak_rss():
+    """
+    (peak RSS of this process, of its largest finished child) in bytes,
+    None without the resource module.
+    """
+    if resource is None:
+        return None, None
+    # kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+
+class LoadStats:
+    """
+    Instrumentation of a bulk load: wall time and SQL queries per stage,
+    peak RSS. Stages (STAGES): read (reading and decoding the file), parse
+    (parsing rows, or waiting for the parser processes), write (book
+    upserts, author links, change log), authors (resolving author names),
+    commit (checkpoints and commits), delete (delete_missing).
+
+    Stages nest; the time and queries go to the innermost one, so the
+    stages add up to the time of the load.
+
+    'parse_stages' splits the parsers' time (library.parsing.PARSE_STAGES);
+    with parser processes it's their time added up, not wall time.
+
+    Counts the queries as a database execute wrapper, see count_queries().
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.stage_queries = dict.fromkeys(STAGES, 0)
+        self.parse_stages = dict.fromkeys(PARSE_STAGES, 0.0)
+        self.queries = 0
+        # open stages, innermost last, and when the current one was entered or resumed
+        self.open_stages = []
+        self.mark = self.start
+        self.mark_queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def count_queries(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def switch(self):
+        """
+        Charge the time and queries since the last switch to the current stage.
+        """
+        now = time.perf_counter()
+        if self.open_stages:
+            name = self.open_stages[-1]
+            self.stages[name] += now - self.mark
+            self.stage_queries[name] += self.queries - self.mark_queries
+        self.mark, self.mark_queries = now, self.queries
+
+    def enter(self, name):
+        self.switch()
+        self.open_stages.append(name)
+
+    def exit(self):
+        self.switch()
+        self.open_stages.pop()
+
+    @contextmanager
+    def stage(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def timed(self, iterable, name):
+        """
+        Yield from 'iterable', charging the time spent in it to stage 'name'.
+        """
+        iterator = iter(iterable)
+        while True:
+            # per row: without the context manager overhead
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def add_parse_timings(self, timings):
+        for name, seconds in timings.items():
+            self.parse_stages[name] += seconds
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self, loader):
+        """
+        The load report as a JSON-serializable dict.
+        """
+        elapsed = self.elapsed
+        rows = loader.rows - loader.resumed_rows
+        rss, children_rss = peak_rss()
+        return {
+            'rows': loader.rows,
+            'resumed_rows': loader.resumed_rows,
+            'created': loader.created,
+            'updated': loader.updated,
+            'unchanged': loader.unchanged,
+            'errors': loader.errors,
+            'deleted': loader.deleted,
+            'superseded': loader.superseded,
+            'error_counts': dict(loader.error_counts),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else 0,
+            'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            # outside any stage: opening the file, the checkpoint lookup, pool startup
+            'other_seconds': round(max(elapsed - sum(self.stages.values()), 0), 3),
+            'parse_stages': {name: round(seconds, 3) for name, seconds in self.parse_stages.items()},
+            'queries': self.queries,
+            'queries_per_1k_rows': round(self.queries * 1000 / rows, 2) if rows else 0,
+            'stage_queries': dict(self.stage_queries),
+            'peak_rss_bytes': rss,
+            'peak_children_rss_bytes': children_rss,
+        }
+
+
+class BulkBookLoader:
+    """
+    Loads parsed rows in batches of 'batch_size'. Counters: rows, created,
+    updated, unchanged, errors, deleted, superseded; 'error_counts' splits
+    this run's errors by the invalid field (library.parsing.RowError.field).
+
+    The rows numbered in 'superseded_rows' (see superseded_rows()) are
+    skipped, a later row has their book; when that row has errors the
+    book is left as it is.
+
+    With 'commit_every' the rows are committed in chunks of that many rows,
+    each together with the progress saved in 'checkpoint'; otherwise the
+    whole load is one transaction.
+
+    With 'delete_missing' books no row of the file matched are deleted at
+    the end. Books with the natural key of a row skipped on errors are
+    kept; when such a row doesn't even identify its book nothing is deleted
+    ('delete_refused'). With
+    'track_changes' the ids of the created, updated and deleted books are
+    collected in 'changed_ids', each id once.
+
+    'progress' is called with the loader after every commit and
+    'report_progress' every 'progress_every' rows. 'stats' (LoadStats)
+    collects the time and queries per stage.
+    """
+    def __init__(self, batch_size=1000, commit_every=0, checkpoint=None, delete_missing=False,
+                 track_changes=False, progress=None, progress_every=0, report_progress=None, stats=None,
+                 stderr=None, superseded_rows=frozenset()):
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.progress_every = progress_every
+        self.report_progress = report_progress
+        self.stats = stats if stats is not None else LoadStats()
+        self.stderr = stderr
+        self.author_ids = OrderedDict()
+        self.superseded_rows = superseded_rows
+        self.rows = self.created = self.updated = self.unchanged = self.errors = self.deleted = self.superseded = 0
+        self.error_counts = Counter()
+        self.offset = 0
+        if checkpoint is not None:
+            self.rows, self.created, self.updated, self.unchanged, self.errors, self.offset = (
+                checkpoint.rows, checkpoint.created, checkpoint.updated, checkpoint.unchanged, checkpoint.errors,
+                checkpoint.byte_offset)
+        # ids of the books matched by a row, natural keys of the rows with errors and the
+        # number of rows with errors that have none
+        self.seen_ids = set() if delete_missing else None
+        self.error_keys = set()
+        self.unkeyed_errors = 0
+        self.delete_refused = False
+        self.changed_ids = {'created': [], 'updated': [], 'deleted': []} if track_changes else None
+        self.reported_ids = set()
+        # rows loaded by an earlier, resumed run
+        self.resumed_rows = self.rows
+
+    def load(self, parsed):
+        """
+        Write parsed rows, (offset, library.parsing.parse_rows() result) items.
+        """
+        parsed = iter(parsed)
+        stats = self.stats
+        done = False
+        while not done:
+            with stats.stage('commit'), transaction.atomic():
+                changes = self.created + self.updated
+                with stats.stage('write'):
+                    done = self.load_chunk(parsed)
+                if done and self.seen_ids is not None:
+                    with stats.stage('delete'):
+                        self.delete_missing()
+                if self.checkpoint is not None:
+                    self.save_checkpoint(completed=done)
+                # nothing to invalidate when every row was unchanged
+                if self.created + self.updated != changes:
+                    bump_catalog_version()
+            if self.progress is not None:
+                self.progress(self)
+
+    def load_chunk(self, parsed):
+        """
+        Write up to 'commit_every' rows; returns True once all rows are written.
+        """
+        batch = {}
+        count = 0
+        done = True
+        for offset, (fields, authors, error) in parsed:
+            self.rows += 1
+            self.offset = offset
+            count += 1
+            if self.progress_every and self.rows % self.progress_every == 0:
+                self.report_progress(self)
+            if error is not None:
+                self.error(fields['title'], error)
+                if fields.get('natural_key'):
+                    self.error_keys.add(fields['natural_key'])
+                else:
+                    self.unkeyed_errors += 1
+            elif self.rows in self.superseded_rows:
+                self.superseded += 1
+            else:
+                # a book repeated within a batch: the last row wins, as with update_or_create
+                batch[fields['natural_key']] = (fields, authors)
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    batch = {}
+            if self.commit_every and count >= self.commit_every:
+                done = False
+                break
+        if batch:
+            self.write_batch(batch)
+        return done
+
+    def save_checkpoint(self, completed):
+        checkpoint = self.checkpoint
+        checkpoint.byte_offset = self.offset
+        checkpoint.rows = self.rows
+        checkpoint.created = self.created
+        checkpoint.updated = self.updated
+        checkpoint.unchanged = self.unchanged
+        checkpoint.errors = self.errors
+        checkpoint.completed = completed
+        checkpoint.save()
+
+    def error(self, title, error):
+        self.errors += 1
+        self.error_counts[error.field] += 1
+        if self.stderr is not None:
+            self.stderr.write(f"Skipping row {self.rows} ('{title}'): {error}")
+
+    def resolve_authors(self, names):
+        """
+        Author ids for 'names' through the bounded in-memory map.
+        """
+        # in file order: a new author is named as first seen
+        names = dict.fromkeys(names)
+        missing = [name for name in names if name not in self.author_ids]
+        if missing:
+            self.author_ids.update(resolve_author_ids(missing))
+        author_ids = {}
+        for name in names:
+            self.author_ids.move_to_end(name)
+            author_ids[name] = self.author_ids[name]
+        while len(self.author_ids) > AUTHOR_CACHE_SIZE:
+            self.author_ids.popitem(last=False)
+        return author_ids
+
+    def write_batch(self, batch):
+        existing = {}
+        for book_id, natural_key, content_hash in (Book.objects.filter(natural_key__in=list(batch))
+                                                   .values_list('id', 'natural_key', 'content_hash')):
+            existing[natural_key] = (book_id, content_hash)
+            if self.seen_ids is not None:
+                self.seen_ids.add(book_id)
+
+        # same row as the last import: nothing to write
+        batch = {key: row for key, row in batch.items()
+                 if key not in existing or existing[key][1] != row[0]['content_hash']}
+        self.unchanged += len(existing) - sum(key in existing for key in batch)
+        if not batch:
+            return
+
+        now = timezone.now()
+        books = {key: Book(updated_at=now, **fields) for key, (fields, _) in batch.items()}
+        # one INSERT .. ON CONFLICT (natural_key) DO UPDATE for new and changed books; sets the ids of both
+        Book.objects.bulk_create(books.values(), batch_size=self.batch_size, update_conflicts=True,
+                                 unique_fields=['natural_key'], update_fields=BOOK_FIELDS + ['content_hash', 'updated_at'])
+        new_books = [book for key, book in books.items() if key not in existing]
+        updated_books = [book for key, book in books.items() if key in existing]
+
+        with self.stats.stage('authors'):
+            author_ids = self.resolve_authors(name for _, authors in batch.values() for name in authors)
+        BookAuthor.objects.filter(book_id__in=[book.id for book in updated_books]).delete()
+        BookAuthor.objects.bulk_create([
+            BookAuthor(book_id=books[key].id, author_id=author_id)
+            for key, (_, authors) in batch.items()
+            # variants of a name are the same author
+            for author_id in dict.fromkeys(author_ids[name] for name in authors)
+        ], batch_size=self.batch_size)
+
+        record_changes(Book, [book.id for book in new_books], CatalogChange.CREATE)
+        record_changes(Book, [book.id for book in updated_books], CatalogChange.UPDATE)
+        self.created += len(new_books)
+        self.updated += len(updated_books)
+        if self.seen_ids is not None:
+            self.seen_ids.update(book.id for book in new_books)
+        if self.changed_ids is not None:
+            self.report_changed('created', [book.id for book in new_books])
+            self.report_changed('updated', [book.id for book in updated_books])
+
+    def report_changed(self, change, ids):
+        # without superseded_rows (stdin) a book can be written by several batches
+        ids = [book_id for book_id in ids if book_id not in self.reported_ids]
+        self.reported_ids.update(ids)
+        self.changed_ids[change].extend(ids)
+
+    def delete_missing(self):
+        """
+        Delete the books no row of the file matched; the post_delete signals
+        record the changes and clean up favorites.
+        """
+        if self.unkeyed_errors:
+            # any book could be the one such a row was meant to keep
+            self.delete_refused = True
+            if self.stderr is not None:
+                self.stderr.write(f"Not deleting missing books: {self.unkeyed_errors} rows with errors "
+                                  f"don't identify their book")
+            return
+        # legacy duplicates ('#<id>' suffix) are kept with the book whose key they share
+        missing = [book_id for book_id, key in Book.objects.values_list('id', 'natural_key').iterator()
+                   if book_id not in self.seen_ids
+                   and (key or '').split(DUPLICATE_KEY_MARK)[0] not in self.error_keys]
+        for ids in chunked(missing, self.batch_size):
+            Book.objects.filter(id__in=ids).delete()
+        self.deleted += len(missing)
+        if self.changed_ids is not None:
+            self.report_changed('deleted', missing)
+
+
+def load_books_bulk(path, batch_size=1000, workers=0, commit_every=0, resume=False, delete_missing=False,
+                    track_changes=False, input_format=None, progress=None, progress_every=0, report_progress=None,
+                    stderr=None):
+    """
+    Bulk load a books file ('-': stdin) in 'input_format' ('csv' or 'jsonl',
+    default: from the file name); returns (loader, seconds), the load's
+    LoadStats in loader.stats.
+
+    With 'workers' the rows are parsed (HTML cleanup, author lists) in a
+    process pool while this process only reads the file and writes to the
+    database.
+
+    With 'commit_every' the load is committed in chunks and its progress
+    recorded in an ImportCheckpoint keyed on the file's SHA-256; 'resume'
+    continues from the last committed chunk of the same file (a completed
+    load is not repeated). 'delete_missing' needs the whole file in one
+    run, it can't be combined with 'resume'.
+
+    'progress' is called with the loader after every commit,
+    'report_progress' every 'progress_every' rows.
+    """
+    if delete_missing and resume:
+        raise ValueError("delete_missing can't be combined with resume")
+    if commit_every and path == STDIN:
+        raise ValueError("stdin can't be checkpointed")
+    read = READERS[input_format or guess_format(path)]
+    stats = LoadStats()
+    with stats.count_queries():
+        checkpoint = None
+        if commit_every:
+            with stats.stage('read'):
+                file_hash = file_sha256(path)
+            checkpoint, _ = ImportCheckpoint.objects.get_or_create(file_hash=file_hash,
+                                                                   defaults={'file_name': str(path)})
+            if not resume:
+                checkpoint = ImportCheckpoint(pk=checkpoint.pk, file_hash=checkpoint.file_hash, file_name=str(path))
+        pending = checkpoint is None or not checkpoint.completed
+        superseded = frozenset()
+        # stdin can't be read twice: there a book repeated in several batches is written by each
+        if pending and path != STDIN:
+            with stats.stage('read'):
+                superseded = superseded_rows(path, read)
+        loader = BulkBookLoader(batch_size=batch_size, commit_every=commit_every, checkpoint=checkpoint,
+                                delete_missing=delete_missing, track_changes=track_changes, progress=progress,
+                                progress_every=progress_every, report_progress=report_progress, stats=stats,
+                                stderr=stderr, superseded_rows=superseded)
+
+        if pending:
+            with open_input(path) as file:
+                items = stats.timed(read(file, offset=loader.offset), 'read')
+                loader.load(parse_in_pool(items, workers, stats) if workers > 0 else parse_inline(items, stats))
+    return loader, stats.elapsed
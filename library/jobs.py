@@ -0,0 +1,131 @@
+"""
+Background catalog imports.
+
+POST /imports streams the uploaded file to settings.IMPORT_UPLOAD_DIR
+(through a temporary file on disk, never in memory) and queues an
+ImportJob; the web worker returns as soon as the file is stored. The
+'run_import_worker' command claims queued jobs and loads them with
+library.importer in chunks of IMPORT_JOB_COMMIT_EVERY rows, saving the
+job's counters after every chunk so GET /imports/:id shows the progress.
+
+Jobs are claimed with a conditional UPDATE, so several workers can run
+side by side. A worker that dies leaves its job 'running' without
+progress; after IMPORT_JOB_STALE_SECONDS it is queued again and resumes
+from its last committed chunk (library.models.ImportCheckpoint).
+"""
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.db.models import F
+from django.utils import timezone
+
+from .importer import COMPRESSED_OPENERS, guess_format, load_books_bulk
+from .models import ImportJob
+
+# row errors kept on the job, the counts cover all of them
+MAX_ERROR_SAMPLES = 20
+
+
+def store_upload(uploaded_file, user=None, input_format=''):
+    """
+    Move an uploaded books file into IMPORT_UPLOAD_DIR and queue its import.
+
+    The stored name keeps the format and compression suffix the importer
+    reads the file with ('input_format' overrides the one of the name).
+    """
+    name = uploaded_file.name.lower()
+    compression = next((suffix for suffix in COMPRESSED_OPENERS if name.endswith(suffix)), '')
+    upload_dir = Path(settings.IMPORT_UPLOAD_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    path = upload_dir / f"{uuid.uuid4().hex}.{input_format or guess_format(name)}{compression}"
+
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        # a rename when the temporary file is on the same file system
+        file_move_safe(uploaded_file.temporary_file_path(), str(path))
+    else:
+        with open(path, 'wb') as file:
+            for chunk in uploaded_file.chunks():
+                file.write(chunk)
+
+    return ImportJob.objects.create(path=str(path), file_name=uploaded_file.name[:255], input_format=input_format,
+                                    size=uploaded_file.size, uploaded_by=user)
+
+
+def requeue_stale_jobs():
+    """
+    Queue again the running jobs whose worker stopped reporting progress;
+    returns their number.
+    """
+    now = timezone.now()
+    return ImportJob.objects.filter(
+        status=ImportJob.RUNNING, updated_at__lt=now - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS),
+    ).update(status=ImportJob.QUEUED, updated_at=now)
+
+
+def claim_next_job():
+    """
+    Mark the oldest queued job running for this worker and return it, or
+    None when the queue is empty.
+    """
+    queued = ImportJob.objects.filter(status=ImportJob.QUEUED).order_by('id')
+    for job_id in queued.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        # another worker may have claimed it since
+        claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.QUEUED).update(
+            status=ImportJob.RUNNING, attempts=F('attempts') + 1, started_at=now, updated_at=now, message='')
+        if claimed:
+            return ImportJob.objects.get(pk=job_id)
+    return None
+
+
+class ErrorSamples(list):
+    """
+    stderr for the loader keeping the first MAX_ERROR_SAMPLES messages.
+    """
+    def write(self, message):
+        if len(self) < MAX_ERROR_SAMPLES:
+            self.append(message)
+
+
+def run_job(job, workers=0):
+    """
+    Load the file of a claimed job. A job claimed again after its worker
+    died resumes from the last committed chunk. The file is deleted once
+    loaded and kept when the import fails.
+    """
+    # counters of the attempts before, the loader restores the others from the checkpoint
+    error_counts = Counter(job.error_counts)
+    samples = ErrorSamples(job.error_samples)
+    start = time.perf_counter()
+
+    def progress(loader):
+        elapsed = time.perf_counter() - start
+        job.rows, job.created, job.updated, job.unchanged, job.errors = (
+            loader.rows, loader.created, loader.updated, loader.unchanged, loader.errors)
+        job.error_counts = dict(error_counts + loader.error_counts)
+        job.error_samples = list(samples)
+        job.rows_per_second = (loader.rows - loader.resumed_rows) / elapsed if elapsed else 0
+        job.save(update_fields=['rows', 'created', 'updated', 'unchanged', 'errors', 'error_counts', 'error_samples',
+                                'rows_per_second', 'updated_at'])
+
+    try:
+        loader, _ = load_books_bulk(job.path, workers=workers, commit_every=settings.IMPORT_JOB_COMMIT_EVERY,
+                                    resume=job.attempts > 1, input_format=job.input_format or None,
+                                    progress=progress, stderr=samples)
+    except Exception as error:
+        job.status = ImportJob.FAILED
+        job.message = f"{type(error).__name__}: {error}"
+    else:
+        # a completed load resumed from its checkpoint reports nothing
+        progress(loader)
+        job.status = ImportJob.DONE
+        os.remove(job.path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'finished_at', 'updated_at'])
+    return job
@@ -0,0 +1,50 @@
+import ast
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.parsing import AUTHORS_LIST, parse_authors_list
+
+
+class Command(BaseCommand):
+    help = ("Compare parsers of the 'authors' column of a books CSV file: ast.literal_eval() (as safe as the "
+            "original loader's eval() is not) and library.parsing.parse_authors_list()")
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', type=str, help='Books CSV file to take the authors values from.')
+        parser.add_argument('--repeat', type=int, default=20, help='Passes over the values per parser.')
+
+    def handle(self, *args, **options):
+        with open(options['csv_file'], newline='', encoding='utf-8') as file:
+            values = [row['authors'] for row in csv.DictReader(file) if row.get('authors')]
+        if not values:
+            raise CommandError("The file has no 'authors' values")
+        fast = sum(1 for value in values if AUTHORS_LIST.fullmatch(value))
+        self.stdout.write(f"{len(values)} values ({len(set(values))} distinct), "
+                          f"{fast} in the fast path format")
+
+        # no eval(): the file may not be trusted
+        parsers = {
+            'literal_eval': ast.literal_eval,
+            # without the cache: the cost of every value
+            'parse_authors_list': parse_authors_list.__wrapped__,
+            'parse_authors_list (cached)': parse_authors_list,
+        }
+        expected = [self.safe(ast.literal_eval, value) for value in values]
+        for name, parse in parsers.items():
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                # every pass is a fresh file: only values repeated within the file hit the cache
+                parse_authors_list.cache_clear()
+                results = [self.safe(parse, value) for value in values]
+            elapsed = time.perf_counter() - start
+            mismatches = sum(1 for result, other in zip(results, expected) if result != other)
+            self.stdout.write(f"[{name}] {len(values) * options['repeat'] / elapsed:.0f} values/s, "
+                              f"{mismatches} results differ from literal_eval")
+
+    def safe(self, parse, value):
+        try:
+            return parse(value)
+        except Exception:
+            return None
@@ -0,0 +1,77 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+
+
+class Command(BaseCommand):
+    help = ('Compare read throughput of the WSGI path (sync DRF views, one thread per concurrent request) '
+            'with the ASGI path (native async views) against the current database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per path and mode.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent requests in flight.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request; can be repeated. Default: /books and /authors.')
+        parser.add_argument('--cached', action='store_true',
+                            help='Allow catalog response cache hits (by default every request is a cache miss).')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/books', '/authors']
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        # the test clients send requests for 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for path in paths:
+                urls = [self.url(path, i, options['cached']) for i in range(total)]
+
+                wsgi = self.run_wsgi(urls, concurrency)
+                with override_settings(ROOT_URLCONF='project.urls_async'):
+                    asgi = asyncio.run(self.run_asgi(urls, concurrency))
+
+                for mode, result in (('wsgi', wsgi), ('asgi', asgi)):
+                    self.stdout.write(self.report(path, mode, result))
+
+    def url(self, path, i, cached):
+        if cached:
+            return path
+        # unique query string: every request misses the response cache
+        return f"{path}{'&' if '?' in path else '?'}_bench={i}"
+
+    def run_wsgi(self, urls, concurrency):
+        def fetch(url):
+            start = time.perf_counter()
+            status = Client().get(url).status_code
+            return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(fetch, urls))
+        return time.perf_counter() - start, results
+
+    async def run_asgi(self, urls, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        return time.perf_counter() - start, results
+
+    def report(self, path, mode, result):
+        elapsed, results = result
+        latencies = sorted(latency for latency, _ in results)
+        errors = sum(1 for _, status in results if status >= 400)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        return (f"{path} [{mode}] requests:{len(results)} errors:{errors} "
+                f"req/s:{len(results) / elapsed:.1f} "
+                f"p50:{statistics.median(latencies) * 1000:.1f}ms p95:{p95 * 1000:.1f}ms")
@@ -0,0 +1,126 @@
+import copy
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+
+from library.favorites import MAX_FAVORITES, update_favorites
+from library.models import Book
+
+PROFILES = {
+    'default': {'OPTIONS': {}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'production': settings.SQLITE_PRODUCTION_PROFILE,
+}
+
+
+class Command(BaseCommand):
+    help = ('Mixed read/write benchmark (book list reads, favorites writes) of the default and the production '
+            'SQLite profile, each run on a fresh copy of the current database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients.')
+        parser.add_argument('--ops', type=int, default=200, help='Operations per client.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of favorites writes.')
+
+    def handle(self, *args, **options):
+        source = connections['default'].settings_dict
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("bench_sqlite only benchmarks SQLite databases")
+        original = copy.deepcopy(source)
+
+        workdir = tempfile.mkdtemp(prefix='bench_sqlite_')
+        try:
+            for name, profile in PROFILES.items():
+                path = self.copy_database(original['NAME'], os.path.join(workdir, f'{name}.sqlite3'))
+                self.configure(source, path, profile)
+                result = self.run(options)
+                self.stdout.write(self.report(name, result))
+        finally:
+            connections['default'].close()
+            source.clear()
+            source.update(original)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def copy_database(self, source_path, path):
+        with sqlite3.connect(source_path) as source, sqlite3.connect(path) as target:
+            source.backup(target)
+        # the copy starts in rollback journal mode; the production profile switches it to WAL
+        with sqlite3.connect(path) as target:
+            target.execute('PRAGMA journal_mode=DELETE')
+        return path
+
+    def configure(self, settings_dict, path, profile):
+        # connections of new threads are created from this same dict
+        connections['default'].close()
+        settings_dict.update(copy.deepcopy(profile))
+        settings_dict['NAME'] = path
+
+    def run(self, options):
+        book_ids = list(Book.objects.values_list('id', flat=True))
+        if not book_ids:
+            raise CommandError("The database has no books, load some first")
+        users = [User.objects.create(username=f'bench_sqlite_{i}') for i in range(options['threads'])]
+        connections['default'].close()
+
+        lock = threading.Lock()
+        latencies = {'read': [], 'write': []}
+        errors = []
+
+        def client(user):
+            favorites = set()
+            rng = random.Random(user.pk)
+            for _ in range(options['ops']):
+                # what the request_started/request_finished signals do around every request
+                close_old_connections()
+                start = time.perf_counter()
+                try:
+                    if rng.random() < options['write_ratio']:
+                        kind = 'write'
+                        if len(favorites) >= MAX_FAVORITES // 2:
+                            book_id = favorites.pop()
+                            update_favorites(user, remove=[book_id])
+                        else:
+                            book_id = rng.choice(book_ids)
+                            added, _ = update_favorites(user, add=[book_id])
+                            favorites.update(added)
+                    else:
+                        kind = 'read'
+                        offset = rng.randrange(max(len(book_ids) - 20, 1))
+                        list(Book.objects.prefetch_related('authors')[offset:offset + 20])
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                finally:
+                    close_old_connections()
+                with lock:
+                    latencies[kind].append(time.perf_counter() - start)
+            connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(client, users))
+        return time.perf_counter() - start, latencies, errors
+
+    def report(self, name, result):
+        elapsed, latencies, errors = result
+        done = sum(len(values) for values in latencies.values())
+        lines = [f"[{name}] ops:{done} errors:{len(errors)} ops/s:{done / elapsed:.1f}"]
+        for kind, values in latencies.items():
+            if values:
+                values.sort()
+                lines.append(f"  {kind}: {len(values)} p50:{statistics.median(values) * 1000:.1f}ms "
+                             f"p95:{values[int(len(values) * 0.95) - 1] * 1000:.1f}ms")
+        if errors:
+            lines.append(f"  first error: {errors[0]}")
+        return "\n".join(lines)
@@ -1,15 +1,54 @@
 import csv
+import json
 import os
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand, CommandError
 from library.models import Book, Author  # Import your models
+from library.importer import INPUT_FORMATS, STDIN, is_plain_csv, load_books_bulk
+from library.parsing import author_name_key, book_natural_key, parse_authors_list
 from django.db import transaction
 
+def format_stages(report):
+    """
+    One line of LoadStats.report(): seconds per stage, queries, peak RSS.
+    """
+    stages = ", ".join(f"{name}:{seconds:.1f}s" for name, seconds in report['stages'].items())
+    parse = ", ".join(f"{name}:{seconds:.1f}s" for name, seconds in report['parse_stages'].items())
+    line = (f"{stages}, other:{report['other_seconds']:.1f}s (parsers: {parse}); "
+            f"queries:{report['queries']} ({report['queries_per_1k_rows']:.1f} per 1k rows)")
+    if report['peak_rss_bytes'] is not None:
+        line += f"; peak rss:{report['peak_rss_bytes'] / 2**20:.0f}MB"
+    return line
+
+
 class Command(BaseCommand):
-    help = 'Load books from a CSV file into the database'
+    help = 'Load books from a CSV or JSON Lines file (optionally .gz/.bz2 compressed, or stdin) into the database'
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str, help='The path to the CSV file to be loaded.')
+        parser.add_argument('csv_file', type=str,
+                            help="The path to the file to be loaded: .csv, .jsonl, either with .gz or .bz2, "
+                                 "or '-' for stdin.")
+        parser.add_argument('--format', choices=INPUT_FORMATS,
+                            help='Input format with --bulk (default: from the file name, csv for stdin).')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Load in batches with bulk queries (library.importer) instead of row by row.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch with --bulk.')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='With --bulk: parse rows (HTML cleanup, author lists) in this many processes.')
+        parser.add_argument('--commit-every', type=int, default=0,
+                            help='With --bulk: commit every N rows and record a checkpoint (default: one transaction).')
+        parser.add_argument('--resume', action='store_true',
+                            help='With --bulk --commit-every: continue from the checkpoint of an interrupted load.')
+        parser.add_argument('--delete-missing', action='store_true',
+                            help='With --bulk: delete the books no row of the file matches.')
+        parser.add_argument('--changed-ids', metavar='PATH',
+                            help='With --bulk: write the ids of the created, updated and deleted books '
+                                 'to this JSON file.')
+        parser.add_argument('--progress-every', type=int, default=0, metavar='N',
+                            help='With --bulk: print the progress (rows/s, time per stage, queries) every N rows.')
+        parser.add_argument('--report-json', metavar='PATH',
+                            help="With --bulk: write the load report (counters, time per stage, queries per 1k rows, "
+                                 "peak RSS) to this JSON file, '-' for stdout.")
 
     def handle(self, *args, **options):
         csv_file = options['csv_file']
@@ -18,9 +57,24 @@ class Command(BaseCommand):
         errors = 0
 
         # Check if the file exists
-        if not os.path.exists(csv_file):
+        if csv_file != STDIN and not os.path.exists(csv_file):
             raise CommandError(f"File '{csv_file}' does not exist.")
 
+        if not options['bulk'] and (options['format'] == 'jsonl' or not is_plain_csv(csv_file)):
+            raise CommandError("Compressed, JSON Lines and stdin input need --bulk")
+        if csv_file == STDIN and options['commit_every']:
+            raise CommandError("--commit-every needs a file, stdin can't be resumed")
+
+        if options['resume'] and not (options['bulk'] and options['commit_every']):
+            raise CommandError("--resume needs --bulk and --commit-every")
+        if (options['delete_missing'] or options['changed_ids'] or options['progress_every']
+                or options['report_json']) and not options['bulk']:
+            raise CommandError("--delete-missing, --changed-ids, --progress-every and --report-json need --bulk")
+        if options['delete_missing'] and options['resume']:
+            raise CommandError("--delete-missing can't be combined with --resume")
+        if options['bulk']:
+            return self.handle_bulk(csv_file, options)
+
         # Open the CSV file
         with open(csv_file, newline='', encoding='utf-8') as file:
             reader = csv.DictReader(file)
@@ -50,34 +104,43 @@ class Command(BaseCommand):
                     author_objs = []
                     if authors_list:
                         try:
-                            # Authors field is a list of JSON objects, parse and handle it
-                            authors_json = eval(authors_list)  # Use eval or json.loads (if JSON)
+                            # Authors field is a list of objects as a Python literal; parsed without eval(),
+                            # the file may come from anywhere
+                            authors_json = parse_authors_list(authors_list)
                             if len(authors_json) > 1:
                                 # More than one author, use the authors list
                                 for author_data in authors_json:
                                     author_name_from_list = author_data.get('name', '').strip()
                                     if author_name_from_list:
-                                        author_obj, created = Author.objects.get_or_create(name=author_name_from_list)
+                                        author_obj, created = Author.objects.get_or_create(
+                                            name_key=author_name_key(author_name_from_list),
+                                            defaults={'name': author_name_from_list})
                                         author_objs.append(author_obj)
                         except Exception as e:
                             self.stderr.write(self.style.ERROR(f"Failed to process authors for book '{title}': {e}"))
+                            errors = errors + 1
                             continue
 
                     # If no authors in the authors list, use author_name
                     if not author_objs and author_name:
-                        author_obj, created = Author.objects.get_or_create(name=author_name)
+                        author_obj, created = Author.objects.get_or_create(name_key=author_name_key(author_name),
+                                                                           defaults={'name': author_name})
                         author_objs.append(author_obj)
 
                     # Ensure there's at least one author for the book
                     if not author_objs:
                         self.stderr.write(self.style.ERROR(f"Skipping book '{title}' because it has no valid authors."))
+                        errors = errors + 1
                         continue
 
                     # Create or update the book entry
                     try:
                         book, created = Book.objects.update_or_create(
-                            title=title,
+                            natural_key=book_natural_key({'title': title, 'work_id': work_id,
+                                                          'edition_information': edition_information,
+                                                          'publisher': publisher, 'language': language}),
                             defaults={
+                                'title': title,
                                 'language': language,
                                 'work_id': work_id,
                                 'edition_information': edition_information,
@@ -101,10 +164,55 @@ class Command(BaseCommand):
                             # self.stdout.write(self.style.SUCCESS(f"Successfully updated book '{title}'"))
                     except Exception as e:
                         self.stderr.write(self.style.ERROR(f"Error saving book '{title}': {e}"))
+                        errors = errors + 1
                         continue
 
         self.stdout.write(self.style.SUCCESS(f"load report== created:{create}, updated:{update}, errors:{errors}"))
 
+    def handle_bulk(self, csv_file, options):
+        loader, elapsed = load_books_bulk(
+            csv_file,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            commit_every=options['commit_every'],
+            resume=options['resume'],
+            delete_missing=options['delete_missing'],
+            track_changes=bool(options['changed_ids']),
+            input_format=options['format'],
+            progress_every=options['progress_every'],
+            report_progress=self.report_progress,
+            stderr=self.stderr,
+        )
+        if options['changed_ids']:
+            with open(options['changed_ids'], 'w', encoding='utf-8') as file:
+                json.dump(loader.changed_ids, file)
+        if loader.resumed_rows:
+            self.stdout.write(f"resumed after row {loader.resumed_rows}")
+        if loader.delete_refused:
+            self.stdout.write(self.style.WARNING(
+                "--delete-missing skipped: some rows with errors have no title or work id to match a book"))
+        rate = (loader.rows - loader.resumed_rows) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"load report== created:{loader.created}, updated:{loader.updated}, errors:{loader.errors}, "
+            f"unchanged:{loader.unchanged}, deleted:{loader.deleted}, superseded:{loader.superseded}, "
+            f"rows:{loader.rows} in {elapsed:.1f}s ({rate:.0f} rows/s)"))
+        if loader.error_counts:
+            self.stdout.write("errors by field== " + ", ".join(
+                f"{field}:{count}" for field, count in loader.error_counts.most_common()))
+        report = loader.stats.report(loader)
+        self.stdout.write("stages== " + format_stages(report))
+        if options['report_json'] == STDIN:
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['report_json']:
+            with open(options['report_json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+
+    def report_progress(self, loader):
+        report = loader.stats.report(loader)
+        self.stdout.write(f"progress== rows:{report['rows']} ({report['rows_per_second']:.0f} rows/s), "
+                          f"created:{report['created']}, updated:{report['updated']}, errors:{report['errors']}; "
+                          + format_stages(report))
+
     def clean_html_tags(text):
         soup = BeautifulSoup(text, "html.parser")
         return soup.get_text()
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.bulk import merge_authors
+from library.cache import bump_catalog_version
+from library.models import Author
+from library.parsing import author_name_key
+
+
+class Command(BaseCommand):
+    help = ("Merge authors whose names normalize to the same key (case or whitespace variants) into the oldest "
+            "one and refresh outdated Author.name_key values, e.g. after names were changed with queryset.update()")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be merged.')
+
+    def handle(self, *args, **options):
+        kept = {}
+        duplicates = {}
+        stale = []
+        for author_id, name, name_key in Author.objects.order_by('id').values_list('id', 'name', 'name_key').iterator():
+            key = author_name_key(name)
+            if key in kept:
+                duplicates[author_id] = kept[key]
+            else:
+                kept[key] = author_id
+                if name_key != key:
+                    stale.append(Author(id=author_id, name_key=key))
+
+        if options['dry_run']:
+            for author_id, target_id in duplicates.items():
+                self.stdout.write(f"author {author_id} -> {target_id}")
+            self.stdout.write(f"Would merge {len(duplicates)} authors and refresh {len(stale)} name keys")
+            return
+
+        with transaction.atomic():
+            # the duplicates go first, their keys may be the new keys of the others
+            book_ids = merge_authors(duplicates)
+            Author.objects.bulk_update(stale, ['name_key'], batch_size=1000)
+            if duplicates or stale:
+                bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {len(duplicates)} authors ({len(book_ids)} books relinked), refreshed {len(stale)} name keys"))
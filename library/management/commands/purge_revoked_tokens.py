@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from library.revocation import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = ('Delete revoked refresh tokens that have expired. '
+            'Run periodically (e.g. hourly from cron) to keep the revocation table small.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_tokens()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired revoked tokens"))
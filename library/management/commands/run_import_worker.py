@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from library.jobs import claim_next_job, requeue_stale_jobs, run_job
+from library.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Load the books files uploaded to /imports, one job at a time (see library.jobs)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Parse rows (HTML cleanup, author lists) in this many processes.')
+        parser.add_argument('--poll', type=float, default=settings.IMPORT_WORKER_POLL_SECONDS,
+                            help='Seconds between checks of an empty queue.')
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f"requeued {requeued} stale jobs")
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                close_old_connections()
+                time.sleep(options['poll'])
+                continue
+
+            self.stdout.write(f"job {job.id} ({job.file_name}) started")
+            try:
+                run_job(job, workers=options['workers'])
+            except KeyboardInterrupt:
+                # resumes from its last committed chunk on the next start
+                ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.QUEUED)
+                self.stdout.write(f"job {job.id} stopped after row {job.rows}, queued again")
+                return
+            if job.status == ImportJob.DONE:
+                self.stdout.write(self.style.SUCCESS(
+                    f"job {job.id} done== created:{job.created}, updated:{job.updated}, errors:{job.errors}, "
+                    f"unchanged:{job.unchanged}, rows:{job.rows} ({job.rows_per_second:.0f} rows/s)"))
+            else:
+                self.stderr.write(self.style.ERROR(f"job {job.id} failed: {job.message}"))
+            close_old_connections()
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from library.models import Favorite
+
+CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Move favorites from the 'default' database into the favorite shards (FAVORITE_SHARDS)"
+
+    def handle(self, *args, **options):
+        if not settings.FAVORITE_SHARD_DATABASES:
+            raise CommandError("No favorite shards configured, set FAVORITE_SHARDS")
+
+        moved = 0
+        source = Favorite.objects.using(DEFAULT_DB_ALIAS)
+        while True:
+            chunk = list(source.order_by('id')[:CHUNK_SIZE])
+            if not chunk:
+                break
+            # bulk_create without using() distributes the rows by user
+            Favorite.objects.bulk_create([Favorite(user_id=f.user_id, book_id=f.book_id) for f in chunk],
+                                         ignore_conflicts=True)
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                source.filter(id__in=[f.id for f in chunk]).delete()
+            moved += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} favorites into {len(settings.FAVORITE_SHARD_DATABASES)} shards"))
@@ -0,0 +1,34 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database to the SQLite read replicas (REPLICA_DB_FILES). '
+            'Local stand-in for replication: the replicas lag until the next sync.')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replicas only copies SQLite databases")
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set REPLICA_DB_FILES")
+
+        source = sqlite3.connect(primary['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                replica = connections[alias].settings_dict
+                if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                    raise CommandError(f"Replica '{alias}' is not a SQLite database")
+                connections[alias].close()
+                target = sqlite3.connect(replica['NAME'])
+                try:
+                    # online backup: consistent copy even while the primary is written
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"Synced {alias} ({replica['NAME']})"))
+        finally:
+            source.close()
@@ -0,0 +1,101 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .query_budget import QueryBudgetExceeded, count_queries, format_budget_error, get_query_budget
+from .cache import catalog_written
+from .routers import current_request, pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Debug middleware that counts the SQL queries run by each request and
+    compares them with the 'query_budget' declared on the view.
+
+    The count is returned in the 'X-Query-Count' header. When the budget is
+    exceeded the middleware raises QueryBudgetExceeded if
+    settings.QUERY_BUDGET_RAISE is set, otherwise it logs a warning.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request.query_budget = None
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        response["X-Query-Count"] = str(counter.count)
+
+        budget = request.query_budget
+        if budget is not None and counter.count > budget:
+            message = format_budget_error(budget, counter, label=f"{request.method} {request.path}")
+            if getattr(settings, "QUERY_BUDGET_RAISE", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func, request.method)
+        return None
+
+    async def __acall__(self, request):
+        # Async ORM queries run on sync_to_async threads with their own connections,
+        # so they can't be counted here; just pass the request through without
+        # forcing the async views onto a thread.
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Exposes the current request to library.routers.ReplicaRouter and pins
+    clients to the primary database after a successful catalog write.
+    Other unsafe requests (logins, favorites, the POST /books/batch lookup)
+    don't pin: their data is never read from a replica.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        token = current_request.set(request)
+        written_token = catalog_written.set(False)
+        try:
+            response = self.get_response(request)
+            return self.process_response(request, response)
+        finally:
+            catalog_written.reset(written_token)
+            current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        written_token = catalog_written.set(False)
+        try:
+            response = await self.get_response(request)
+            return self.process_response(request, response)
+        finally:
+            catalog_written.reset(written_token)
+            current_request.reset(token)
+
+    def process_response(self, request, response):
+        if catalog_written.get() and response.status_code < 400:
+            pin_to_primary(request, response)
+        return response
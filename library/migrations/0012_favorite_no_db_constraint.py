@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-19 03:49
+
+from django.conf import settings
+from django.db import migrations
+
+from library.sharding import DropShardForeignKeys
+
+
+class Migration(migrations.Migration):
+    """
+    The favorite shard databases have no users and books to reference; the
+    foreign key constraints stay in 'default'.
+    """
+
+    dependencies = [
+        ('library', '0011_revokedtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        DropShardForeignKeys(model_name='favorite', names=['book', 'user']),
+    ]
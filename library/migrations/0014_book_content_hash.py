@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0013_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='unchanged',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
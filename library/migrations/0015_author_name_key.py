@@ -0,0 +1,69 @@
+# Generated by Django 5.1.1 on 2026-10-19 04:31
+
+import unicodedata
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def name_key(name):
+    # library.parsing.author_name_key at the time of this migration
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+def merge_duplicate_authors(apps, schema_editor):
+    """
+    Fill Author.name_key and merge the authors sharing a key into the
+    oldest one, so the unique index can be created.
+    """
+    Author = apps.get_model('library', 'Author')
+    Book = apps.get_model('library', 'Book')
+    CatalogChange = apps.get_model('library', 'CatalogChange')
+    BookAuthor = Book.authors.through
+
+    kept = {}
+    duplicates = {}
+    authors = []
+    for author in Author.objects.order_by('id').only('id', 'name'):
+        key = name_key(author.name)
+        if key in kept:
+            duplicates[author.id] = kept[key]
+        else:
+            kept[key] = author.id
+            author.name_key = key
+            authors.append(author)
+
+    if duplicates:
+        rows = list(BookAuthor.objects.filter(author_id__in=duplicates).values_list('book_id', 'author_id'))
+        book_ids = {book_id for book_id, _ in rows}
+        BookAuthor.objects.bulk_create([BookAuthor(book_id=book_id, author_id=duplicates[author_id])
+                                        for book_id, author_id in rows], ignore_conflicts=True)
+        BookAuthor.objects.filter(author_id__in=duplicates).delete()
+        Author.objects.filter(id__in=duplicates).delete()
+        Book.objects.filter(id__in=book_ids).update(updated_at=timezone.now())
+        CatalogChange.objects.bulk_create(
+            [CatalogChange(model='book', object_id=book_id, action='update') for book_id in book_ids]
+            + [CatalogChange(model='author', object_id=author_id, action='delete') for author_id in duplicates]
+        )
+    Author.objects.bulk_update(authors, ['name_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0014_book_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(merge_duplicate_authors, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='author',
+            name='name_key',
+            field=models.CharField(editable=False, max_length=100, unique=True),
+        ),
+    ]
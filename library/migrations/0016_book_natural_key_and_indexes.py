@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-19 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Nullable column without a default: a plain ALTER TABLE ADD COLUMN, no
+    table rewrite. Filled by 0017, made unique by 0018.
+    """
+
+    dependencies = [
+        ('library', '0015_author_name_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='natural_key',
+            field=models.CharField(editable=False, max_length=200, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title'], name='library_book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['work_id'], name='library_book_work_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['series_id'], name='library_book_series_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['publisher'], name='library_book_publisher_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.1 on 2026-10-19 05:02
+
+import unicodedata
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 2000
+
+
+def fold(text):
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def natural_key(book):
+    # library.parsing.book_natural_key at the time of this migration
+    work_id = (book.work_id or '').strip()
+    if not work_id:
+        return '\t'.join(['title', fold(book.title or '')])
+    return '\t'.join(['work', work_id, fold(book.edition_information or ''), fold(book.publisher or ''),
+                      fold(book.language or '')])
+
+
+def backfill_natural_keys(apps, schema_editor):
+    """
+    Fill Book.natural_key in batches of BATCH_SIZE books, each committed on
+    its own, so no long write lock is held on a large table and an
+    interrupted run continues where it stopped.
+
+    Books sharing a key with an older book (same title, or same work and
+    edition) get a '#<id>' suffix: they are kept as they are (and keep the
+    suffix while their key fields don't change, see
+    library.parsing.book_natural_key), and imports keep updating the
+    oldest one, as the title based import did.
+    """
+    Book = apps.get_model('library', 'Book')
+    keys = set(Book.objects.exclude(natural_key=None).values_list('natural_key', flat=True).iterator())
+    fields = ['id', 'title', 'work_id', 'edition_information', 'publisher', 'language']
+    last_id = 0
+    while True:
+        books = list(Book.objects.filter(natural_key=None, id__gt=last_id).order_by('id').only(*fields)[:BATCH_SIZE])
+        if not books:
+            break
+        for book in books:
+            key = natural_key(book)
+            if key in keys:
+                key = f'{key}\t#{book.id}'
+            keys.add(key)
+            book.natural_key = key
+        with transaction.atomic(using=schema_editor.connection.alias):
+            Book.objects.bulk_update(books, ['natural_key'])
+        last_id = books[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # one transaction per batch instead of one for the whole table
+    atomic = False
+
+    dependencies = [
+        ('library', '0016_book_natural_key_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_natural_keys, migrations.RunPython.noop, elidable=True),
+    ]
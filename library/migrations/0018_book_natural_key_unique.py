@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-19 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    The unique index is created directly: AddConstraint rebuilds the whole
+    table on SQLite, CREATE UNIQUE INDEX only reads it once.
+    """
+
+    dependencies = [
+        ('library', '0017_backfill_book_natural_key'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX "library_book_natural_key_uniq" ON "library_book" ("natural_key")',
+                    'DROP INDEX "library_book_natural_key_uniq"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='book',
+                    constraint=models.UniqueConstraint(fields=('natural_key',), name='library_book_natural_key_uniq'),
+                ),
+            ],
+        ),
+    ]
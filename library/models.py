@@ -1,17 +1,91 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
+from .parsing import NATURAL_KEY_FIELDS, author_name_key, book_natural_key
+from .sharding import FavoriteQuerySet
+
 
 # Create your models here.
 
-class Author(models.Model):
+class CatalogModel(models.Model):
+    """
+    Base class for catalog models. save() runs in a transaction, so the
+    CatalogChange row written by the post_save handler is committed (or
+    rolled back) together with the change itself.
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class AuthorQuerySet(models.QuerySet):
+    """
+    Keeps Author.name_key in sync for bulk writes, which skip save().
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for author in objs:
+            author.name_key = author_name_key(author.name)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'name' in fields:
+            for author in objs:
+                author.name_key = author_name_key(author.name)
+            fields = [*fields, 'name_key']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
+class Author(CatalogModel):
     name = models.CharField(max_length=50 )
+    # author identity for lookups (library.parsing.author_name_key); case folding can lengthen the name
+    name_key = models.CharField(max_length=100, unique=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = AuthorQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        self.name_key = author_name_key(self.name)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'name_key'}
+        super().save(*args, **kwargs)
+
+
+def natural_key_values(book):
+    """
+    The natural key fields of 'book'; deferred ones are loaded.
+    """
+    return {field: getattr(book, field) for field in NATURAL_KEY_FIELDS}
 
-class Book(models.Model):
+
+class BookQuerySet(models.QuerySet):
+    """
+    Keeps Book.natural_key in sync for bulk writes, which skip save().
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for book in objs:
+            book.natural_key = book_natural_key(natural_key_values(book))
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if set(fields) & set(NATURAL_KEY_FIELDS):
+            for book in objs:
+                book.natural_key = book_natural_key(natural_key_values(book), book.natural_key)
+            fields = [*fields, 'natural_key']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
+class Book(CatalogModel):
     title = models.CharField(max_length=50)
     authors = models.ManyToManyField(Author)
     language = models.CharField(max_length=10, blank=True)
@@ -23,9 +97,35 @@ class Book(models.Model):
     series_name = models.CharField(max_length=50, blank=True)
     series_position = models.CharField(max_length=10, blank=True)
     description = models.TextField( blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # digest of the CSV row the book was last imported from (library.parsing.content_hash),
+    # cleared by any other write so the next import rewrites the book
+    content_hash = models.CharField(max_length=32, blank=True, editable=False)
+    # edition identity the importer upserts on (library.parsing.book_natural_key); nullable only so
+    # the column could be added to a large table without rewriting it, every book has one
+    natural_key = models.CharField(max_length=200, null=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     class Meta:
         ordering = ["title"]
+        constraints = [
+            models.UniqueConstraint(fields=["natural_key"], name="library_book_natural_key_uniq"),
+        ]
+        indexes = [
+            # list ordering, and the recommendation / filter lookups
+            models.Index(fields=["title"], name="library_book_title_idx"),
+            models.Index(fields=["work_id"], name="library_book_work_id_idx"),
+            models.Index(fields=["series_id"], name="library_book_series_id_idx"),
+            models.Index(fields=["publisher"], name="library_book_publisher_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.content_hash = ''
+        self.natural_key = book_natural_key(natural_key_values(self), self.natural_key)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash', 'natural_key'}
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return f'{self.title}; {self.get_authors_str()}'
@@ -36,11 +136,115 @@ class Book(models.Model):
 
 
 class Favorite(models.Model):
+    # the shard databases (library.sharding) have no users and books: their tables are migrated
+    # without these foreign key constraints, 'default' keeps them
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
 
+    objects = FavoriteQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'book')  # Ensure each book is only added once to favorites per user
 
     def __str__(self):
         return f'{self.user.username} - {self.book.title}'
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only log of Book/Author inserts, updates and deletes.
+    The id is the sync token used by GET /books/changes.
+    """
+    BOOK = 'book'
+    AUTHOR = 'author'
+    MODEL_CHOICES = [(BOOK, 'Book'), (AUTHOR, 'Author')]
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(CREATE, 'Create'), (UPDATE, 'Update'), (DELETE, 'Delete')]
+
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.id}: {self.action} {self.model} {self.object_id}'
+
+
+class RevokedToken(models.Model):
+    """
+    Refresh token JTIs that can no longer be used (rotated), kept until the
+    token expires. Read through the Bloom filter in library.revocation.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of a chunked 'load_books --bulk --commit-every' run, saved with
+    every committed chunk; 'byte_offset' is where --resume continues reading.
+    """
+    file_hash = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255)
+    byte_offset = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    created = models.BigIntegerField(default=0)
+    updated = models.BigIntegerField(default=0)
+    unchanged = models.BigIntegerField(default=0)
+    errors = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.file_name}: {self.rows} rows{" (completed)" if self.completed else ""}'
+
+
+class ImportJob(models.Model):
+    """
+    A books file uploaded through /imports, loaded by the
+    'run_import_worker' command (library.jobs); the worker saves the
+    counters with every committed chunk.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    # library.importer.INPUT_FORMATS
+    FORMATS = [('csv', 'CSV'), ('jsonl', 'JSON Lines')]
+
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    path = models.CharField(max_length=500)
+    file_name = models.CharField(max_length=255)
+    input_format = models.CharField(max_length=10, choices=FORMATS, blank=True)
+    size = models.BigIntegerField(default=0)
+    uploaded_by = models.ForeignKey(User, null=True, on_delete=models.SET_NULL, related_name='+')
+    attempts = models.PositiveIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    created = models.BigIntegerField(default=0)
+    updated = models.BigIntegerField(default=0)
+    unchanged = models.BigIntegerField(default=0)
+    errors = models.BigIntegerField(default=0)
+    error_counts = models.JSONField(default=dict)
+    error_samples = models.JSONField(default=list)
+    rows_per_second = models.FloatField(default=0)
+    message = models.TextField(blank=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'], name='library_importjob_status_idx')]
+
+    def __str__(self):
+        return f'{self.file_name}: {self.status}, {self.rows} rows'
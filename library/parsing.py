@@ -0,0 +1,266 @@
+"""
+Row parsing for the book importer.
+
+Rows are CSV records (dicts of ROW_COLUMNS strings) or JSON Lines lines,
+decoded here into the same record shape so every input format goes
+through parse_row().
+
+Kept free of Django imports so the functions can run in worker processes
+(library.importer parses in a process pool with --workers).
+"""
+import ast
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+from bs4 import BeautifulSoup
+
+# CSV column -> Book field, all stripped strings
+TEXT_FIELDS = ['language', 'work_id', 'edition_information', 'publisher', 'series_id', 'series_name',
+               'series_position']
+
+BOOK_FIELDS = ['title', *TEXT_FIELDS, 'num_pages', 'description']
+
+# Book fields the natural key is built from (book_natural_key)
+NATURAL_KEY_FIELDS = ['title', 'work_id', 'edition_information', 'publisher', 'language']
+
+# parser time split reported by the importer (library.importer.LoadStats)
+PARSE_STAGES = ('html', 'authors', 'other')
+
+# separates the '#<id>' suffix of the keys of legacy duplicates (book_natural_key)
+DUPLICATE_KEY_MARK = '\t#'
+
+# columns of an input row
+ROW_COLUMNS = ['title', 'authors', 'author_name', *TEXT_FIELDS, 'num_pages', 'description']
+
+# tags or character references; text without them comes out of get_text() unchanged
+MARKUP = re.compile(r'<|&')
+
+# the 'authors' column: a list of dicts with string keys and values, as written by Python's repr()
+_STRING = (r"'(?:[^'\\\n]|\\.)*'"
+           r'|"(?:[^"\\\n]|\\.)*"')  # repr() double quotes values containing a single quote
+_PAIR = rf"\s*(?:{_STRING})\s*:\s*(?:{_STRING})\s*"
+_ENTRY = rf"\{{(?:{_PAIR}(?:,{_PAIR})*,?)?\s*\}}"
+AUTHORS_LIST = re.compile(rf"\s*\[\s*(?:{_ENTRY}\s*(?:,\s*{_ENTRY}\s*)*,?)?\s*\]\s*")
+AUTHOR_ENTRY = re.compile(_ENTRY)
+AUTHOR_PAIR = re.compile(rf"\s*({_STRING})\s*:\s*({_STRING})\s*")
+
+# distinct 'authors' values parsed per process (editions of a book repeat the same list)
+AUTHORS_CACHE_SIZE = 4096
+
+
+class RowError(ValueError):
+    """
+    A row that can't be imported; the row is skipped and counted by
+    'field', the part of the row that's invalid.
+    """
+    def __init__(self, message, field='row'):
+        # both in args, so the error survives pickling from the parser processes
+        super().__init__(message, field)
+        self.field = field
+
+    def __str__(self):
+        return self.args[0]
+
+
+def clean_html(text):
+    if not MARKUP.search(text):
+        return text
+    return BeautifulSoup(text, "html.parser").get_text()
+
+
+def author_name_key(name):
+    """
+    Identity of an author name (Author.name_key): Unicode compatibility
+    normalized, case folded, whitespace collapsed, so case and spacing
+    variants resolve to the same author.
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+def book_natural_key(fields, current=None):
+    """
+    Identity of a book edition (Book.natural_key) from a mapping of its
+    fields: the work and the edition (edition information, publisher,
+    language), or the title alone for books without a work id. The parts
+    are normalized like author names and joined with tabs, which the
+    normalization removes from the parts themselves.
+
+    'current' is the book's stored key: duplicates that predate the key
+    got it with a '#<id>' suffix (migration 0017) and keep it while their
+    key fields don't change.
+    """
+    work_id = (fields.get('work_id') or '').strip()
+    if not work_id:
+        key = '\t'.join(['title', author_name_key(fields.get('title') or '')])
+    else:
+        edition = [author_name_key(fields.get(field) or '') for field in ('edition_information', 'publisher', 'language')]
+        key = '\t'.join(['work', work_id, *edition])
+    if current and current.startswith(key + DUPLICATE_KEY_MARK):
+        return current
+    return key
+
+
+def _unquote(literal):
+    if '\\' not in literal:
+        return literal[1:-1]
+    # escape sequences are rare, leave them to the literal parser
+    return ast.literal_eval(literal)
+
+
+@lru_cache(maxsize=AUTHORS_CACHE_SIZE)
+def parse_authors_list(text):
+    """
+    Parse an 'authors' value, "[{'id': '1', 'name': 'A'}, ...]", into a
+    list of dicts without eval(). Lists of string dicts (the catalog
+    format) are read with AUTHORS_LIST; anything else goes through the
+    slower ast.literal_eval() and must still be a list of dicts.
+    Results are cached, don't modify them. Raises RowError.
+    """
+    if AUTHORS_LIST.fullmatch(text):
+        return [
+            {_unquote(key): _unquote(value) for key, value in AUTHOR_PAIR.findall(entry)}
+            for entry in AUTHOR_ENTRY.findall(text)
+        ]
+    try:
+        authors = ast.literal_eval(text)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError) as e:
+        raise RowError(f"Failed to process authors: {e}", 'authors')
+    if not isinstance(authors, (list, tuple)) or not all(isinstance(author, dict) for author in authors):
+        raise RowError("Failed to process authors: not a list of objects", 'authors')
+    return list(authors)
+
+
+def parse_authors(row):
+    """
+    Author names of a row: the 'authors' list when it has more than one
+    entry, otherwise 'author_name' (same rules as the row by row loader).
+    """
+    names = []
+    if row['authors']:
+        authors = row['authors']
+        # CSV: a Python literal; JSON Lines: already a list
+        if isinstance(authors, str):
+            authors = parse_authors_list(authors)
+        if len(authors) > 1:
+            names = [str(author.get('name') or '').strip() if isinstance(author, dict) else str(author).strip()
+                     for author in authors]
+            names = [name for name in names if name]
+    if not names and row['author_name'] and row['author_name'].strip():
+        names = [row['author_name'].strip()]
+    if not names:
+        raise RowError("no valid authors", 'authors')
+    return list(dict.fromkeys(names))
+
+
+def decode_json_row(line):
+    """
+    Row record of a JSON Lines line: an object with ROW_COLUMNS keys,
+    missing keys are empty and scalars other than strings are converted
+    ('num_pages': 120).
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise RowError(f"invalid JSON: {e}", 'json')
+    if not isinstance(record, dict):
+        raise RowError("not a JSON object", 'json')
+    row = {}
+    for column in ROW_COLUMNS:
+        value = record.get(column)
+        if value is not None and not isinstance(value, str) and not (column == 'authors' and isinstance(value, list)):
+            value = str(value)
+        row[column] = value
+    return row
+
+
+def parse_row(row, timings=None):
+    """
+    Returns (book fields, author names) for a CSV row or raises RowError.
+    The seconds spent on the description and the authors are added to
+    'timings' (a PARSE_STAGES dict).
+    """
+    title = (row['title'] or '').strip()
+    if not title:
+        raise RowError("missing title", 'title')
+    fields = {'title': title}
+    for field in TEXT_FIELDS:
+        fields[field] = row[field].strip() if row[field] else ''
+    num_pages = row['num_pages'].strip() if row['num_pages'] else ''
+    try:
+        fields['num_pages'] = int(num_pages) if num_pages else None
+    except ValueError:
+        raise RowError(f"invalid num_pages '{num_pages}'", 'num_pages')
+    description = row['description'].strip() if row['description'] else ''
+    start = time.perf_counter()
+    fields['description'] = clean_html(description) if description else ''
+    cleaned = time.perf_counter()
+    authors = parse_authors(row)
+    if timings is not None:
+        timings['html'] += cleaned - start
+        timings['authors'] += time.perf_counter() - cleaned
+    return fields, authors
+
+
+def content_hash(fields, authors):
+    """
+    Digest of a parsed row (book fields and author names), stored in
+    Book.content_hash to skip unchanged rows on the next import.
+    """
+    normalized = json.dumps([[fields[field] for field in BOOK_FIELDS], authors], ensure_ascii=False)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def row_natural_key(row):
+    """
+    book_natural_key() of a row that failed to parse, or None when the
+    row doesn't identify a book (not a record, key columns missing, no
+    title or work id).
+    """
+    if not isinstance(row, dict) or not all(field in row for field in NATURAL_KEY_FIELDS):
+        return None
+    if not (row['title'] or '').strip() and not (row['work_id'] or '').strip():
+        return None
+    return book_natural_key(row)
+
+
+def parse_rows(rows, timings=None):
+    """
+    Parse a chunk of rows (CSV records or JSON Lines lines); per row
+    (fields, authors, None) with the row's 'natural_key' and 'content_hash'
+    in the fields, or ({'title': title, 'natural_key': key or None}, None,
+    RowError).
+
+    The time spent is added to 'timings', a dict of PARSE_STAGES seconds.
+    """
+    start = time.perf_counter()
+    split = timings['html'] + timings['authors'] if timings is not None else 0
+    results = []
+    for row in rows:
+        try:
+            if isinstance(row, str):
+                row = decode_json_row(row)
+            fields, authors = parse_row(row, timings)
+            fields['natural_key'] = book_natural_key(fields)
+            fields['content_hash'] = content_hash(fields, authors)
+            results.append((fields, authors, None))
+        except KeyError as e:
+            results.append(({'title': row.get('title') or '', 'natural_key': row_natural_key(row)}, None,
+                             RowError(f"missing column {e}", 'columns')))
+        except RowError as e:
+            title = row.get('title') if isinstance(row, dict) else None
+            results.append(({'title': title or '', 'natural_key': row_natural_key(row)}, None, e))
+    if timings is not None:
+        timings['other'] += time.perf_counter() - start - (timings['html'] + timings['authors'] - split)
+    return results
+
+
+def parse_rows_timed(rows):
+    """
+    parse_rows() for a worker process: (results, PARSE_STAGES timings).
+    """
+    timings = dict.fromkeys(PARSE_STAGES, 0.0)
+    return parse_rows(rows, timings), timings
@@ -0,0 +1,81 @@
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a block of code (usually one request) runs more SQL queries
+    than it declared.
+    """
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts (and remembers) every query it sees.
+    """
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries executed on every configured database inside the block.
+
+    Unlike django.test.utils.CaptureQueriesContext this does not rely on DEBUG,
+    so it can also be used from middleware.
+    """
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+@contextmanager
+def assert_query_budget(max_queries):
+    """
+    Test helper: fail if the block runs more than 'max_queries' queries.
+
+    usage:
+        with assert_query_budget(BookViewSet.query_budget["list"]):
+            client.get("/books")
+    """
+    with count_queries() as counter:
+        yield counter
+
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(format_budget_error(max_queries, counter))
+
+
+def format_budget_error(max_queries, counter, label="block"):
+    queries = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(counter.queries, start=1))
+    return f"{label} ran {counter.count} queries, budget is {max_queries}:\n{queries}"
+
+
+def get_query_budget(view_func, method):
+    """
+    Return the query budget declared by the view for this request, or None.
+
+    Views declare budgets per action with a 'query_budget' class attribute,
+    e.g. query_budget = {"list": 3, "retrieve": 2}. For plain APIViews the
+    lowercase HTTP method is used as the action name.
+    """
+    view_class = getattr(view_func, "cls", None)
+    budget = getattr(view_class, "query_budget", None)
+    if not budget:
+        return None
+
+    method = method.lower()
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method, method)
+    return budget.get(action)
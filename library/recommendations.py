@@ -55,12 +55,16 @@ def get_books_df():
     # Create a list of dictionaries, where each dict represents a row in the DataFrame.
     book_data = []
     for book in books:
+        # Read authors from the prefetch cache; first()/exists() would query again per book
+        authors = list(book.authors.all())
+        primary_author = min(authors, key=lambda author: author.pk) if authors else None
+
         # Create a dictionary for each book containing the required fields
         book_dict = {
             'id': book.id,
             'title': book.title,
-            'authors': [author.name for author in book.authors.all()],  # Collect all author names
-            'author_name': book.authors.first().name if book.authors.exists() else None,  # Primary author name
+            'authors': [author.name for author in authors],  # Collect all author names
+            'author_name': primary_author.name if primary_author else None,  # Primary author name
             'language': book.language,
             'work_id': book.work_id,
             'edition_information': book.edition_information,
@@ -0,0 +1,140 @@
+"""
+Refresh token revocation store.
+
+Revoked JTIs live in the RevokedToken table; each process keeps an
+in-memory Bloom filter of them, so checking a token that was never
+revoked (the normal case) costs a few hash computations and no query.
+Only Bloom filter hits are confirmed against the table.
+
+The filter is synced incrementally (rows with a higher id) at most every
+REVOKED_TOKENS_SYNC_INTERVAL seconds. A token revoked by another process
+since the last sync is still rejected: rotation claims the JTI with an
+insert on the unique 'jti' column, which fails for a reused token.
+Expired rows are removed by the 'purge_revoked_tokens' command.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter of strings: no false negatives, false positives
+    at about 'error_rate' once 'capacity' items were added.
+    """
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # double hashing: k positions from one 128 bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def is_full(self):
+        return self.count > self.capacity
+
+
+class RevocationStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+            self._synced_at = None
+
+    def _new_filter(self, live_count):
+        return BloomFilter(max(settings.REVOKED_TOKENS_BLOOM_CAPACITY, live_count * 2),
+                           settings.REVOKED_TOKENS_BLOOM_ERROR_RATE)
+
+    def _load(self, queryset):
+        for pk, jti in queryset.order_by("id").values_list("id", "jti").iterator(chunk_size=5000):
+            self._filter.add(jti)
+            self._last_id = pk
+
+    def rebuild(self):
+        """
+        Reload the filter with the unexpired JTIs (drops purged entries).
+        """
+        with self._lock:
+            live = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+            self._filter = self._new_filter(live.count())
+            self._last_id = 0
+            self._load(live)
+            self._synced_at = time.monotonic()
+
+    def sync(self, force=False):
+        """
+        Add the JTIs revoked (by any process) since the last sync.
+        """
+        if self._filter is None or self._filter.is_full:
+            self.rebuild()
+            return
+        if not force and time.monotonic() - self._synced_at < settings.REVOKED_TOKENS_SYNC_INTERVAL:
+            return
+        with self._lock:
+            self._load(RevokedToken.objects.filter(id__gt=self._last_id))
+            self._synced_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self._filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """
+        Revoke 'jti'. Returns False if it was already revoked, which makes
+        this usable as an atomic "use once" claim.
+        """
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        if self._filter is not None:
+            with self._lock:
+                self._filter.add(jti)
+        return True
+
+    def revoke_token(self, token):
+        expires_at = datetime.fromtimestamp(token["exp"], tz=dt_timezone.utc)
+        return self.revoke(token["jti"], expires_at)
+
+
+def purge_expired_tokens():
+    """
+    Delete revocation rows of tokens that have expired anyway.
+    Returns the number of deleted rows.
+    """
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+revocation_store = RevocationStore()
@@ -0,0 +1,134 @@
+"""
+Read replica routing for the catalog.
+
+Safe (GET/HEAD/OPTIONS) requests read Book/Author data from an alias in
+settings.DATABASE_REPLICAS, picked at random once per request so all its
+queries see the same snapshot; everything else uses 'default'.
+Replicas lag behind the primary, so reads stay on the primary:
+
+- for a client that wrote to the catalog in the last REPLICA_LAG_SECONDS (pin cookie,
+  plus a per-user pin in the catalog cache for token clients that drop
+  cookies), so users always see their own writes;
+- for everybody in the REPLICA_LAG_SECONDS after any catalog write, so
+  stale replica data is never stored in the response cache under the new
+  catalog version.
+
+ReplicaRoutingMiddleware makes the current request visible to the router.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .cache import catalog_written_since, get_catalog_cache
+from .sharding import favorite_shard_for
+
+PIN_COOKIE = "primary_pin"
+
+CATALOG_MODELS = {"library.book", "library.author", "library.book_authors", "library.catalogchange"}
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+current_request = ContextVar("replica_routing_request", default=None)
+
+
+def user_pin_key(user_id):
+    return f"replica:pin:user:{user_id}"
+
+
+def is_pinned(request):
+    """
+    True if the request's reads must go to the primary. Evaluated on the
+    first catalog query, after DRF has authenticated the request.
+    """
+    pinned = getattr(request, "_primary_pinned", None)
+    if pinned is None:
+        user = getattr(request, "user", None)
+        pinned = (
+            PIN_COOKIE in request.COOKIES
+            or (user is not None and user.is_authenticated
+                and get_catalog_cache().get(user_pin_key(user.pk)) is not None)
+            or catalog_written_since(settings.REPLICA_LAG_SECONDS)
+        )
+        request._primary_pinned = pinned
+    return pinned
+
+
+def pin_to_primary(request, response):
+    """
+    Keep the client that just wrote on the primary until the replicas caught up.
+    """
+    response.set_cookie(PIN_COOKIE, "1", max_age=settings.REPLICA_LAG_SECONDS, httponly=True, samesite="Lax")
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        get_catalog_cache().set(user_pin_key(user.pk), 1, timeout=settings.REPLICA_LAG_SECONDS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in CATALOG_MODELS:
+            return None
+        # related objects are read from the database their instance came from
+        if hints.get("instance") is not None:
+            return None
+        request = current_request.get()
+        if request is None or request.method not in SAFE_METHODS or is_pinned(request):
+            return None
+        replica = getattr(request, "_read_replica", None)
+        if replica is None:
+            replica = request._read_replica = random.choice(replicas)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, see the 'sync_replicas' command
+        return db not in settings.DATABASE_REPLICAS
+
+
+class FavoriteShardRouter:
+    """
+    Instance based routing and migrations for sharded favorites, see
+    library.sharding. Listed before ReplicaRouter.
+    """
+    def _route(self, model, hints):
+        if not settings.FAVORITE_SHARD_DATABASES:
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        label = model._meta.label_lower
+        if label == "library.favorite":
+            if instance._meta.label_lower == "library.favorite" and instance.user_id is not None:
+                return favorite_shard_for(instance.user_id)
+            if instance._meta.label_lower == settings.AUTH_USER_MODEL.lower() and instance.pk is not None:
+                # user.favorites
+                return favorite_shard_for(instance.pk)
+        elif instance._meta.label_lower == "library.favorite":
+            # favorite.user / favorite.book live in the main database
+            return "default"
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if settings.FAVORITE_SHARD_DATABASES and "library.favorite" in (obj1._meta.label_lower,
+                                                                        obj2._meta.label_lower):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.FAVORITE_SHARD_DATABASES:
+            return app_label == "library" and model_name == "favorite"
+        # 'default' keeps an (empty) favorites table, so cascades of user/book deletes still work
+        return None
@@ -1,7 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Book, Author, Favorite
+from .models import Book, Author, Favorite, ImportJob
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .parsing import NATURAL_KEY_FIELDS, author_name_key, book_natural_key
+from .revocation import revocation_store
 
 
 # Serializers define the API representation.
@@ -42,14 +47,180 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'username', 'email', 'is_staff']
 
 
+def parse_field_list(value):
+    """
+    Parse a comma separated '?fields=' / '?omit=' value into a set of names.
+    """
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def select_fields(available, query_params):
+    """
+    Apply the '?fields=' and '?omit=' query params to a list of field names.
+    Unknown names are ignored; the order of 'available' is kept.
+    """
+    selected = list(available)
+    if query_params.get('fields'):
+        wanted = parse_field_list(query_params['fields'])
+        selected = [name for name in selected if name in wanted]
+    if query_params.get('omit'):
+        omitted = parse_field_list(query_params['omit'])
+        selected = [name for name in selected if name not in omitted]
+    return selected
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients request a subset of fields with '?fields=title,authors' or
+    drop fields with '?omit=description'. Only applied when the serializer
+    has a request in its context, i.e. when used from a view.
+
+    The fieldset only shapes the output: a serializer validating input
+    (POST/PUT/PATCH bodies) keeps every field and trims its response.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or 'data' in kwargs:
+            return
+
+        # read only: unselected fields aren't even computed
+        selected = set(select_fields(self.fields, request.query_params))
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        if request is None or not hasattr(self, 'initial_data'):
+            return data
+        selected = set(select_fields(self.fields, request.query_params))
+        return {name: value for name, value in data.items() if name in selected}
+
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Author
-        fields = '__all__'
+        exclude = ['name_key']
+
+    def validate_name(self, value):
+        """
+        Author names are unique once normalized (Author.name_key).
+        """
+        others = Author.objects.filter(name_key=author_name_key(value))
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("An author with this name already exists.")
+        return value
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     authors = AuthorSerializer(many=True, read_only=True)
 
     class Meta:
         model = Book
-        fields = '__all__'
+        exclude = ['content_hash', 'natural_key']
+
+    def validate(self, attrs):
+        """
+        Books are unique by natural key (Book.natural_key).
+        """
+        attrs = super().validate(attrs)
+        values = {field: attrs[field] if field in attrs else getattr(self.instance, field, '')
+                  for field in NATURAL_KEY_FIELDS}
+        others = Book.objects.filter(natural_key=book_natural_key(values, getattr(self.instance, 'natural_key', None)))
+        if self.instance is not None:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("A book with this title, or this work and edition, already exists.")
+        return attrs
+
+class BookListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact book representation for list views ('?compact=true'):
+    no description and authors as a list of names.
+    """
+    authors = serializers.SlugRelatedField(many=True, read_only=True, slug_field='name')
+
+    class Meta:
+        model = Book
+        fields = ['id', 'title', 'authors', 'language', 'publisher', 'num_pages',
+                  'series_name', 'series_position']
+
+
+class BulkItemSerializerMixin:
+    """
+    Item serializer for the bulk endpoints: 'id' is required when updating
+    (context['updating']) and ignored when creating.
+    """
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if self.context.get('updating'):
+            if 'id' not in attrs:
+                raise serializers.ValidationError({'id': 'This field is required for updates.'})
+        else:
+            attrs.pop('id', None)
+        return attrs
+
+
+class AuthorBulkItemSerializer(BulkItemSerializerMixin, serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Author
+        fields = ['id', 'name']
+
+
+class BookBulkItemSerializer(BulkItemSerializerMixin, serializers.ModelSerializer):
+    """
+    Bulk book item; authors are given by name and created when missing.
+    """
+    id = serializers.IntegerField(required=False)
+    authors = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+
+    class Meta:
+        model = Book
+        exclude = ['updated_at', 'content_hash', 'natural_key']
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Status and progress of a background import (library.jobs).
+    """
+    class Meta:
+        model = ImportJob
+        exclude = ['path']
+
+
+class ImportUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=ImportJob.FORMATS, required=False, default='',
+                                     help_text='Default: from the file name.')
+
+
+class RevokingTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh that rejects revoked refresh tokens and revokes the old
+    token on rotation (SIMPLE_JWT BLACKLIST_AFTER_ROTATION), using the
+    revocation store instead of the token_blacklist app.
+    """
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if revocation_store.is_revoked(refresh["jti"]):
+            raise InvalidToken("Token is blacklisted")
+
+        data = {"access": str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            # the claim fails if a concurrent request already rotated this token
+            if jwt_settings.BLACKLIST_AFTER_ROTATION and not revocation_store.revoke_token(refresh):
+                raise InvalidToken("Token is blacklisted")
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
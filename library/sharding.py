@@ -0,0 +1,136 @@
+"""
+Optional sharding of Favorite rows by user.
+
+With FAVORITE_SHARDS=N the favorites live in N separate databases
+(settings.FAVORITE_SHARD_DATABASES), user_id % N picks the shard, so all
+favorites of one user are in one shard and per-user lookups touch only
+that shard. Users and books stay in 'default'.
+
+FavoriteQuerySet routes queries filtered on a single user (and creates)
+to the user's shard and turns select_related() into prefetch_related()
+because the related tables are in another database; FavoriteShardRouter
+handles instance based routing and migrations. Queries without a user
+(e.g. the admin) only see the 'default' table; use favorite_databases()
+to go over every shard.
+
+The favorites table keeps its foreign keys to users and books in
+'default'; in the shards, which have no such tables, migrations create it
+without them (DropShardForeignKeys).
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+USER_LOOKUPS = ("user", "user_id", "user__pk", "user__id")
+
+
+def favorite_shard_for(user_id):
+    """
+    Database alias holding the favorites of 'user_id'.
+    """
+    shards = settings.FAVORITE_SHARD_DATABASES
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[int(user_id) % len(shards)]
+
+
+def favorite_databases():
+    return list(settings.FAVORITE_SHARD_DATABASES) or [DEFAULT_DB_ALIAS]
+
+
+class DropShardForeignKeys(migrations.operations.base.Operation):
+    """
+    Drops the foreign key constraints of the Favorite fields 'names' in the
+    shard databases only, which have no users and books to reference. The
+    model state and 'default' keep the constraints.
+    """
+    reversible = True
+
+    def __init__(self, model_name, names):
+        self.model_name = model_name
+        self.names = names
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {'model_name': self.model_name, 'names': self.names}
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _steps(self, app_label, state):
+        # (name, state before, state after) as the constraints go one by one,
+        # so rebuilding the table for one field keeps the others dropped
+        steps = []
+        for name in self.names:
+            field = state.models[app_label, self.model_name].fields[name].clone()
+            field.db_constraint = False
+            after = state.clone()
+            after.alter_field(app_label, self.model_name, name, field, True)
+            steps.append((name, state, after))
+            state = after
+        return steps
+
+    def _alter(self, schema_editor, app_label, name, from_state, to_state):
+        from_model = from_state.apps.get_model(app_label, self.model_name)
+        to_model = to_state.apps.get_model(app_label, self.model_name)
+        schema_editor.alter_field(from_model, from_model._meta.get_field(name), to_model._meta.get_field(name))
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.FAVORITE_SHARD_DATABASES:
+            for name, before, after in self._steps(app_label, from_state):
+                self._alter(schema_editor, app_label, name, before, after)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.alias in settings.FAVORITE_SHARD_DATABASES:
+            for name, before, after in reversed(self._steps(app_label, to_state)):
+                self._alter(schema_editor, app_label, name, after, before)
+
+    def describe(self):
+        return f"Drop the foreign key constraints of {self.model_name} {', '.join(self.names)} in the favorite shards"
+
+
+def _lookup_user_id(kwargs):
+    for lookup in USER_LOOKUPS:
+        if lookup in kwargs:
+            value = kwargs[lookup]
+            return getattr(value, "pk", value)
+    return None
+
+
+class FavoriteQuerySet(models.QuerySet):
+
+    def _sharded(self):
+        # an explicit using() always wins
+        return bool(settings.FAVORITE_SHARD_DATABASES) and self._db is None
+
+    def filter(self, *args, **kwargs):
+        queryset = super().filter(*args, **kwargs)
+        if self._sharded():
+            user_id = _lookup_user_id(kwargs)
+            if isinstance(user_id, (int, str)):
+                queryset = queryset.using(favorite_shard_for(user_id))
+        return queryset
+
+    def create(self, **kwargs):
+        if self._sharded():
+            user_id = _lookup_user_id(kwargs)
+            if user_id is not None:
+                return self.using(favorite_shard_for(user_id)).create(**kwargs)
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not self._sharded():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        by_shard = defaultdict(list)
+        for obj in objs:
+            by_shard[favorite_shard_for(obj.user_id)].append(obj)
+        for alias, shard_objs in by_shard.items():
+            self.using(alias).bulk_create(shard_objs, *args, **kwargs)
+        return objs
+
+    def select_related(self, *fields):
+        if settings.FAVORITE_SHARD_DATABASES and fields:
+            # users and books are in 'default': no joins across databases
+            return self.prefetch_related(*fields)
+        return super().select_related(*fields)
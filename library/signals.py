@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import user_cache
+
+from .cache import bump_catalog_version
+from .changes import record_change, record_changes
+from .models import Author, Book, CatalogChange, Favorite
+from .sharding import favorite_shard_for
+
+
+def touch_books(**filters):
+    """
+    Bump 'updated_at' on the matching books without loading them
+    (queryset.update() skips auto_now, so set it explicitly) and clear
+    their import content hash.
+    """
+    Book.objects.filter(**filters).update(updated_at=timezone.now(), content_hash='')
+
+
+def touch_author_books(author_ids):
+    """
+    Books nest their authors: touch the books of changed authors and log
+    them in the change feed. Returns the book ids.
+    """
+    book_ids = list(Book.objects.filter(authors__in=author_ids).values_list("pk", flat=True).distinct())
+    touch_books(pk__in=book_ids)
+    record_changes(Book, book_ids, CatalogChange.UPDATE)
+    return book_ids
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    A book's representation includes its authors, so adding/removing authors
+    modifies the book.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            touch_books(pk=instance.pk)
+            record_change(Book, instance.pk, CatalogChange.UPDATE)
+    elif action in ("post_add", "post_remove"):
+        touch_books(pk__in=pk_set)
+        record_changes(Book, pk_set, CatalogChange.UPDATE)
+    elif action == "pre_clear":
+        # author.book_set.clear(): touch the books while the through rows still exist
+        touch_author_books([instance.pk])
+
+
+@receiver(post_save, sender=Author)
+def author_saved(sender, instance, created, **kwargs):
+    """
+    Renaming an author changes every book that nests it.
+    """
+    if not created:
+        touch_author_books([instance.pk])
+
+
+@receiver(pre_delete, sender=Author)
+def author_deleted(sender, instance, **kwargs):
+    # touch before the through rows are removed by the cascade
+    touch_author_books([instance.pk])
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def record_catalog_save(sender, instance, created, **kwargs):
+    """
+    Log the write in the change feed; runs inside the save() transaction.
+    """
+    record_change(sender, instance.pk, CatalogChange.CREATE if created else CatalogChange.UPDATE)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def record_catalog_delete(sender, instance, **kwargs):
+    record_change(sender, instance.pk, CatalogChange.DELETE)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(m2m_changed, sender=Book.authors.through)
+def catalog_changed(sender, **kwargs):
+    """
+    Any catalog write invalidates the cached catalog responses.
+    """
+    if kwargs.get("action", "post_").startswith("post_"):
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    """
+    Drop the user from the authentication cache (deactivation, permission
+    flag or password changes must apply to the next request).
+    """
+    user_cache.delete(getattr(instance, jwt_settings.USER_ID_FIELD))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_from_shards(sender, instance, **kwargs):
+    """
+    Sharded favorites aren't reached by the delete cascade (which runs on
+    'default'), remove them from every shard.
+    """
+    for alias in settings.FAVORITE_SHARD_DATABASES:
+        Favorite.objects.using(alias).filter(book_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted_from_shards(sender, instance, **kwargs):
+    if settings.FAVORITE_SHARD_DATABASES:
+        Favorite.objects.using(favorite_shard_for(instance.pk)).filter(user_id=instance.pk).delete()
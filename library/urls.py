@@ -1,20 +1,47 @@
 
 from django.urls import path, include
 from rest_framework import routers
-from rest_framework_simplejwt.views import TokenRefreshView
 
-from .views import UserViewSet, BookViewSet, AuthorViewSet, RegisterView, LoginView, FavoriteViewSet
+from . import async_views
+from .views import (UserViewSet, BookViewSet, AuthorViewSet, RegisterView, LoginView, RefreshView, FavoriteViewSet,
+                    CacheStatsView, ImportJobViewSet)
 
 router = routers.DefaultRouter(trailing_slash=False)
 router.register(r'users', UserViewSet)
 router.register(r'authors', AuthorViewSet)
 router.register(r'books', BookViewSet)
 router.register(r'favorites', FavoriteViewSet, basename='favorite')
+router.register(r'imports', ImportJobViewSet)
 
 urlpatterns = [
     path('api/register', RegisterView.as_view(), name='register'),
     path('api/login', LoginView.as_view(), name='login'),
-    path('api/token/refresh', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh', RefreshView.as_view(), name='token_refresh'),
+    path('api/cache/stats', CacheStatsView.as_view(), name='cache_stats'),
 
     path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+
+# Async read views, mounted in front of the router by project/urls_async.py (ASGI).
+# GETs are served natively async, other methods go to the same DRF views as above.
+async_urlpatterns = [
+    path('books', async_views.read_view(
+        lambda request: async_views.list_view(request, BookViewSet),
+        BookViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    path('books/<int:pk>', async_views.read_view(
+        lambda request, pk: async_views.detail_view(request, BookViewSet, pk),
+        BookViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}))),
+    path('authors', async_views.read_view(
+        lambda request: async_views.list_view(request, AuthorViewSet),
+        AuthorViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    path('authors/<int:pk>', async_views.read_view(
+        lambda request, pk: async_views.detail_view(request, AuthorViewSet, pk),
+        AuthorViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}))),
+    path('favorites', async_views.read_view(
+        async_views.favorite_list,
+        FavoriteViewSet.as_view({'get': 'list', 'post': 'create'}))),
+    path('favorites/recommendations', async_views.read_view(
+        async_views.favorite_recommendations,
+        FavoriteViewSet.as_view({'get': 'recommendations'}))),
+]
@@ -1,22 +1,37 @@
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
+from django.db.models import Max, Min
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 
 from django.contrib.auth.models import User
-from rest_framework import viewsets
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
 
 from rest_framework import status, filters
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 
-from .models import Book, Author, Favorite
-from .serializers import UserSerializer, BookSerializer, AuthorSerializer, UserRegistrationSerializer
+from .models import Book, Author, Favorite, ImportJob
+from .serializers import (UserSerializer, BookSerializer, BookListSerializer, AuthorSerializer, UserRegistrationSerializer,
+                          BookBulkItemSerializer, AuthorBulkItemSerializer, RevokingTokenRefreshSerializer,
+                          ImportJobSerializer, ImportUploadSerializer)
 from .permissions import IsAuthenticatedForWriteActions, IsAdminOrSelf
-from .authentication import JWTAuthenticationForWriteActions
+from .authentication import CachedJWTAuthentication, JWTAuthenticationForWriteActions
 from .recommendations import recommend_books
+from .conditional import ConditionalGetMixin
+from .cache import CachedResponseMixin, get_cache_stats
+from .export import EXPORT_CONTENT_TYPES, export_queryset, stream_export
+from .changes import CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, get_changes, latest_change_token, parse_change_token
+from .favorites import MAX_FAVORITES, FavoriteLimitExceeded, update_favorites
+from .bulk import (BulkWriteMixin, bulk_create_books, bulk_update_books, bulk_create_authors, bulk_update_authors,
+                   check_author_names, check_book_keys)
+from .parsing import author_name_key
+from .jobs import store_upload
 
 # Create your views here.
 # ViewSets define the view behavior.
@@ -34,12 +49,31 @@ class RegisterView(APIView):
 class LoginView(TokenObtainPairView):
     permission_classes = [AllowAny]
 
+class RefreshView(TokenRefreshView):
+    """
+    Refresh with rotation; rotated refresh tokens are revoked (see library.revocation).
+    """
+    permission_classes = [AllowAny]
+    serializer_class = RevokingTokenRefreshSerializer
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss counters of the catalog response cache (admin only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_cache_stats())
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     http_method_names = ["get"]
     permission_classes = [IsAdminOrSelf]
 
+    # max SQL queries per action, checked by QueryBudgetMiddleware in DEBUG
+    query_budget = {"list": 3, "retrieve": 2}
+
     def get_queryset(self):
         """
         Restrict queryset to:
@@ -51,11 +85,18 @@ class UserViewSet(viewsets.ModelViewSet):
         return super().get_queryset()
 
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(CachedResponseMixin, ConditionalGetMixin, BulkWriteMixin, viewsets.ModelViewSet):
+    # prefetch authors so nested AuthorSerializer doesn't run one query per book
+    queryset = Book.objects.prefetch_related('authors')
     serializer_class = BookSerializer
     http_method_names = ["get", "post", "put", "patch", "delete"]
 
+    # etag aggregate + count + books + authors for list; etag + book + authors for retrieve
+    query_budget = {"list": 4, "retrieve": 3, "batch": 2, "changes": 4}
+
+    # max number of ids for '?ids=' and POST /books/batch
+    batch_max_ids = 1000
+
     # cuustom authentication and permission
     authentication_classes = [JWTAuthenticationForWriteActions]
     permission_classes = [IsAuthenticatedForWriteActions]
@@ -66,22 +107,194 @@ class BookViewSet(viewsets.ModelViewSet):
     # Specify fields to search: "title" (Book's field) and "authors__name" (related Author model's field)
     search_fields = ['title', 'authors__name']
 
-class AuthorViewSet(viewsets.ModelViewSet):
+    bulk_item_serializer_class = BookBulkItemSerializer
+
+    def validate_bulk_items(self, items, existing=None):
+        return check_book_keys(items, existing)
+
+    def perform_bulk_create(self, items):
+        return bulk_create_books(items)
+
+    def perform_bulk_update(self, items, existing):
+        return bulk_update_books(items, existing)
+
+    def get_requested_ids(self):
+        """
+        Parse '?ids=1,2,3'; returns None if the param is absent.
+        """
+        raw = self.request.query_params.get("ids")
+        if raw is None:
+            return None
+        try:
+            ids = [int(pk) for pk in raw.split(",") if pk.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'Expected a comma separated list of integers'})
+        return ids
+
+    def batch_response(self, ids):
+        """
+        Return the requested books in the requested order with one query
+        (plus the authors prefetch); unknown ids are listed in 'missing'.
+        """
+        if len(ids) > self.batch_max_ids:
+            raise ValidationError({'ids': f'Cannot request more than {self.batch_max_ids} ids at once'})
+
+        ids = list(dict.fromkeys(ids))  # drop duplicates, keep order
+        books = {book.id: book for book in self.get_queryset().filter(id__in=ids)}
+        serializer = self.get_serializer([books[pk] for pk in ids if pk in books], many=True)
+        return Response({
+            'count': len(books),
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in books],
+        })
+
+    def list(self, request, *args, **kwargs):
+        ids = self.get_requested_ids()
+        if ids is not None:
+            return self.batch_response(ids)
+        return super().list(request, *args, **kwargs)
+
+    # a read like GET /books, so no authentication is required
+    @action(detail=False, methods=["post"], authentication_classes=[], permission_classes=[AllowAny])
+    def batch(self, request):
+        """
+        POST variant of GET /books?ids=... for long id lists.
+
+        @Param ids: list of book ids in request body
+        """
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            return Response({'error': "Expected 'ids': a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.batch_response(ids)
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Incremental sync: book and author changes recorded after 'since'.
+
+        @Param since: 'next_token' of the previous call (or the X-Change-Token of an export)
+        @Param limit: max number of change log rows to read; default 500
+        """
+        try:
+            since = parse_change_token(request.query_params.get("since", "0"))
+            limit = int(request.query_params.get("limit", CHANGES_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'since and limit must be non-negative integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, CHANGES_MAX_PAGE_SIZE))
+        return Response(get_changes(since, limit, context=self.get_serializer_context()))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream the whole catalog (or an id range of it) as NDJSON or CSV.
+
+        @Param output: 'ndjson' (default) or 'csv'
+        @Param min_id, max_id: optional inclusive id range; rows are ordered by id,
+            so a failed download can be resumed with min_id=<last id + 1>
+        """
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_CONTENT_TYPES:
+            return Response({'error': f"output must be one of: {', '.join(EXPORT_CONTENT_TYPES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_id = int(request.query_params["min_id"]) if request.query_params.get("min_id") else None
+            max_id = int(request.query_params["max_id"]) if request.query_params.get("max_id") else None
+        except ValueError:
+            return Response({'error': 'min_id and max_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # id bounds of the selected range help consumers split it into parallel slices
+        bounds = export_queryset(min_id, max_id).order_by().aggregate(min_id=Min("id"), max_id=Max("id"))
+
+        response = StreamingHttpResponse(stream_export(output, min_id, max_id),
+                                         content_type=EXPORT_CONTENT_TYPES[output])
+        response["Content-Disposition"] = f'attachment; filename="books.{output}"'
+        response["X-Export-Min-Id"] = bounds["min_id"] if bounds["min_id"] is not None else ""
+        response["X-Export-Max-Id"] = bounds["max_id"] if bounds["max_id"] is not None else ""
+        # changes after this token are not guaranteed to be in the export; sync them with /books/changes
+        response["X-Change-Token"] = latest_change_token()
+        return response
+
+    def get_serializer_class(self):
+        """
+        Use the compact serializer for '?compact=true' list requests.
+        """
+        if self.action == "list" and self.request.query_params.get("compact", "").lower() in ("1", "true", "yes"):
+            return BookListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """
+        For reads, only load the columns the serializer will output, so
+        omitted fields (typically 'description') are deferred in the ORM
+        and authors are not prefetched unless they are rendered.
+        """
+        queryset = super().get_queryset()
+        # POST /books/batch is a read too
+        if self.request.method != "GET" and self.action != "batch":
+            return queryset
+
+        if self.action == "list":
+            ids = self.get_requested_ids()
+            if ids is not None:
+                queryset = queryset.filter(id__in=ids)
+            # '?author=<name>': exact author, through the unique name key index (no join on a LIKE)
+            author = self.request.query_params.get("author")
+            if author is not None:
+                queryset = queryset.filter(authors__name_key=author_name_key(author))
+
+        rendered = set(self.get_serializer().fields)
+        columns = [field.attname for field in Book._meta.concrete_fields if field.name in rendered]
+        queryset = queryset.only("id", *columns)
+        if "authors" not in rendered:
+            queryset = queryset.prefetch_related(None)
+        return queryset
+
+class AuthorViewSet(CachedResponseMixin, ConditionalGetMixin, BulkWriteMixin, viewsets.ModelViewSet):
     queryset = Author.objects.all()
     serializer_class = AuthorSerializer
     http_method_names = ["get", "post", "put", "patch", "delete"]
     authentication_classes = [JWTAuthenticationForWriteActions]
     permission_classes = [IsAuthenticatedForWriteActions]
+    query_budget = {"list": 3, "retrieve": 2}
+
+    bulk_item_serializer_class = AuthorBulkItemSerializer
+
+    def get_queryset(self):
+        """
+        '?name=<name>' looks an author up by its normalized name.
+        """
+        queryset = super().get_queryset()
+        name = self.request.query_params.get("name")
+        if self.action == "list" and name is not None:
+            queryset = queryset.filter(name_key=author_name_key(name))
+        return queryset
+
+    def validate_bulk_items(self, items, existing=None):
+        return check_author_names(items, existing)
+
+    def perform_bulk_create(self, items):
+        return bulk_create_authors(items)
+
+    def perform_bulk_update(self, items, existing):
+        return bulk_update_authors(items, existing)
+
 
 class FavoriteViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     http_method_names = ["get", "post", "delete"]
 
+    # user lookup (skipped while the user is cached) + favorites joined with books + authors
+    query_budget = {"list": 3}
 
     def list(self, request):
-        # Get all favorite books for the user
-        favorites = Favorite.objects.filter(user=request.user)
+        # Get all favorite books for the user; join books and prefetch their authors up front
+        favorites = (
+            Favorite.objects.filter(user=request.user)
+            .select_related('book')
+            .prefetch_related('book__authors')
+        )
         serializer = BookSerializer([fav.book for fav in favorites], many=True) # use book serializer
         return Response(serializer.data)
 
@@ -98,11 +311,12 @@ class FavoriteViewSet(viewsets.ViewSet):
         except Book.DoesNotExist:
             return Response({'error': 'Book not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        if Favorite.objects.filter(user=request.user).count() >= 20:
-            return Response({'error': 'Cannot add more than 20 favorites'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            added, _ = update_favorites(request.user, add=[book.id])
+        except FavoriteLimitExceeded as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        favorite, created = Favorite.objects.get_or_create(user=request.user, book=book)
-        if created:
+        if added:
             # Return recommendations when a new favorite is added
             recommendations = recommend_books(request.user)
             return Response({
@@ -111,6 +325,59 @@ class FavoriteViewSet(viewsets.ViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response({'message': 'Book already in favorites'}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Add and/or remove several favorites at once; recommendations are
+        computed once for the final list.
+
+        @Param add: list of book ids to add, in request body
+        @Param remove: list of book ids to remove, in request body
+        """
+        if not isinstance(request.data, dict):
+            return Response({'error': "Expected an object with 'add' and/or 'remove'"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        add = request.data.get('add', [])
+        remove = request.data.get('remove', [])
+        for ids in (add, remove):
+            # bool is an int subclass, true is not a book id
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                return Response({'error': "'add' and 'remove' must be lists of book ids"},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if len(set(add)) > MAX_FAVORITES:
+            return Response({'error': f'Cannot add more than {MAX_FAVORITES} favorites'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # validate all books with one query
+        found = set(Book.objects.filter(id__in=add).values_list('id', flat=True))
+        missing = [pk for pk in add if pk not in found]
+        if missing:
+            return Response({'error': 'Book not found', 'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            added, removed = update_favorites(request.user, add=add, remove=remove)
+        except FavoriteLimitExceeded as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'added': added,
+            'removed': removed,
+            'recommendations': recommend_books(request.user) if added or removed else [],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def recommendations(self, request):
+        """
+        Recommendations for the user's current favorites.
+
+        @Param top_n: number of recommendations, default 5
+        """
+        try:
+            top_n = int(request.query_params.get('top_n', 5))
+        except ValueError:
+            return Response({'error': 'top_n must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'recommendations': recommend_books(request.user, top_n=top_n)})
+
     def destroy(self, request, pk=None):
         """
         Delete view function.
@@ -124,3 +391,27 @@ class FavoriteViewSet(viewsets.ViewSet):
             return Response({'message': 'Book removed from favorites'}, status=status.HTTP_200_OK)
         except Favorite.DoesNotExist:
             return Response({'error': 'Favorite book not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class ImportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """
+    Background catalog imports (admin only), see library.jobs.
+
+    POST /imports with a multipart 'file' (.csv, .jsonl, optionally .gz or
+    .bz2) and an optional 'format' queues the import and answers 202 with
+    the job; GET /imports/:id reports its status and progress.
+    """
+    queryset = ImportJob.objects.order_by('-id')
+    serializer_class = ImportJobSerializer
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def create(self, request):
+        # stream the file to a temporary file on disk, whatever its size
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+        upload = ImportUploadSerializer(data=request.data)
+        upload.is_valid(raise_exception=True)
+        job = store_upload(upload.validated_data['file'], user=request.user,
+                           input_format=upload.validated_data['format'])
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -58,7 +59,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'project.urls'
+# Count SQL queries per request and check them against the views' declared 'query_budget'.
+# Debug only; raise instead of logging so regressions fail loudly in development and tests.
+if DEBUG:
+    MIDDLEWARE.append('library.middleware.QueryBudgetMiddleware')
+
+QUERY_BUDGET_RAISE = DEBUG
+
+# Serve the read endpoints with native async views; enabled by project/asgi.py
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
+
+ROOT_URLCONF = 'project.urls_async' if ASYNC_READ_VIEWS else 'project.urls'
 
 TEMPLATES = [
     {
@@ -89,6 +100,128 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile (DATABASE_PROFILE=production), applied to every SQLite alias:
+# - WAL: readers don't block the writer and vice versa; synchronous=NORMAL is safe with WAL
+#   (a power loss can drop the last commits, never corrupt the file).
+# - mmap_size/cache_size: 256MB memory mapped reads, 64MB page cache per connection.
+# - busy_timeout: wait up to 5s for the write lock instead of failing with "database is locked".
+# - IMMEDIATE transactions take the write lock at BEGIN, so two writers can't both start reading
+#   and then deadlock when upgrading to a write (which fails immediately, without waiting).
+# - Persistent connections (CONN_MAX_AGE) skip reopening the file and re-running the pragmas per
+#   request, health checks drop broken ones. Meant for WSGI workers (threads keep their connection).
+# Compare with 'python manage.py bench_sqlite'.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+
+SQLITE_PRODUCTION_PROFILE = {
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA cache_size=-65536;'
+            'PRAGMA busy_timeout=5000;'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 5,
+    },
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+
+# Read replicas for the catalog (library.routers.ReplicaRouter): aliases in DATABASES that
+# safe catalog reads are spread over. REPLICA_DB_FILES="replica1.sqlite3,replica2.sqlite3"
+# adds SQLite copies of the primary for local testing, refreshed with 'python manage.py sync_replicas';
+# for Postgres add the replica aliases to DATABASES and list them here.
+# Reads go to the primary for REPLICA_LAG_SECONDS after a catalog write, and for that long after
+# a client's own write.
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get('REPLICA_DB_FILES', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+REPLICA_LAG_SECONDS = int(os.environ.get('REPLICA_LAG_SECONDS', 5))
+
+# GET /books/changes pages by change id (library.changes.get_changes). With SQLite ids commit in
+# order; on databases with concurrent writers hold back changes younger than this many seconds,
+# so a slower transaction's lower id can't be skipped.
+CHANGES_SAFETY_LAG_SECONDS = int(os.environ.get('CHANGES_SAFETY_LAG_SECONDS', 0))
+
+# Favorite shards (library.sharding): FAVORITE_SHARDS=N stores favorites in N SQLite files
+# favorites_<i>.sqlite3, picked by user_id % N. Create them with
+# 'python manage.py migrate --database favorites_<i>' and move existing rows with 'shard_favorites'.
+# Changing N needs the rows moved again.
+FAVORITE_SHARD_DATABASES = []
+for index in range(int(os.environ.get('FAVORITE_SHARDS', 0))):
+    DATABASES[f'favorites_{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'favorites_{index}.sqlite3',
+    }
+    FAVORITE_SHARD_DATABASES.append(f'favorites_{index}')
+
+if DATABASE_PROFILE == 'production':
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database.update(SQLITE_PRODUCTION_PROFILE)
+
+DATABASE_ROUTERS = []
+if FAVORITE_SHARD_DATABASES:
+    DATABASE_ROUTERS.append('library.routers.FavoriteShardRouter')
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS.append('library.routers.ReplicaRouter')
+    MIDDLEWARE.append('library.middleware.ReplicaRoutingMiddleware')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# 'catalog' holds cached anonymous GET responses for /books and /authors.
+# 'locmem' is per process; use 'file' to share entries and invalidation between worker processes.
+
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'locmem')
+CATALOG_CACHE_TIMEOUT = 300  # seconds
+
+CATALOG_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CATALOG_CACHE_DIR', str(BASE_DIR / 'cache' / 'catalog')),
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    CATALOG_CACHE_ALIAS: {
+        **CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+        'TIMEOUT': CATALOG_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+
+# Max number of recommendation computations running at once for the async views
+RECOMMENDATION_WORKERS = int(os.environ.get('RECOMMENDATION_WORKERS', 2))
+
+
+# Background imports (library.jobs): files uploaded to /imports are streamed to IMPORT_UPLOAD_DIR and
+# loaded by 'python manage.py run_import_worker', committing (and reporting progress) every
+# IMPORT_JOB_COMMIT_EVERY rows. A running job without progress for IMPORT_JOB_STALE_SECONDS is
+# considered dead and requeued; it resumes from its last committed chunk.
+IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR', str(BASE_DIR / 'imports'))
+IMPORT_JOB_COMMIT_EVERY = 10_000
+IMPORT_JOB_STALE_SECONDS = 600
+IMPORT_WORKER_POLL_SECONDS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -140,7 +273,7 @@ REST_FRAMEWORK = {
          'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'library.authentication.CachedJWTAuthentication',
     ),
 
     # add filter backends for search functionality
@@ -159,4 +292,18 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
-}
\ No newline at end of file
+}
+
+# In-process cache of the users resolved from access tokens (library.authentication.CachedJWTAuthentication).
+# Invalidated on user save/delete in this process; other processes pick up changes after the timeout.
+# 0 disables the cache. Fields not listed are deferred and loaded on first access.
+JWT_USER_CACHE_TIMEOUT = int(os.environ.get('JWT_USER_CACHE_TIMEOUT', 30))
+JWT_USER_CACHE_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+# Refresh token revocation (library.revocation): rotated refresh tokens are stored in RevokedToken
+# and checked through an in-memory Bloom filter, synced from the table every SYNC_INTERVAL seconds.
+# The filter is sized for CAPACITY tokens (about 180KB at the defaults) and rebuilt larger when full.
+# Purge expired rows periodically with 'python manage.py purge_revoked_tokens'.
+REVOKED_TOKENS_BLOOM_CAPACITY = 100_000
+REVOKED_TOKENS_BLOOM_ERROR_RATE = 0.001
+REVOKED_TOKENS_SYNC_INTERVAL = 10
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""
+URL configuration used under ASGI (settings.ASYNC_READ_VIEWS): the async
+read views take precedence over the DRF router for the catalog and
+favorites read endpoints.
+"""
+from django.urls import path, include
+
+from library.urls import async_urlpatterns
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('', include(async_urlpatterns)),
+] + sync_urlpatterns
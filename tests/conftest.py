@@ -1,7 +1,22 @@
 import pytest
+from django.core.cache import caches
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
+from library.authentication import user_cache
 from library.models import Author, Book
+from library.revocation import revocation_store
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Cached responses must not leak between tests (the DB is rolled back, caches are not).
+    """
+    for cache in caches.all():
+        cache.clear()
+    user_cache.clear()
+    revocation_store.reset()
+    yield
+
 
 @pytest.fixture
 def create_user(db):
@@ -0,0 +1,623 @@
+import ast
+import bz2
+import csv
+import gzip
+import io
+import json
+import os
+
+import pytest
+from datetime import timedelta
+
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from library.importer import BulkBookLoader, load_books_bulk
+from library.models import Author, Book, CatalogChange, ImportCheckpoint, ImportJob
+from library.parsing import PARSE_STAGES, RowError, clean_html, parse_authors_list, parse_rows
+
+CSV_COLUMNS = ['title', 'authors', 'author_name', 'language', 'work_id', 'edition_information', 'publisher',
+               'num_pages', 'series_id', 'series_name', 'series_position', 'description']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({column: row.get(column, '') for column in CSV_COLUMNS})
+    return str(path)
+
+
+def book_row(title, author_name='', authors='', **fields):
+    return {'title': title, 'author_name': author_name, 'authors': authors, 'language': 'eng', **fields}
+
+
+@pytest.fixture
+def books_csv(tmp_path):
+    return write_csv(tmp_path / 'books.csv', [
+        book_row('Book A', author_name='Solo Author', num_pages='120', description='<p>Some <i>text</i></p>'),
+        book_row('Book B', authors="[{'id': '1', 'name': 'First'}, {'id': '2', 'name': 'Second'}]"),
+        book_row('Book C', author_name='Solo Author'),
+        book_row('No Authors'),
+        book_row('Bad Pages', author_name='Solo Author', num_pages='many'),
+    ])
+
+
+def load(path, *args):
+    out, err = io.StringIO(), io.StringIO()
+    call_command('load_books', path, *args, stdout=out, stderr=err)
+    return out.getvalue(), err.getvalue()
+
+
+@pytest.mark.django_db
+class TestLoadBooksBulk:
+
+    def test_creates_books_and_authors(self, books_csv):
+        out, err = load(books_csv, '--bulk', '--batch-size', '2')
+        assert 'created:3, updated:0, errors:2' in out
+        assert 'rows/s' in out
+        assert "No Authors" in err and "Bad Pages" in err
+
+        book_a = Book.objects.get(title='Book A')
+        assert book_a.num_pages == 120
+        assert book_a.description == 'Some text'
+        assert list(Book.objects.get(title='Book B').authors.values_list('name', flat=True).order_by('name')) == \
+            ['First', 'Second']
+        # one author row per name, shared between books
+        assert Author.objects.filter(name='Solo Author').count() == 1
+        assert Book.objects.get(title='Book C').authors.get().name == 'Solo Author'
+        assert CatalogChange.objects.filter(model=CatalogChange.BOOK, action=CatalogChange.CREATE).count() == 3
+
+    def test_reload_updates_in_place(self, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        book_id = Book.objects.get(title='Book B').id
+        path = write_csv(tmp_path / 'update.csv', [
+            book_row('Book B', author_name='Third', publisher='New Publisher'),
+        ])
+        out, _ = load(path, '--bulk')
+        assert 'created:0, updated:1' in out
+        book = Book.objects.get(title='Book B')
+        assert book.id == book_id
+        assert book.publisher == 'New Publisher'
+        assert list(book.authors.values_list('name', flat=True)) == ['Third']
+        assert Book.objects.count() == 3
+
+    def test_same_result_as_row_by_row(self, tmp_path, books_csv):
+        load(books_csv)
+        row_by_row = sorted(
+            (book.title, book.description, book.num_pages, sorted(a.name for a in book.authors.all()))
+            for book in Book.objects.prefetch_related('authors'))
+        Book.objects.all().delete()
+        load(books_csv, '--bulk')
+        bulk = sorted(
+            (book.title, book.description, book.num_pages, sorted(a.name for a in book.authors.all()))
+            for book in Book.objects.prefetch_related('authors'))
+        assert bulk == row_by_row
+
+    def test_parallel_parsing(self, books_csv):
+        out, err = load(books_csv, '--bulk', '--workers', '2')
+        assert 'created:3, updated:0, errors:2' in out
+        assert Book.objects.get(title='Book A').description == 'Some text'
+
+
+def test_clean_html():
+    plain = 'No markup here'
+    assert clean_html(plain) is plain
+    assert clean_html('Tom &amp; Jerry') == 'Tom & Jerry'
+    assert clean_html('<b>bold</b> move') == 'bold move'
+
+
+class TestParseAuthorsList:
+
+    @pytest.mark.parametrize('text', [
+        "[{'id': '731', 'name': 'Bill Phillips', 'role': ''}, {'id': '15276', 'name': \"Michael D'Orso\", 'role': ''}]",
+        "[{'name': 'Mtetwa \"Tet\" Ramdoo'}, {'name': 'It\\'s {braced}, [bracketed]: yes'}]",
+        "[{'name': 'Caf\\xe9'}]",
+        "[]",
+        " [ { 'name' : 'Spaced' , } , ] ",
+        "[{'id': 1, 'name': 'Numeric id'}]",
+    ])
+    def test_same_as_literal_eval(self, text):
+        assert parse_authors_list(text) == ast.literal_eval(text)
+
+    @pytest.mark.parametrize('text', [
+        "[{'name': 'Unclosed'}",
+        "__import__('os').system('exit 1')",
+        "[{'name': 'x'}, 'not a dict']",
+        "{'name': 'not a list'}",
+    ])
+    def test_malformed(self, text):
+        with pytest.raises(RowError) as excinfo:
+            parse_authors_list(text)
+        assert excinfo.value.field == 'authors'
+
+    def test_benchmark_never_evaluates_values(self, tmp_path):
+        marker = tmp_path / 'evaluated'
+        path = write_csv(tmp_path / 'books.csv', [
+            book_row('Book A', authors="[{'id': '1', 'name': 'First'}, {'id': '2', 'name': 'Second'}]"),
+            book_row('Book B', authors=f"open({str(marker)!r}, 'w')"),
+        ])
+        out = io.StringIO()
+        call_command('bench_authors', path, '--repeat', '1', stdout=out)
+        assert not marker.exists()
+        assert '[eval]' not in out.getvalue() and '[literal_eval]' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestLoadBooksErrors:
+
+    @pytest.fixture
+    def bad_csv(self, tmp_path):
+        return write_csv(tmp_path / 'bad.csv', [
+            book_row('Good', author_name='Solo Author'),
+            book_row('Code', authors="__import__('os').getcwd()"),
+            book_row('Broken', authors="[{'name': 'Unclosed'}"),
+            book_row('No Authors'),
+            book_row('Bad Pages', author_name='Solo Author', num_pages='many'),
+        ])
+
+    def test_bulk_counts_errors_by_field(self, bad_csv):
+        out, err = load(bad_csv, '--bulk')
+        assert 'created:1, updated:0, errors:4' in out
+        assert 'errors by field== authors:3, num_pages:1' in out
+        assert 'Code' in err and 'Broken' in err
+
+    def test_row_by_row_counts_errors(self, bad_csv, monkeypatch):
+        def no_eval(*args):
+            raise AssertionError("eval() called")
+
+        monkeypatch.setattr('builtins.eval', no_eval)
+        out, err = load(bad_csv)
+        assert 'created:1, updated:0, errors:4' in out
+        assert "Failed to process authors for book 'Code'" in err
+
+
+@pytest.mark.django_db
+class TestLoadBooksResume:
+
+    @pytest.fixture
+    def large_csv(self, tmp_path):
+        return write_csv(tmp_path / 'large.csv', [
+            book_row(f'Book {i}', author_name=f'Author {i % 3}', description=f'Line one\nline two of {i}')
+            for i in range(10)
+        ])
+
+    def test_chunked_load_records_checkpoint(self, large_csv):
+        out, _ = load(large_csv, '--bulk', '--commit-every', '3', '--batch-size', '2')
+        assert 'created:10' in out
+        checkpoint = ImportCheckpoint.objects.get()
+        assert checkpoint.completed
+        assert checkpoint.rows == 10
+        assert checkpoint.byte_offset == os.path.getsize(large_csv)
+
+    def test_resume_after_failure(self, monkeypatch, large_csv):
+        write_batch = BulkBookLoader.write_batch
+        calls = []
+
+        def failing_write_batch(self, batch):
+            calls.append(len(batch))
+            if len(calls) == 3:
+                raise RuntimeError("connection lost")
+            return write_batch(self, batch)
+
+        monkeypatch.setattr(BulkBookLoader, 'write_batch', failing_write_batch)
+        with pytest.raises(RuntimeError):
+            load(large_csv, '--bulk', '--commit-every', '4', '--batch-size', '2')
+        # the first chunk (4 rows, 2 batches) was committed
+        assert Book.objects.count() == 4
+        checkpoint = ImportCheckpoint.objects.get()
+        assert (checkpoint.rows, checkpoint.completed) == (4, False)
+
+        monkeypatch.setattr(BulkBookLoader, 'write_batch', write_batch)
+        out, _ = load(large_csv, '--bulk', '--commit-every', '4', '--batch-size', '2', '--resume')
+        assert 'resumed after row 4' in out
+        assert 'created:10, updated:0' in out
+        assert sorted(Book.objects.values_list('title', flat=True)) == sorted(f'Book {i}' for i in range(10))
+        assert Book.objects.get(title='Book 7').description == 'Line one\nline two of 7'
+
+        # a completed load isn't repeated
+        out, _ = load(large_csv, '--bulk', '--commit-every', '4', '--resume')
+        assert Book.objects.count() == 10
+        assert CatalogChange.objects.filter(action=CatalogChange.UPDATE).count() == 0
+
+    def test_resume_needs_commit_every(self, large_csv):
+        with pytest.raises(CommandError):
+            load(large_csv, '--bulk', '--resume')
+
+
+@pytest.mark.django_db
+class TestLoadBooksDelta:
+
+    def test_unchanged_rows_are_skipped(self, tmp_path, books_csv, django_assert_max_num_queries):
+        load(books_csv, '--bulk')
+        book_a = Book.objects.get(title='Book A')
+        changes = CatalogChange.objects.count()
+
+        out, _ = load(books_csv, '--bulk')
+        assert 'created:0, updated:0, errors:2, unchanged:3' in out
+        assert Book.objects.get(title='Book A').updated_at == book_a.updated_at
+        assert CatalogChange.objects.count() == changes
+
+        # one query to compare the hashes of a batch, no writes
+        with django_assert_max_num_queries(4):
+            load(books_csv, '--bulk')
+
+    def test_changed_rows_are_written(self, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        changed_ids = tmp_path / 'changed.json'
+        path = write_csv(tmp_path / 'nightly.csv', [
+            book_row('Book A', author_name='Solo Author', num_pages='120', description='<p>Some <i>text</i></p>'),
+            book_row('Book B', authors="[{'id': '1', 'name': 'First'}, {'id': '3', 'name': 'Third'}]"),
+            book_row('Book C', author_name='Solo Author', publisher='New Publisher'),
+            book_row('Book D', author_name='Solo Author'),
+        ])
+        out, _ = load(path, '--bulk', '--changed-ids', str(changed_ids))
+        assert 'created:1, updated:2, errors:0, unchanged:1, deleted:0' in out
+        assert list(Book.objects.get(title='Book B').authors.values_list('name', flat=True).order_by('name')) == \
+            ['First', 'Third']
+        assert Book.objects.get(title='Book C').publisher == 'New Publisher'
+        ids = dict(Book.objects.values_list('title', 'id'))
+        assert json.loads(changed_ids.read_text()) == {
+            'created': [ids['Book D']],
+            'updated': [ids['Book B'], ids['Book C']],
+            'deleted': [],
+        }
+
+    def test_book_repeated_across_batches(self, tmp_path):
+        path = write_csv(tmp_path / 'repeated.csv', [
+            book_row('Book A', author_name='Solo Author', work_id='1', description='first'),
+            book_row('Book B', author_name='Solo Author'),
+            book_row('Book C', author_name='Solo Author'),
+            book_row('Book A, reissued', author_name='Solo Author', work_id='1', description='last'),
+        ])
+        out, _ = load(path, '--bulk', '--batch-size', '2')
+        assert 'created:3, updated:0, errors:0, unchanged:0, deleted:0, superseded:1' in out
+        assert Book.objects.get(work_id='1').description == 'last'
+
+        changed_ids = tmp_path / 'changed.json'
+        changes = CatalogChange.objects.count()
+        out, _ = load(path, '--bulk', '--batch-size', '2', '--changed-ids', str(changed_ids))
+        assert 'created:0, updated:0, errors:0, unchanged:3' in out
+        assert json.loads(changed_ids.read_text()) == {'created': [], 'updated': [], 'deleted': []}
+        assert CatalogChange.objects.count() == changes
+
+    def test_changed_ids_are_listed_once(self, monkeypatch, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        path = write_csv(tmp_path / 'repeated.csv', [
+            book_row('Book A', author_name='Solo Author', description='changed'),
+            book_row('Book B', author_name='Solo Author'),
+            book_row('Book A', author_name='Solo Author', description='changed again'),
+        ])
+        changed_ids = tmp_path / 'changed.json'
+        with open(path, 'rb') as file:
+            monkeypatch.setattr('sys.stdin', io.TextIOWrapper(io.BytesIO(file.read())))
+        # stdin: no first pass, Book A is written by two batches
+        out, _ = load('-', '--bulk', '--batch-size', '1', '--changed-ids', str(changed_ids))
+        assert 'updated:3' in out
+        ids = dict(Book.objects.values_list('title', 'id'))
+        assert json.loads(changed_ids.read_text())['updated'] == [ids['Book A'], ids['Book B']]
+
+    def test_other_writes_clear_the_hash(self, books_csv):
+        load(books_csv, '--bulk')
+        book = Book.objects.get(title='Book C')
+        assert book.content_hash
+        book.publisher = 'Edited'
+        book.save()
+        assert Book.objects.get(pk=book.pk).content_hash == ''
+
+        # the import restores the file's version
+        out, _ = load(books_csv, '--bulk')
+        assert 'updated:1' in out
+        assert Book.objects.get(pk=book.pk).publisher == ''
+
+    def test_delete_missing(self, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        kept = Book.objects.create(title='Bad Pages')
+        changed_ids = tmp_path / 'changed.json'
+        path = write_csv(tmp_path / 'nightly.csv', [
+            book_row('Book A', author_name='Solo Author', num_pages='120', description='<p>Some <i>text</i></p>'),
+            book_row('Bad Pages', author_name='Solo Author', num_pages='many'),
+        ])
+        book_ids = dict(Book.objects.values_list('title', 'id'))
+
+        out, _ = load(path, '--bulk', '--delete-missing', '--changed-ids', str(changed_ids))
+        assert 'unchanged:1, deleted:2' in out
+        # a row with errors doesn't delete its book
+        assert sorted(Book.objects.values_list('title', flat=True)) == ['Bad Pages', 'Book A']
+        assert Book.objects.filter(pk=kept.pk).exists()
+        assert sorted(json.loads(changed_ids.read_text())['deleted']) == sorted([book_ids['Book B'], book_ids['Book C']])
+        assert CatalogChange.objects.filter(action=CatalogChange.DELETE).count() == 2
+
+    def test_delete_missing_keeps_editions_by_key(self, tmp_path):
+        path = write_csv(tmp_path / 'editions.csv', [
+            book_row('Dune', author_name='Frank Herbert', work_id='1', publisher='Ace'),
+            book_row('Dune', author_name='Frank Herbert', work_id='1', publisher='Chilton'),
+        ])
+        load(path, '--bulk')
+        path = write_csv(tmp_path / 'nightly.csv', [
+            book_row('Dune', author_name='Frank Herbert', work_id='1', publisher='Ace', num_pages='many'),
+        ])
+        out, _ = load(path, '--bulk', '--delete-missing')
+        assert 'errors:1, unchanged:0, deleted:1' in out
+        # only the edition of the bad row is kept, not every book titled like it
+        assert list(Book.objects.values_list('publisher', flat=True)) == ['Ace']
+
+    def test_delete_missing_refused_for_unidentified_rows(self, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        path = write_csv(tmp_path / 'nightly.csv', [
+            book_row('Book A', author_name='Solo Author', num_pages='120', description='<p>Some <i>text</i></p>'),
+            book_row('', author_name='Solo Author'),
+        ])
+        out, err = load(path, '--bulk', '--delete-missing')
+        assert 'deleted:0' in out and '--delete-missing skipped' in out
+        assert "don't identify their book" in err
+        assert Book.objects.count() == 3
+
+    def test_delete_missing_needs_a_full_run(self, books_csv):
+        with pytest.raises(CommandError):
+            load(books_csv, '--bulk', '--commit-every', '2', '--resume', '--delete-missing')
+        with pytest.raises(CommandError):
+            load(books_csv, '--delete-missing')
+
+
+JSONL_ROWS = [
+    {'title': 'Book A', 'author_name': 'Solo Author', 'language': 'eng', 'num_pages': 120,
+     'description': '<p>Some <i>text</i></p>'},
+    {'title': 'Book B', 'authors': [{'id': '1', 'name': 'First'}, {'id': '2', 'name': 'Second'}], 'language': 'eng'},
+    {'title': 'Book C', 'author_name': 'Solo Author', 'work_id': 42},
+]
+
+
+def write_jsonl(path, rows, opener=open):
+    with opener(path, 'wt', encoding='utf-8') as file:
+        for row in rows:
+            file.write((row if isinstance(row, str) else json.dumps(row)) + '\n')
+    return str(path)
+
+
+def compress(path, opener, suffix):
+    with open(path, 'rb') as source, opener(path + suffix, 'wb') as target:
+        target.write(source.read())
+    return path + suffix
+
+
+@pytest.mark.django_db
+class TestLoadBooksInputFormats:
+
+    def assert_loaded(self):
+        book_a = Book.objects.get(title='Book A')
+        assert (book_a.num_pages, book_a.description) == (120, 'Some text')
+        assert list(Book.objects.get(title='Book B').authors.values_list('name', flat=True).order_by('name')) == \
+            ['First', 'Second']
+        assert Book.objects.get(title='Book C').authors.get().name == 'Solo Author'
+
+    @pytest.mark.parametrize('suffix, opener', [('.gz', gzip.open), ('.bz2', bz2.open)])
+    def test_compressed_csv(self, books_csv, suffix, opener):
+        out, _ = load(compress(books_csv, opener, suffix), '--bulk')
+        assert 'created:3, updated:0, errors:2' in out
+        self.assert_loaded()
+
+    @pytest.mark.parametrize('name, opener', [('books.jsonl', open), ('books.jsonl.gz', gzip.open)])
+    def test_jsonl(self, tmp_path, name, opener):
+        path = write_jsonl(tmp_path / name, JSONL_ROWS + ['{"title": "Broken', '[1, 2]', {'title': 'No Authors'}],
+                           opener=opener)
+        out, err = load(path, '--bulk', '--workers', '2')
+        assert 'created:3, updated:0, errors:3' in out
+        assert 'invalid JSON' in err and 'not a JSON object' in err
+        self.assert_loaded()
+        assert Book.objects.get(title='Book C').work_id == '42'
+
+    def test_same_hashes_for_csv_and_jsonl(self, tmp_path, books_csv):
+        load(books_csv, '--bulk')
+        out, _ = load(write_jsonl(tmp_path / 'books.jsonl', JSONL_ROWS[:1]), '--bulk')
+        assert 'unchanged:1' in out
+
+    def test_stdin(self, monkeypatch, tmp_path):
+        path = write_jsonl(tmp_path / 'books.jsonl', JSONL_ROWS)
+        with open(path, 'rb') as file:
+            monkeypatch.setattr('sys.stdin', io.TextIOWrapper(io.BytesIO(file.read())))
+        out, _ = load('-', '--bulk', '--format', 'jsonl')
+        assert 'created:3' in out
+        self.assert_loaded()
+
+    def test_resume_compressed(self, monkeypatch, tmp_path):
+        path = write_jsonl(tmp_path / 'books.jsonl.gz', [
+            {'title': f'Book {i}', 'author_name': 'Solo Author'} for i in range(6)
+        ], opener=gzip.open)
+        write_batch = BulkBookLoader.write_batch
+        calls = []
+
+        def failing_write_batch(self, batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return write_batch(self, batch)
+
+        monkeypatch.setattr(BulkBookLoader, 'write_batch', failing_write_batch)
+        with pytest.raises(RuntimeError):
+            load(path, '--bulk', '--commit-every', '3')
+        monkeypatch.setattr(BulkBookLoader, 'write_batch', write_batch)
+        out, _ = load(path, '--bulk', '--commit-every', '3', '--resume')
+        assert 'resumed after row 3' in out
+        assert Book.objects.count() == 6
+
+    def test_needs_bulk(self, tmp_path, books_csv):
+        with pytest.raises(CommandError):
+            load(compress(books_csv, gzip.open, '.gz'))
+        with pytest.raises(CommandError):
+            load('-', '--bulk', '--commit-every', '10')
+
+
+@pytest.mark.django_db
+class TestLoadBooksNaturalKey:
+
+    @pytest.mark.parametrize('mode', [(), ('--bulk',)])
+    def test_editions_are_upserted_by_natural_key(self, tmp_path, mode):
+        path = write_csv(tmp_path / 'editions.csv', [
+            book_row('Dune', author_name='Frank Herbert', work_id='1', publisher='Ace'),
+            book_row('Dune', author_name='Frank Herbert', work_id='1', publisher='Chilton'),
+            book_row('Dune', author_name='Frank Herbert', work_id='1', edition_information='Deluxe'),
+        ])
+        load(path, *mode)
+        assert Book.objects.filter(title='Dune').count() == 3
+
+        # a retitled edition updates its book
+        path = write_csv(tmp_path / 'retitled.csv', [
+            book_row('Dune (Ace)', author_name='Frank Herbert', work_id='1', publisher='Ace'),
+        ])
+        load(path, *mode)
+        assert Book.objects.count() == 3
+        assert Book.objects.get(publisher='Ace').title == 'Dune (Ace)'
+
+
+@pytest.mark.django_db
+class TestAuthorIdentity:
+
+    def test_load_resolves_name_variants(self, tmp_path):
+        Author.objects.create(name='Solo Author')
+        path = write_csv(tmp_path / 'variants.csv', [
+            book_row('Book A', author_name='solo  AUTHOR'),
+            book_row('Book B', authors="[{'name': 'SOLO author'}, {'name': 'Second'}, {'name': 'second'}]"),
+        ])
+        load(path, '--bulk')
+        load(path)
+        assert sorted(Author.objects.values_list('name', flat=True)) == ['Second', 'Solo Author']
+        assert Book.objects.get(title='Book B').authors.count() == 2
+
+    def test_merge_authors(self):
+        keep = Author.objects.create(name='Jane Doe')
+        duplicate = Author.objects.create(name='Bob')
+        both, only_duplicate = Book.objects.create(title='Both'), Book.objects.create(title='Only duplicate')
+        both.authors.set([keep, duplicate])
+        only_duplicate.authors.set([duplicate])
+        stale = Author.objects.create(name='Old Name')
+        # queryset.update() skips save(): the keys are outdated
+        Author.objects.filter(pk=duplicate.pk).update(name='jane  DOE')
+        Author.objects.filter(pk=stale.pk).update(name='New Name')
+
+        out = io.StringIO()
+        call_command('merge_authors', '--dry-run', stdout=out)
+        assert f'author {duplicate.pk} -> {keep.pk}' in out.getvalue()
+        assert Author.objects.count() == 3
+
+        CatalogChange.objects.all().delete()
+        call_command('merge_authors', stdout=out)
+        assert 'Merged 1 authors (2 books relinked), refreshed 1 name keys' in out.getvalue()
+        assert not Author.objects.filter(pk=duplicate.pk).exists()
+        assert list(both.authors.all()) == [keep]
+        assert list(only_duplicate.authors.all()) == [keep]
+        assert Author.objects.get(pk=stale.pk).name_key == 'new name'
+        assert set(CatalogChange.objects.values_list('model', 'object_id', 'action')) == {
+            (CatalogChange.BOOK, both.pk, CatalogChange.UPDATE),
+            (CatalogChange.BOOK, only_duplicate.pk, CatalogChange.UPDATE),
+            (CatalogChange.AUTHOR, duplicate.pk, CatalogChange.DELETE),
+        }
+
+
+@pytest.mark.django_db
+class TestLoadBooksInstrumentation:
+
+    def test_report_json(self, tmp_path, books_csv):
+        report_path = tmp_path / 'report.json'
+        out, _ = load(books_csv, '--bulk', '--batch-size', '2', '--report-json', str(report_path))
+        report = json.loads(report_path.read_text())
+        assert (report['rows'], report['created'], report['errors']) == (5, 3, 2)
+        assert report['error_counts'] == {'authors': 1, 'num_pages': 1}
+        assert set(report['stages']) == {'read', 'parse', 'write', 'authors', 'commit', 'delete'}
+        # the stages don't overlap
+        assert sum(report['stages'].values()) + report['other_seconds'] == pytest.approx(report['seconds'], abs=0.01)
+        assert report['stage_queries']['write'] > 0 and report['stage_queries']['authors'] > 0
+        assert sum(report['stage_queries'].values()) == report['queries']
+        assert report['queries_per_1k_rows'] == pytest.approx(report['queries'] * 200, abs=0.01)
+        assert report['rows_per_second'] > 0
+        assert report['peak_rss_bytes'] > 2**20
+        assert 'stages== read:' in out and 'per 1k rows' in out
+
+    def test_report_json_stdout(self, books_csv):
+        out, _ = load(books_csv, '--bulk', '--workers', '2', '--report-json', '-')
+        report = json.loads(out[out.index('{'):])
+        assert report['rows'] == 5
+        # time spent in the parser processes
+        assert report['parse_stages']['html'] > 0
+
+    def test_progress_every(self, books_csv):
+        out, _ = load(books_csv, '--bulk', '--progress-every', '2')
+        lines = [line for line in out.splitlines() if line.startswith('progress==')]
+        assert len(lines) == 2
+        assert lines[1].startswith('progress== rows:4 (')
+
+    def test_needs_bulk(self, books_csv):
+        with pytest.raises(CommandError):
+            load(books_csv, '--report-json', '-')
+
+    def test_parse_timings(self):
+        timings = dict.fromkeys(PARSE_STAGES, 0.0)
+        row = dict.fromkeys(CSV_COLUMNS, '') | book_row('Book A', author_name='Solo Author', description='<p>Text</p>')
+        [(_, _, error)] = parse_rows([row], timings)
+        assert error is None
+        assert all(seconds > 0 for seconds in timings.values())
+
+
+def run_worker(*args):
+    out, err = io.StringIO(), io.StringIO()
+    call_command('run_import_worker', '--once', *args, stdout=out, stderr=err)
+    return out.getvalue(), err.getvalue()
+
+
+@pytest.mark.django_db
+class TestImportWorker:
+
+    def test_runs_queued_jobs(self, books_csv):
+        job = ImportJob.objects.create(path=books_csv, file_name='books.csv')
+        out, _ = run_worker()
+        job.refresh_from_db()
+        assert job.status == ImportJob.DONE
+        assert (job.rows, job.created, job.errors, job.attempts) == (5, 3, 2, 1)
+        assert job.error_counts == {'authors': 1, 'num_pages': 1}
+        assert len(job.error_samples) == 2
+        assert job.rows_per_second > 0 and job.finished_at is not None
+        assert f'job {job.id} done== created:3' in out
+        # the upload is removed once loaded
+        assert not os.path.exists(books_csv)
+        assert Book.objects.count() == 3
+
+    def test_failed_job(self, tmp_path):
+        job = ImportJob.objects.create(path=str(tmp_path / 'gone.csv'), file_name='books.csv')
+        _, err = run_worker()
+        job.refresh_from_db()
+        assert job.status == ImportJob.FAILED
+        assert job.message.startswith('FileNotFoundError')
+        assert f'job {job.id} failed' in err
+
+    def test_stale_job_resumes(self, settings, books_csv):
+        settings.IMPORT_JOB_COMMIT_EVERY = 2
+
+        def die(loader):
+            raise KeyboardInterrupt
+
+        # a worker killed after its first chunk
+        with pytest.raises(KeyboardInterrupt):
+            load_books_bulk(books_csv, commit_every=2, progress=die)
+        job = ImportJob.objects.create(path=books_csv, file_name='books.csv', status=ImportJob.RUNNING, attempts=1)
+
+        # still running for all we know
+        run_worker()
+        assert ImportJob.objects.get(pk=job.pk).status == ImportJob.RUNNING
+
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        out, _ = run_worker()
+        job.refresh_from_db()
+        assert 'requeued 1 stale jobs' in out
+        assert (job.status, job.attempts, job.rows, job.created) == (ImportJob.DONE, 2, 5, 3)
+        assert Book.objects.count() == 3
+
+    def test_interrupted_job_is_queued_again(self, monkeypatch, books_csv):
+        def interrupt(job, workers=0):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr('library.management.commands.run_import_worker.run_job', interrupt)
+        job = ImportJob.objects.create(path=books_csv, file_name='books.csv')
+        out, _ = run_worker()
+        assert 'queued again' in out
+        assert ImportJob.objects.get(pk=job.pk).status == ImportJob.QUEUED
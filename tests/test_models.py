@@ -1,7 +1,12 @@
 import pytest
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, connections, transaction
+from django.db.utils import load_backend
 
 from library.models import Book, Author, Favorite
+from library.routers import FavoriteShardRouter
+from library.sharding import favorite_shard_for
 
 @pytest.mark.django_db
 class TestBookModel:
@@ -54,6 +59,13 @@ class TestBookModel:
         book, _, _ = self.create_book_with_authors()
         assert str(book) == "Book with Authors; Author One, Author Two"
 
+    def test_adding_author_touches_updated_at(self):
+        book = self.create_book()
+        before = book.updated_at
+        book.authors.add(Author.objects.create(name="Late Author"))
+        book.refresh_from_db()
+        assert book.updated_at > before
+
     def test_ordering_by_title(self):
         # Create multiple books with different titles
         Book.objects.create(title="C Book", language="EN")
@@ -65,6 +77,112 @@ class TestBookModel:
         titles = [book.title for book in books]
         assert titles == ["A Book", "B Book", "C Book"]
 
+@pytest.mark.django_db
+class TestAuthorNameKey:
+
+    def test_normalized_on_save(self):
+        author = Author.objects.create(name="  Ursula K.  LE Guin ")
+        assert author.name_key == "ursula k. le guin"
+        author.name = "ＵＲＳＵＬＡ K. Le Guin"
+        author.save(update_fields=["name"])
+        assert Author.objects.get(pk=author.pk).name_key == "ursula k. le guin"
+
+    def test_bulk_writes(self):
+        first, second = Author.objects.bulk_create([Author(name="Ada Palmer"), Author(name="Becky Chambers")])
+        second.name = "N. K. Jemisin"
+        Author.objects.bulk_update([second], ["name"])
+        assert dict(Author.objects.values_list("name", "name_key")) == {
+            "Ada Palmer": "ada palmer", "N. K. Jemisin": "n. k. jemisin"}
+
+    def test_unique(self):
+        Author.objects.create(name="Ann Leckie")
+        with pytest.raises(IntegrityError):
+            Author.objects.create(name="ann leckie")
+
+    def test_lookup_uses_the_index(self):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            sql, params = Author.objects.filter(name_key="x").query.sql_with_params()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        assert "USING INDEX" in plan
+
+
+def query_plan(queryset):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return " ".join(str(row[-1]) for row in cursor.fetchall())
+
+
+@pytest.mark.django_db
+class TestBookNaturalKey:
+
+    def test_set_on_save(self):
+        book = Book.objects.create(title="  The Dispossessed ")
+        assert book.natural_key == "title\tthe dispossessed"
+        book.work_id, book.edition_information, book.publisher = "42", "Reissue", "Harper"
+        book.save(update_fields=["work_id", "edition_information", "publisher"])
+        assert Book.objects.get(pk=book.pk).natural_key == "work\t42\treissue\tharper\t"
+
+    def test_editions_are_separate_books(self):
+        Book.objects.create(title="Dune", work_id="1", publisher="Ace")
+        Book.objects.create(title="Dune", work_id="1", publisher="Chilton")
+        Book.objects.bulk_create([Book(title="Dune", work_id="1", edition_information="Deluxe")])
+        assert Book.objects.filter(title="Dune").count() == 3
+
+    def test_unique(self):
+        Book.objects.create(title="Dune", work_id="1")
+        with pytest.raises(IntegrityError):
+            Book.objects.create(title="Dune (Ace)", work_id="1")
+
+    def test_backfilled_duplicate_keeps_its_key(self):
+        Book.objects.create(title="Dune")
+        duplicate = Book.objects.create(title="Dune (copy)")
+        # as left by migration 0017 for a book titled like an older one
+        Book.objects.filter(pk=duplicate.pk).update(title="Dune", natural_key=f"title\tdune\t#{duplicate.pk}")
+        duplicate.refresh_from_db()
+
+        duplicate.num_pages = 412
+        duplicate.save()
+        Book.objects.bulk_update([duplicate], ["title", "num_pages"])
+        assert Book.objects.get(pk=duplicate.pk).natural_key == f"title\tdune\t#{duplicate.pk}"
+
+        # a new identity drops the suffix
+        duplicate.title = "Dune Messiah"
+        duplicate.save()
+        assert Book.objects.get(pk=duplicate.pk).natural_key == "title\tdune messiah"
+
+    def test_deferred_fields_keep_the_key(self):
+        book = Book.objects.create(title="Dune", work_id="42", publisher="Ace")
+        key = book.natural_key
+
+        partial = Book.objects.only("id", "title").get(pk=book.pk)
+        partial.save()
+        assert Book.objects.get(pk=book.pk).natural_key == key
+
+        partial = Book.objects.only("id", "title").get(pk=book.pk)
+        Book.objects.bulk_update([partial], ["title"])
+        assert Book.objects.get(pk=book.pk).natural_key == key
+
+    @pytest.mark.parametrize("lookup, index", [
+        ({"natural_key": "x"}, "library_book_natural_key_uniq"),
+        ({"work_id": "1"}, "library_book_work_id_idx"),
+        ({"series_id": "1"}, "library_book_series_id_idx"),
+        ({"publisher": "Ace"}, "library_book_publisher_idx"),
+    ])
+    def test_lookups_use_an_index(self, lookup, index):
+        assert f"USING INDEX {index}" in query_plan(Book.objects.filter(**lookup))
+
+    def test_title_ordering_uses_the_index(self):
+        plan = query_plan(Book.objects.order_by("title")[:20])
+        assert "library_book_title_idx" in plan
+        assert "TEMP B-TREE" not in plan
+
+
 @pytest.mark.django_db
 class TestFavoriteModel:
     def test_create_favorite(self):
@@ -151,3 +269,91 @@ class TestFavoriteModel:
 
         # Assert the favorite is also deleted
         assert not Favorite.objects.filter(id=favorite.id).exists()
+
+
+class TestFavoriteSharding:
+    """
+    Routing only (no queries); the shard databases exist only with FAVORITE_SHARDS set.
+    """
+    @pytest.fixture(autouse=True)
+    def shards(self, settings):
+        settings.FAVORITE_SHARD_DATABASES = ["favorites_0", "favorites_1"]
+
+    def test_user_queries_use_the_users_shard(self):
+        assert Favorite.objects.filter(user=User(pk=3)).db == "favorites_1"
+        assert Favorite.objects.filter(user_id=4, book_id__in=[1, 2]).db == "favorites_0"
+        assert Favorite.objects.all().db == "default"
+        assert Favorite.objects.using("favorites_1").filter(user_id=4).db == "favorites_1"
+
+    def test_select_related_becomes_prefetch(self):
+        queryset = Favorite.objects.filter(user_id=1).select_related("book")
+        assert queryset.query.select_related is False
+        assert queryset._prefetch_related_lookups == ("book",)
+
+    def test_router(self):
+        router = FavoriteShardRouter()
+        favorite = Favorite(user_id=5, book_id=1)
+        assert router.db_for_write(Favorite, instance=favorite) == "favorites_1"
+        assert router.db_for_read(Book, instance=favorite) == "default"
+        assert router.db_for_read(Favorite, instance=User(pk=2)) == "favorites_0"
+        assert router.allow_migrate("favorites_0", "library", model_name="favorite")
+        assert not router.allow_migrate("favorites_0", "library", model_name="book")
+        assert router.allow_migrate("default", "library", model_name="favorite") is None
+
+    def test_unsharded(self, settings):
+        settings.FAVORITE_SHARD_DATABASES = []
+        assert favorite_shard_for(5) == "default"
+        assert Favorite.objects.filter(user_id=5).select_related("book").query.select_related == {"book": {}}
+
+
+def foreign_keys(alias, table):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {tuple(info["columns"]): info["foreign_key"] for info in constraints.values() if info["foreign_key"]}
+
+
+@pytest.mark.django_db
+class TestFavoriteShardDatabase:
+    """
+    Against a real second database, registered and migrated like a
+    FAVORITE_SHARDS=1 setup.
+    """
+    alias = "favorites_test"
+
+    @pytest.fixture
+    def shard(self, db, settings, tmp_path):
+        # a connection outside settings.DATABASES, which the test case would refuse
+        settings_dict = {**connections.settings["default"], "NAME": str(tmp_path / "shard.sqlite3")}
+        connections[self.alias] = load_backend(settings_dict["ENGINE"]).DatabaseWrapper(settings_dict, self.alias)
+        settings.FAVORITE_SHARD_DATABASES = [self.alias]
+        settings.DATABASE_ROUTERS = ["library.routers.FavoriteShardRouter"]
+        call_command("migrate", "library", database=self.alias, verbosity=0)
+        yield self.alias
+        connections[self.alias].close()
+        del connections[self.alias]
+
+    def test_unsharded_table_keeps_foreign_keys(self):
+        assert foreign_keys("default", "library_favorite") == {
+            ("user_id",): ("auth_user", "id"), ("book_id",): ("library_book", "id")}
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Favorite.objects.create(user_id=999, book_id=999)
+            connections["default"].check_constraints(table_names=["library_favorite"])
+
+    def test_favorites_are_stored_in_the_shard(self, shard, create_normal_user, create_test_books):
+        assert foreign_keys(shard, "library_favorite") == {}
+
+        Favorite.objects.create(user=create_normal_user, book=create_test_books[0])
+        assert Favorite.objects.using(shard).filter(user=create_normal_user).count() == 1
+        assert not Favorite.objects.using("default").exists()
+        favorite = Favorite.objects.filter(user=create_normal_user).select_related("book").get()
+        assert favorite.book.title == create_test_books[0].title
+        # the default database keeps its constraints
+        assert foreign_keys("default", "library_favorite")
+
+    def test_shard_constraints_migrate_both_ways(self, shard):
+        call_command("migrate", "library", "0011", database=shard, verbosity=0)
+        assert foreign_keys(shard, "library_favorite") == {
+            ("user_id",): ("auth_user", "id"), ("book_id",): ("library_book", "id")}
+        call_command("migrate", "library", database=shard, verbosity=0)
+        assert foreign_keys(shard, "library_favorite") == {}
@@ -1,9 +1,29 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, RequestFactory
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from django.urls import reverse
-from library.models import Book, Author, Favorite
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from library.authentication import user_cache
+from library.models import Book, Author, Favorite, CatalogChange, ImportJob, RevokedToken
+from library.revocation import BloomFilter, revocation_store
+from library.routers import PIN_COOKIE, ReplicaRouter, current_request, user_pin_key
+from library.query_budget import QueryBudgetExceeded, assert_query_budget, count_queries
+from library.views import BookViewSet, FavoriteViewSet
 
 
 @pytest.mark.django_db
@@ -292,6 +312,23 @@ class TestBookViewSet:
         assert response.status_code == 201
         assert response.data["title"] == "New Book"
 
+    def test_create_book_duplicate(self, authenticated_client_as_admin, create_test_books):
+        response = authenticated_client_as_admin.post("/books", data={"title": "book  1"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = authenticated_client_as_admin.patch(f"/books/{create_test_books[1].id}", data={"title": "Book 1"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "natural_key" not in authenticated_client_as_admin.get(f"/books/{create_test_books[0].id}").data
+
+    def test_update_backfilled_duplicate(self, authenticated_client_as_admin, create_test_books):
+        duplicate = create_test_books[1]
+        Book.objects.filter(pk=duplicate.pk).update(title="Book 1", natural_key=f"title\tbook 1\t#{duplicate.pk}")
+        response = authenticated_client_as_admin.patch(f"/books/{duplicate.id}", data={"num_pages": 10})
+        assert response.status_code == status.HTTP_200_OK
+        response = authenticated_client_as_admin.put(
+            "/books/bulk", [{"id": duplicate.id, "title": "Book 1", "num_pages": 11}], format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert Book.objects.get(pk=duplicate.pk).num_pages == 11
+
     def test_create_book_unauthenticated(self, api_client, create_test_author):
         """
         Test creating a book without authentication.
@@ -412,6 +449,23 @@ class TestAuthorViewSet:
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert not Author.objects.filter(id=author.id).exists()
 
+    def test_create_duplicate_name(self, authenticated_client_as_user, create_author):
+        author = create_author()
+        url = reverse('author-list')
+        response = authenticated_client_as_user.post(url, {"name": "  john   DOE "})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "name" in response.data
+        # renaming to a variant of its own name is fine
+        response = authenticated_client_as_user.patch(reverse('author-detail', args=[author.id]), {"name": "John DOE"})
+        assert response.status_code == status.HTTP_200_OK
+        assert "name_key" not in response.data
+
+    def test_lookup_by_name(self, api_client, create_author):
+        author = create_author()
+        create_author("Jane Roe")
+        response = api_client.get(reverse('author-list'), {"name": "JOHN doe"})
+        assert [item["id"] for item in response.data["results"]] == [author.id]
+
 
 @pytest.mark.django_db
 class TestFavoriteViewSet:
@@ -497,4 +551,833 @@ class TestFavoriteViewSet:
 
         response = authenticated_client_as_user.delete("/favorites/999")
         assert response.status_code == status.HTTP_404_NOT_FOUND
-        assert response.data["error"] == "Favorite book not found"
\ No newline at end of file
+        assert response.data["error"] == "Favorite book not found"
+
+@pytest.mark.django_db
+class TestQueryBudgets:
+    @pytest.fixture
+    def many_books(self, create_normal_user):
+        """Fixture to create 10 books with 2 authors each, all in the user's favorites."""
+        books = []
+        for i in range(10):
+            book = Book.objects.create(title=f"Budget Book {i}")
+            book.authors.add(Author.objects.create(name=f"Author {i}a"), Author.objects.create(name=f"Author {i}b"))
+            Favorite.objects.create(user=create_normal_user, book=book)
+            books.append(book)
+        return books
+
+    def test_list_books_within_budget(self, api_client, many_books):
+        with assert_query_budget(BookViewSet.query_budget["list"]):
+            response = api_client.get("/books")
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 10
+        assert len(response.data['results'][0]["authors"]) == 2
+
+    def test_retrieve_book_within_budget(self, api_client, many_books):
+        with assert_query_budget(BookViewSet.query_budget["retrieve"]):
+            response = api_client.get(f"/books/{many_books[0].id}")
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_list_favorites_within_budget(self, authenticated_client_as_user, many_books):
+        with assert_query_budget(FavoriteViewSet.query_budget["list"]):
+            response = authenticated_client_as_user.get("/favorites")
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data) == 10
+
+    def test_middleware_reports_query_count(self, api_client, many_books):
+        response = api_client.get("/books")
+        assert response["X-Query-Count"] == "4"
+
+    def test_budget_exceeded_raises(self, many_books):
+        with pytest.raises(QueryBudgetExceeded):
+            with assert_query_budget(1):
+                [book.authors.count() for book in Book.objects.all()]
+
+
+@pytest.mark.django_db
+class TestBookSparseFieldsets:
+
+    def test_fields_param_limits_output(self, api_client, create_test_books):
+        response = api_client.get("/books?fields=id,title")
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data['results'][0]) == {"id", "title"}
+
+    def test_omit_param_drops_fields(self, api_client, create_test_books):
+        response = api_client.get(f"/books/{create_test_books[0].id}?omit=description,authors")
+        assert response.status_code == status.HTTP_200_OK
+        assert "description" not in response.data
+        assert "authors" not in response.data
+        assert response.data["title"] == "Book 1"
+
+    def test_compact_list(self, api_client, create_test_books, create_test_author):
+        response = api_client.get("/books?compact=true")
+        assert response.status_code == status.HTTP_200_OK
+        book = response.data['results'][0]
+        assert "description" not in book
+        assert book["authors"] == [create_test_author.name]
+
+    def test_omitted_fields_are_deferred_in_orm(self, api_client, create_test_books):
+        with count_queries() as counter:
+            api_client.get("/books?omit=description,authors")
+        book_query = [sql for sql in counter.queries if 'FROM "library_book"' in sql][-1]
+        assert '"library_book"."description"' not in book_query
+        # etag aggregate + count + books; no authors prefetch when authors are not rendered
+        assert counter.count == 3
+
+    def test_fields_param_does_not_drop_written_fields(self, authenticated_client_as_admin, create_test_books):
+        book = create_test_books[0]
+        response = authenticated_client_as_admin.patch(f"/books/{book.id}?fields=id,title",
+                                                      data={"title": "Renamed", "description": "New text"})
+        assert response.status_code == status.HTTP_200_OK
+        assert set(response.data) == {"id", "title"}
+        book.refresh_from_db()
+        assert book.title == "Renamed"
+        assert book.description == "New text"
+
+
+@pytest.mark.django_db
+class TestConditionalRequests:
+
+    def test_list_returns_validators(self, api_client, create_test_books):
+        response = api_client.get("/books")
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"]
+        # the max updated_at doesn't see deletes
+        assert not response.has_header("Last-Modified")
+
+    def test_list_not_modified_since_ignored_after_delete(self, api_client, create_test_books):
+        book = create_test_books[0]
+        last_modified = api_client.get(f"/books/{book.id}")["Last-Modified"]
+        etag = api_client.get("/books")["ETag"]
+        create_test_books[1].delete()
+        response = api_client.get("/books", HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["count"] == 1
+        response = api_client.get("/books", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_list_if_none_match_returns_304(self, api_client, create_test_books):
+        etag = api_client.get("/books")["ETag"]
+        with assert_query_budget(1):
+            response = api_client.get("/books", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["ETag"] == etag
+
+    def test_list_etag_depends_on_query_params(self, api_client, create_test_books):
+        assert api_client.get("/books")["ETag"] != api_client.get("/books?search=Book 1")["ETag"]
+
+    def test_detail_if_modified_since_returns_304(self, api_client, create_test_books):
+        book = create_test_books[0]
+        last_modified = api_client.get(f"/books/{book.id}")["Last-Modified"]
+        response = api_client.get(f"/books/{book.id}", HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    @pytest.mark.parametrize("path", ["/books/abc", "/authors/abc", "/books/999"])
+    def test_detail_bad_or_missing_id_returns_404(self, api_client, path):
+        assert api_client.get(path).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_book_update_changes_etag(self, api_client, create_test_books):
+        book = create_test_books[0]
+        etag = api_client.get(f"/books/{book.id}")["ETag"]
+        book.title = "Changed"
+        book.save()
+        response = api_client.get(f"/books/{book.id}", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+    def test_author_rename_changes_book_etag(self, api_client, create_test_books, create_test_author):
+        etag = api_client.get("/books")["ETag"]
+        create_test_author.name = "Renamed Author"
+        create_test_author.save()
+        response = api_client.get("/books", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_missing_book_still_404(self, api_client):
+        response = api_client.get("/books/999")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCatalogResponseCache:
+
+    def test_second_anonymous_get_is_cache_hit(self, api_client, create_test_books):
+        first = api_client.get("/books")
+        assert first["X-Cache"] == "MISS"
+        with assert_query_budget(0):
+            second = api_client.get("/books")
+        assert second["X-Cache"] == "HIT"
+        assert second.data == first.data
+        assert second["ETag"] == first["ETag"]
+
+    def test_query_string_is_normalized(self, api_client, create_test_books):
+        api_client.get("/books?limit=1&offset=0")
+        assert api_client.get("/books?offset=0&limit=1")["X-Cache"] == "HIT"
+
+    def test_cached_conditional_request_returns_304(self, api_client, create_test_books):
+        book = create_test_books[0]
+        etag = api_client.get(f"/books/{book.id}")["ETag"]
+        response = api_client.get(f"/books/{book.id}", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response["X-Cache"] == "HIT"
+
+    def test_write_invalidates_cache(self, api_client, authenticated_client_as_admin, create_test_books):
+        book = create_test_books[0]
+        api_client.get(f"/books/{book.id}")
+        authenticated_client_as_admin.patch(f"/books/{book.id}", {"title": "New Title"})
+        response = api_client.get(f"/books/{book.id}")
+        assert response["X-Cache"] == "MISS"
+        assert response.data["title"] == "New Title"
+
+    def test_author_write_invalidates_cache(self, api_client, create_test_author):
+        api_client.get("/authors")
+        Author.objects.create(name="Another Author")
+        response = api_client.get("/authors")
+        assert response["X-Cache"] == "MISS"
+        assert response.data["count"] == 2
+
+    def test_cache_stats(self, api_client, authenticated_client_as_admin, create_test_books):
+        api_client.get("/books")
+        api_client.get("/books")
+        response = authenticated_client_as_admin.get("/api/cache/stats")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["hits"] == 1
+        assert response.data["misses"] == 1
+
+    def test_cache_stats_admin_only(self, authenticated_client_as_user):
+        response = authenticated_client_as_user.get("/api/cache/stats")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+@pytest.mark.django_db
+class TestBookExport:
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_export_ndjson(self, api_client, create_test_books, create_test_author):
+        response = api_client.get("/books/export")
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        assert [row["id"] for row in rows] == sorted(book.id for book in create_test_books)
+        assert rows[0]["authors"] == [create_test_author.name]
+
+    def test_export_csv(self, api_client, create_test_books):
+        response = api_client.get("/books/export?output=csv")
+        assert response["Content-Type"] == "text/csv"
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        assert len(rows) == 2
+        assert rows[0]["title"] == "Book 1"
+
+    def test_export_id_range(self, api_client, create_test_books):
+        book = create_test_books[1]
+        response = api_client.get(f"/books/export?min_id={book.id}&max_id={book.id}")
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        assert [row["id"] for row in rows] == [book.id]
+        assert response["X-Export-Min-Id"] == str(book.id)
+
+    def test_export_invalid_params(self, api_client):
+        assert api_client.get("/books/export?output=xml").status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get("/books/export?min_id=abc").status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBulkWrites:
+
+    def test_bulk_create_books(self, authenticated_client_as_admin, create_test_author):
+        payload = [
+            {"title": "Bulk 1", "authors": [create_test_author.name, "New Author"]},
+            {"title": "Bulk 2", "publisher": "Pub", "authors": ["New Author"]},
+            {"title": "Bulk 3"},
+        ]
+        response = authenticated_client_as_admin.post("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["created"] == 3
+        book = Book.objects.get(title="Bulk 1")
+        assert sorted(book.authors.values_list("name", flat=True)) == ["New Author", "Test Author"]
+        assert Author.objects.filter(name="New Author").count() == 1
+
+    def test_bulk_create_reports_item_errors(self, authenticated_client_as_admin):
+        payload = [{"title": "Valid"}, {"publisher": "No title"}]
+        response = authenticated_client_as_admin.post("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["errors"][0]["index"] == 1
+        assert "title" in response.data["errors"][0]["errors"]
+        assert not Book.objects.filter(title="Valid").exists()
+
+    def test_bulk_patch_books(self, authenticated_client_as_admin, create_test_books):
+        payload = [
+            {"id": create_test_books[0].id, "title": "Patched", "authors": ["Other Author"]},
+            {"id": create_test_books[1].id, "publisher": "New Publisher"},
+        ]
+        response = authenticated_client_as_admin.patch("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["updated"] == 2
+        first, second = Book.objects.get(id=create_test_books[0].id), Book.objects.get(id=create_test_books[1].id)
+        assert first.title == "Patched"
+        assert list(first.authors.values_list("name", flat=True)) == ["Other Author"]
+        assert second.publisher == "New Publisher"
+        assert second.title == "Book 2"
+
+    def test_bulk_update_unknown_id(self, authenticated_client_as_admin, create_test_books):
+        payload = [{"id": create_test_books[0].id, "title": "X"}, {"id": 999, "title": "Y"}]
+        response = authenticated_client_as_admin.patch("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["errors"] == [{"index": 1, "errors": {"id": ["Not found."]}}]
+        assert Book.objects.get(id=create_test_books[0].id).title == "Book 1"
+
+    def test_bulk_update_requires_id(self, authenticated_client_as_admin):
+        response = authenticated_client_as_admin.put("/books/bulk", [{"title": "No id"}], format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "id" in response.data["errors"][0]["errors"]
+
+    def test_bulk_delete_books(self, authenticated_client_as_admin, create_test_books):
+        ids = [book.id for book in create_test_books]
+        response = authenticated_client_as_admin.delete("/books/bulk", {"ids": ids}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["deleted"] == 2
+        assert not Book.objects.exists()
+
+    @pytest.mark.parametrize("ids", [[True], [1, "2"], "1,2"])
+    def test_bulk_delete_rejects_non_integer_ids(self, authenticated_client_as_admin, create_test_books, ids):
+        response = authenticated_client_as_admin.delete("/books/bulk", {"ids": ids}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Book.objects.count() == 2
+
+    def test_bulk_authors(self, authenticated_client_as_user):
+        response = authenticated_client_as_user.post("/authors/bulk", [{"name": "A"}, {"name": "B"}], format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        first_id = response.data["ids"][0]
+        response = authenticated_client_as_user.put("/authors/bulk", [{"id": first_id, "name": "A2"}], format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert Author.objects.get(id=first_id).name == "A2"
+
+    def test_bulk_authors_duplicate_names(self, authenticated_client_as_user, create_test_author):
+        response = authenticated_client_as_user.post(
+            "/authors/bulk", [{"name": "Fresh"}, {"name": "test author"}, {"name": "FRESH"}], format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error["index"] for error in response.data["errors"]] == [1, 2]
+        assert not Author.objects.filter(name="Fresh").exists()
+
+    def test_bulk_books_resolve_author_variants(self, authenticated_client_as_admin, create_test_author):
+        payload = [{"title": "Variants", "authors": ["TEST  author", "New Author", "new author"]}]
+        response = authenticated_client_as_admin.post("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        book = Book.objects.get(title="Variants")
+        assert sorted(book.authors.values_list("id", flat=True)) == sorted(
+            [create_test_author.id, Author.objects.get(name_key="new author").id])
+
+    def test_bulk_books_duplicate_keys(self, authenticated_client_as_admin, create_test_books):
+        payload = [{"title": "Fresh"}, {"title": "Book 1"}, {"title": "FRESH"}, {"title": "Fresh", "work_id": "7"}]
+        response = authenticated_client_as_admin.post("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error["index"] for error in response.data["errors"]] == [1, 2]
+        # renaming a book onto another one, or keeping its own title
+        first, second = create_test_books
+        payload = [{"id": first.id, "title": "Book 1"}, {"id": second.id, "title": "Book 1"}]
+        response = authenticated_client_as_admin.put("/books/bulk", payload, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error["index"] for error in response.data["errors"]] == [1]
+
+    def test_bulk_unauthenticated(self, api_client):
+        response = api_client.post("/books/bulk", [{"title": "X"}], format="json")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_bulk_write_invalidates_cache(self, api_client, authenticated_client_as_admin, create_test_books):
+        api_client.get("/books")
+        authenticated_client_as_admin.post("/books/bulk", [{"title": "Fresh"}], format="json")
+        response = api_client.get("/books")
+        assert response["X-Cache"] == "MISS"
+        assert response.data["count"] == 3
+
+
+@pytest.mark.django_db
+class TestBookBatchGet:
+
+    def test_get_by_ids_preserves_order(self, api_client, create_test_books):
+        first, second = create_test_books
+        response = api_client.get(f"/books?ids={second.id},{first.id},999")
+        assert response.status_code == status.HTTP_200_OK
+        assert [book["id"] for book in response.data["results"]] == [second.id, first.id]
+        assert response.data["missing"] == [999]
+
+    def test_get_by_ids_single_query(self, api_client, create_test_books):
+        ids = ",".join(str(book.id) for book in create_test_books)
+        # etag aggregate + books + authors
+        with assert_query_budget(3):
+            response = api_client.get(f"/books?ids={ids}")
+        assert response.data["count"] == 2
+
+    def test_filter_by_author(self, api_client, create_test_books, create_test_author):
+        other = Author.objects.create(name="Other Author")
+        create_test_books[1].authors.set([other])
+        response = api_client.get("/books", {"author": "other AUTHOR"})
+        assert [book["id"] for book in response.data["results"]] == [create_test_books[1].id]
+
+    def test_get_by_ids_invalid(self, api_client):
+        response = api_client.get("/books?ids=1,abc")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_post_batch(self, api_client, create_test_books):
+        ids = [book.id for book in reversed(create_test_books)]
+        with assert_query_budget(BookViewSet.query_budget["batch"]):
+            response = api_client.post("/books/batch?fields=id,title", {"ids": ids}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == [{"id": ids[0], "title": "Book 2"}, {"id": ids[1], "title": "Book 1"}]
+
+    def test_post_batch_invalid_body(self, api_client):
+        response = api_client.post("/books/batch", {"ids": "1,2"}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_post_batch_rejects_boolean_ids(self, api_client, create_test_books):
+        response = api_client.post("/books/batch", {"ids": [True]}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCatalogChangeFeed:
+
+    def test_changes_since_token(self, api_client, create_test_books):
+        token = api_client.get("/books/changes").data["next_token"]
+        book = create_test_books[0]
+        book.title = "Synced Title"
+        book.save()
+        deleted_id = create_test_books[1].id
+        create_test_books[1].delete()
+
+        response = api_client.get(f"/books/changes?since={token}")
+        assert response.status_code == status.HTTP_200_OK
+        changes = response.data["changes"]
+        assert changes[0] == {"model": "book", "id": book.id, "action": "upsert",
+                              "data": api_client.get(f"/books/{book.id}").data}
+        assert changes[1] == {"model": "book", "id": deleted_id, "action": "delete"}
+        assert response.data["has_more"] is False
+
+        # nothing new after the returned token
+        response = api_client.get(f"/books/changes?since={response.data['next_token']}")
+        assert response.data["changes"] == []
+
+    def test_changes_collapse_per_object(self, api_client):
+        author = Author.objects.create(name="Feed Author")
+        author.name = "Feed Author 2"
+        author.save()
+        response = api_client.get("/books/changes?since=0")
+        assert response.data["changes"] == [
+            {"model": "author", "id": author.id, "action": "upsert", "data": {
+                "id": author.id, "name": "Feed Author 2", "updated_at": response.data["changes"][0]["data"]["updated_at"]}},
+        ]
+
+    def test_changes_paging(self, api_client, create_test_books):
+        response = api_client.get("/books/changes?since=0&limit=1")
+        assert len(response.data["changes"]) == 1
+        assert response.data["has_more"] is True
+
+    def test_bulk_writes_are_logged(self, authenticated_client_as_admin, api_client):
+        ids = authenticated_client_as_admin.post("/books/bulk", [{"title": "Logged"}], format="json").data["ids"]
+        changes = api_client.get("/books/changes?since=0").data["changes"]
+        assert {"model": "book", "id": ids[0]} in [{"model": c["model"], "id": c["id"]} for c in changes]
+
+    @pytest.mark.parametrize("write", ["rename", "delete", "bulk_update"])
+    def test_author_writes_log_their_books(self, api_client, authenticated_client_as_admin, create_test_books,
+                                           create_test_author, write):
+        token = api_client.get("/books/changes").data["next_token"]
+        if write == "rename":
+            create_test_author.name = "Renamed Author"
+            create_test_author.save()
+        elif write == "delete":
+            create_test_author.delete()
+        else:
+            authenticated_client_as_admin.put(
+                "/authors/bulk", [{"id": create_test_author.id, "name": "Bulk Renamed"}], format="json")
+
+        changes = api_client.get(f"/books/changes?since={token}").data["changes"]
+        books = {change["id"]: change for change in changes if change["model"] == "book"}
+        assert set(books) == {book.id for book in create_test_books}
+        expected_authors = [] if write == "delete" else [create_test_author.id]
+        assert all([author["id"] for author in change["data"]["authors"]] == expected_authors
+                   for change in books.values())
+
+    def test_safety_lag_holds_back_recent_changes(self, api_client, settings, create_test_books):
+        settings.CHANGES_SAFETY_LAG_SECONDS = 60
+        response = api_client.get("/books/changes?since=0")
+        assert response.data["changes"] == []
+        assert response.data["next_token"] == "0"
+
+        CatalogChange.objects.update(created_at=timezone.now() - timedelta(minutes=2))
+        assert len(api_client.get("/books/changes?since=0").data["changes"]) == 3
+
+    def test_export_returns_change_token(self, api_client, create_test_books):
+        response = api_client.get("/books/export")
+        assert response["X-Change-Token"] == str(CatalogChange.objects.latest("id").id)
+
+    def test_invalid_token(self, api_client):
+        assert api_client.get("/books/changes?since=abc").status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get("/books/changes?since=-1").status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestFavoriteBatch:
+    @pytest.fixture
+    def books(self, create_test_author):
+        books = [Book.objects.create(title=f"Batch Book {i}", description=f"About {i}") for i in range(25)]
+        for book in books:
+            book.authors.add(create_test_author)
+        return books
+
+    def test_batch_add(self, authenticated_client_as_user, create_normal_user, books, monkeypatch):
+        calls = []
+        monkeypatch.setattr("library.views.recommend_books", lambda user: calls.append(user) or [])
+        ids = [book.id for book in books[:5]]
+        response = authenticated_client_as_user.post("/favorites/batch", {"add": ids}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["added"] == ids
+        assert Favorite.objects.filter(user=create_normal_user).count() == 5
+        assert len(calls) == 1
+
+    def test_batch_add_and_remove(self, authenticated_client_as_user, create_normal_user, books):
+        Favorite.objects.create(user=create_normal_user, book=books[0])
+        payload = {"add": [books[0].id, books[1].id], "remove": [books[2].id, books[0].id]}
+        response = authenticated_client_as_user.post("/favorites/batch", payload, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["removed"] == [books[0].id]
+        assert response.data["added"] == [books[0].id, books[1].id]
+        assert "recommendations" in response.data
+
+    def test_batch_limit(self, authenticated_client_as_user, create_normal_user, books):
+        for book in books[:15]:
+            Favorite.objects.create(user=create_normal_user, book=book)
+        payload = {"add": [book.id for book in books[15:21]]}
+        response = authenticated_client_as_user.post("/favorites/batch", payload, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["error"] == "Cannot add more than 20 favorites"
+        # nothing was added
+        assert Favorite.objects.filter(user=create_normal_user).count() == 15
+
+    def test_batch_missing_books(self, authenticated_client_as_user, books):
+        response = authenticated_client_as_user.post("/favorites/batch", {"add": [books[0].id, 999]}, format="json")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data["missing"] == [999]
+
+    def test_batch_invalid_body(self, authenticated_client_as_user):
+        response = authenticated_client_as_user.post("/favorites/batch", {"add": "1,2"}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize("body", [[1, 2], "add", {"add": [True]}, {"remove": ["1"]}])
+    def test_batch_non_object_body(self, authenticated_client_as_user, create_normal_user, body):
+        response = authenticated_client_as_user.post("/favorites/batch", body, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Favorite.objects.filter(user=create_normal_user).exists()
+
+    def test_existing_favorite_at_limit_is_not_an_error(self, authenticated_client_as_user, create_normal_user, books):
+        for book in books[:20]:
+            Favorite.objects.create(user=create_normal_user, book=book)
+        response = authenticated_client_as_user.post("/favorites", {"book_id": books[0].id})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["message"] == "Book already in favorites"
+
+
+@pytest.mark.django_db
+@pytest.mark.urls("project.urls_async")
+class TestAsyncReadViews:
+
+    def get(self, path, **headers):
+        return async_to_sync(AsyncClient().get)(path, headers=headers)
+
+    def test_list_books(self, create_test_books):
+        response = self.get("/books")
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["count"] == 2
+        assert data["results"][0]["authors"][0]["name"] == "Test Author"
+        assert response["ETag"]
+
+    def test_list_matches_sync_view(self, api_client, create_test_books):
+        async_data = self.get("/books?search=Book 1&omit=description").json()
+        caches["catalog"].clear()
+        sync_data = json.loads(api_client.get("/books?search=Book 1&omit=description", format="json").content)
+        assert async_data == sync_data
+
+    def test_retrieve_book_and_304(self, create_test_books):
+        book = create_test_books[0]
+        response = self.get(f"/books/{book.id}")
+        assert response.json()["title"] == book.title
+        caches["catalog"].clear()
+        response = self.get(f"/books/{book.id}", **{"If-None-Match": response["ETag"]})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_retrieve_missing(self):
+        assert self.get("/books/999").status_code == status.HTTP_404_NOT_FOUND
+
+    def test_authors(self, create_test_author):
+        assert self.get("/authors").json()["count"] == 1
+        assert self.get(f"/authors/{create_test_author.id}").json()["name"] == create_test_author.name
+
+    def test_writes_are_delegated(self, authenticated_client_as_admin):
+        response = authenticated_client_as_admin.post("/authors", {"name": "Via Sync"})
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_favorites(self, authenticated_client_as_user, create_normal_user, create_test_books):
+        Favorite.objects.create(user=create_normal_user, book=create_test_books[0])
+        token = authenticated_client_as_user._credentials["HTTP_AUTHORIZATION"]
+        response = self.get("/favorites", Authorization=token)
+        assert response.status_code == status.HTTP_200_OK
+        assert [book["title"] for book in response.json()] == ["Book 1"]
+
+    def test_favorites_unauthenticated(self):
+        assert self.get("/favorites").status_code == status.HTTP_401_UNAUTHORIZED
+
+    # the recommender runs on its own thread/connection, so the data must be committed
+    @pytest.mark.django_db(transaction=True)
+    def test_recommendations(self, authenticated_client_as_user, create_normal_user, create_test_books):
+        Favorite.objects.create(user=create_normal_user, book=create_test_books[0])
+        token = authenticated_client_as_user._credentials["HTTP_AUTHORIZATION"]
+        response = self.get("/favorites/recommendations?top_n=1", Authorization=token)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()["recommendations"]) == 1
+
+
+@pytest.mark.django_db
+class TestCachedJWTAuthentication:
+
+    def count_favorites_queries(self, client):
+        with count_queries() as counter:
+            response = client.get("/favorites")
+        assert response.status_code == status.HTTP_200_OK
+        return counter.count
+
+    def test_user_lookup_is_cached(self, authenticated_client_as_user):
+        first = self.count_favorites_queries(authenticated_client_as_user)
+        assert self.count_favorites_queries(authenticated_client_as_user) == first - 1
+
+    def test_cache_disabled(self, settings, authenticated_client_as_user):
+        settings.JWT_USER_CACHE_TIMEOUT = 0
+        first = self.count_favorites_queries(authenticated_client_as_user)
+        assert self.count_favorites_queries(authenticated_client_as_user) == first
+
+    def test_deactivated_user_is_rejected(self, authenticated_client_as_user, create_normal_user):
+        self.count_favorites_queries(authenticated_client_as_user)
+        create_normal_user.is_active = False
+        create_normal_user.save()
+        response = authenticated_client_as_user.get("/favorites")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_deleted_user_is_rejected(self, authenticated_client_as_user, create_normal_user):
+        self.count_favorites_queries(authenticated_client_as_user)
+        create_normal_user.delete()
+        response = authenticated_client_as_user.get("/favorites")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_cached_user_is_not_shared(self, authenticated_client_as_user, create_normal_user):
+        self.count_favorites_queries(authenticated_client_as_user)
+        first = user_cache.get(create_normal_user.pk)
+        second = user_cache.get(create_normal_user.pk)
+        assert first.pk == second.pk == create_normal_user.pk
+        assert first is not second
+        assert first.username == "testuser"
+
+
+@pytest.mark.django_db
+class TestTokenRefreshRevocation:
+
+    def login(self, api_client):
+        response = api_client.post('/api/login', {"username": "testuser", "password": "StrongPassword123!"})
+        return response.data["refresh"]
+
+    def test_refresh_rotates_and_revokes(self, api_client, create_user):
+        refresh = self.login(api_client)
+        response = api_client.post('/api/token/refresh', {"refresh": refresh})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["access"]
+        assert response.data["refresh"] != refresh
+        assert RevokedToken.objects.count() == 1
+
+        # the rotated token can't be used again, the new one can
+        response_reused = api_client.post('/api/token/refresh', {"refresh": refresh})
+        assert response_reused.status_code == status.HTTP_401_UNAUTHORIZED
+        response = api_client.post('/api/token/refresh', {"refresh": response.data["refresh"]})
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_token_revoked_elsewhere_is_rejected(self, api_client, create_user):
+        refresh = self.login(api_client)
+        revocation_store.sync()
+        # revoked by another process, not yet synced into this process' filter
+        RevokedToken.objects.create(jti=RefreshToken(refresh)["jti"], expires_at=timezone.now() + timedelta(days=1))
+        response = api_client.post('/api/token/refresh', {"refresh": refresh})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_check_of_unrevoked_token_skips_db(self, create_user):
+        revocation_store.revoke("used", timezone.now() + timedelta(days=1))
+        revocation_store.sync()
+        with assert_query_budget(0):
+            assert not revocation_store.is_revoked("fresh")
+        assert revocation_store.is_revoked("used")
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"jti-{i}")
+        assert all(f"jti-{i}" in bloom for i in range(1000))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+    def test_purge_expired(self, create_user):
+        RevokedToken.objects.create(jti="expired", expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti="live", expires_at=timezone.now() + timedelta(days=1))
+        out = io.StringIO()
+        call_command("purge_revoked_tokens", stdout=out)
+        assert "Purged 1" in out.getvalue()
+        assert list(RevokedToken.objects.values_list("jti", flat=True)) == ["live"]
+
+
+@pytest.mark.django_db
+class TestReplicaRouting:
+    """
+    Routing decisions with a (fake) replica alias configured; see library.routers.
+    """
+    @pytest.fixture(autouse=True)
+    def replicas(self, settings):
+        settings.DATABASE_REPLICAS = ["replica1"]
+        settings.REPLICA_LAG_SECONDS = 5
+
+    def route(self, request, model=Book, **hints):
+        token = current_request.set(request)
+        try:
+            return ReplicaRouter().db_for_read(model, **hints)
+        finally:
+            current_request.reset(token)
+
+    def anonymous_get(self):
+        request = RequestFactory().get("/books")
+        request.user = AnonymousUser()
+        return request
+
+    def test_catalog_reads_go_to_replica(self):
+        assert self.route(self.anonymous_get()) == "replica1"
+        assert self.route(self.anonymous_get(), model=Author) == "replica1"
+
+    def test_other_reads_stay_on_primary(self):
+        assert self.route(self.anonymous_get(), model=Favorite) is None
+        assert self.route(self.anonymous_get(), model=User) is None
+        assert self.route(RequestFactory().post("/books")) is None
+        assert ReplicaRouter().db_for_read(Book) is None
+
+    def test_pinned_after_own_write(self, create_normal_user):
+        request = RequestFactory().get("/books")
+        request.COOKIES[PIN_COOKIE] = "1"
+        request.user = AnonymousUser()
+        assert self.route(request) is None
+
+        request = RequestFactory().get("/books")
+        request.user = create_normal_user
+        caches["catalog"].set(user_pin_key(create_normal_user.pk), 1)
+        assert self.route(request) is None
+
+    def test_pinned_after_any_catalog_write(self):
+        Author.objects.create(name="Fresh")
+        assert self.route(self.anonymous_get()) is None
+
+    def test_middleware_pins_writer(self, settings, authenticated_client_as_admin, create_superuser):
+        settings.MIDDLEWARE = settings.MIDDLEWARE + ["library.middleware.ReplicaRoutingMiddleware"]
+        # new client: the fixture's client loaded its middleware when logging in
+        client = APIClient()
+        client.credentials(**authenticated_client_as_admin._credentials)
+        response = client.post("/authors", {"name": "Pinned"})
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.cookies[PIN_COOKIE]["max-age"] == 5
+        assert caches["catalog"].get(user_pin_key(create_superuser.pk)) == 1
+
+    def test_one_replica_per_request(self, settings):
+        settings.DATABASE_REPLICAS = ["replica1", "replica2", "replica3"]
+        request = self.anonymous_get()
+        routes = {self.route(request, model=model) for model in (Book, Author) * 10}
+        assert len(routes) == 1
+
+    def test_middleware_pins_only_catalog_writes(self, settings, create_test_books, create_normal_user):
+        settings.MIDDLEWARE = settings.MIDDLEWARE + ["library.middleware.ReplicaRoutingMiddleware"]
+        client = APIClient()
+        response = client.post("/api/login", {"username": "testuser", "password": "UserPassword123!"})
+        assert response.status_code == status.HTTP_200_OK
+        assert PIN_COOKIE not in response.cookies
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        response = client.post("/books/batch", {"ids": [book.id for book in create_test_books]}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        assert PIN_COOKIE not in response.cookies
+        assert caches["catalog"].get(user_pin_key(create_normal_user.pk)) is None
+
+
+class TestSqliteProductionProfile:
+
+    def test_pragmas_applied_on_connect(self, settings, tmp_path, django_db_blocker):
+        database = {
+            **connections["default"].settings_dict,
+            **settings.SQLITE_PRODUCTION_PROFILE,
+            "NAME": str(tmp_path / "prod.sqlite3"),
+        }
+        connection = DatabaseWrapper(database, alias="profile_test")
+        try:
+            with django_db_blocker.unblock(), connection.cursor() as cursor:
+                pragmas = {}
+                for pragma in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    pragmas[pragma] = cursor.fetchone()[0]
+            assert pragmas == {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000, "mmap_size": 268435456}
+            assert connection.transaction_mode == "IMMEDIATE"
+        finally:
+            connection.close()
+
+
+@pytest.mark.django_db
+class TestImportJobs:
+
+    @pytest.fixture(autouse=True)
+    def upload_dir(self, settings, tmp_path):
+        settings.IMPORT_UPLOAD_DIR = str(tmp_path / "imports")
+        return tmp_path / "imports"
+
+    def test_upload_queues_a_job(self, authenticated_client_as_admin, upload_dir):
+        content = b"title,authors\nDune,\n"
+        response = authenticated_client_as_admin.post(
+            "/imports", {"file": SimpleUploadedFile("books.jsonl.gz", content)}, format="multipart")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data["status"] == "queued"
+        assert response.data["file_name"] == "books.jsonl.gz"
+        assert response.data["size"] == len(content)
+        assert "path" not in response.data
+
+        job = ImportJob.objects.get(pk=response.data["id"])
+        assert job.path.startswith(str(upload_dir)) and job.path.endswith(".jsonl.gz")
+        with open(job.path, "rb") as file:
+            assert file.read() == content
+        # nothing was loaded by the web worker
+        assert not Book.objects.exists()
+
+    def test_upload_format(self, authenticated_client_as_admin):
+        response = authenticated_client_as_admin.post(
+            "/imports", {"file": SimpleUploadedFile("export.txt", b"{}\n"), "format": "jsonl"}, format="multipart")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert ImportJob.objects.get().path.endswith(".jsonl")
+
+        response = authenticated_client_as_admin.post(
+            "/imports", {"file": SimpleUploadedFile("export.txt", b"{}\n"), "format": "xml"}, format="multipart")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_status(self, authenticated_client_as_admin):
+        job = ImportJob.objects.create(path="/tmp/x.csv", file_name="x.csv", status=ImportJob.RUNNING, rows=2000,
+                                       errors=3, error_counts={"authors": 3}, rows_per_second=1500.5)
+        response = authenticated_client_as_admin.get(f"/imports/{job.id}")
+        assert response.status_code == status.HTTP_200_OK
+        assert (response.data["status"], response.data["rows"], response.data["rows_per_second"],
+                response.data["errors"], response.data["error_counts"]) == ("running", 2000, 1500.5, 3, {"authors": 3})
+        assert authenticated_client_as_admin.get("/imports").data["results"][0]["id"] == job.id
+
+    def test_unauthenticated(self, api_client):
+        upload = {"file": SimpleUploadedFile("books.csv", b"title\n")}
+        assert api_client.post("/imports", upload, format="multipart").status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_admin_only(self, authenticated_client_as_user):
+        upload = {"file": SimpleUploadedFile("books.csv", b"title\n")}
+        response = authenticated_client_as_user.post("/imports", upload, format="multipart")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert authenticated_client_as_user.get("/imports").status_code == status.HTTP_403_FORBIDDEN
+        assert not ImportJob.objects.exists()